@@ -0,0 +1,221 @@
+# analytics.py
+
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import backend
+import queries
+
+# Weekly and monthly training time series per user: workouts, minutes and
+# volume per period, and the estimated 1RM trend of every exercise.
+#
+# Per-period aggregation runs in SQL (queries.TRAINING_PERIODS and TOP_SETS,
+# which picks each period's top set with a window function). The result is
+# cached per (user, granularity), one row per period. When workouts change,
+# backend.invalidate_workouts() reports their dates, and only the periods
+# holding those dates are recomputed on the next read. Figures that span
+# periods (rolling averages, changes, running bests, trend slopes) would be
+# invalidated by a change to any period, so they are derived from the cached
+# periods with vectorized pandas operations on every read.
+
+# granularity -> pandas frequency of its period starts (date_trunc semantics)
+GRANULARITIES = {"week": "W-MON", "month": "MS"}
+
+# Average period length in days, for trend slopes per period.
+PERIOD_DAYS = {"week": 7.0, "month": 30.4375}
+
+ROLLING_PERIODS = 4
+
+def period_start(d, granularity):
+    """The first day of the week (Monday) or month containing date `d`."""
+    if granularity == "week":
+        return d - datetime.timedelta(days=d.weekday())
+    return d.replace(day=1)
+
+def _period_end(start, granularity):
+    if granularity == "week":
+        return start + datetime.timedelta(days=7)
+    return (start + datetime.timedelta(days=32)).replace(day=1)
+
+class _Entry:
+    __slots__ = ("lock", "totals", "top_sets", "dirty", "expires_at")
+
+    def __init__(self, expires_at):
+        self.lock = threading.Lock()
+        self.totals = None
+        self.top_sets = None
+        self.dirty = None   # period starts to recompute; None means everything
+        self.expires_at = expires_at
+
+class PeriodCache:
+    """Per-(user, granularity) period aggregates that track which periods are stale."""
+
+    def __init__(self, maxsize=256, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl      # bounds staleness from writers in other processes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (user_id, granularity) -> _Entry
+        self.stats = {"full_loads": 0, "partial_loads": 0, "hits": 0, "periods_recomputed": 0}
+
+    def get(self, user_id, granularity, fetch):
+        """Returns (totals, top_sets), calling fetch(user_id, granularity, periods) for stale periods."""
+        key = (user_id, granularity)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= now:
+                entry = self._entries[key] = _Entry(now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        # One reader per entry recomputes; the others wait for it.
+        with entry.lock:
+            with self._lock:
+                dirty, entry.dirty = entry.dirty, set()
+            try:
+                if dirty is None:
+                    entry.totals, entry.top_sets = fetch(user_id, granularity, None)
+                    self.stats["full_loads"] += 1
+                elif dirty:
+                    periods = sorted(dirty)
+                    totals, top_sets = fetch(user_id, granularity, periods)
+                    stale = pd.to_datetime(periods)
+                    entry.totals = _replace_periods(entry.totals, totals, stale)
+                    entry.top_sets = _replace_periods(entry.top_sets, top_sets, stale)
+                    self.stats["partial_loads"] += 1
+                    self.stats["periods_recomputed"] += len(periods)
+                else:
+                    self.stats["hits"] += 1
+            except BaseException:
+                with self._lock:
+                    entry.dirty = None
+                raise
+            return entry.totals, entry.top_sets
+
+    def mark_dirty(self, user_id, dates):
+        """Marks the periods holding `dates` (None: all periods) of a user (None: every user) as stale."""
+        with self._lock:
+            if user_id is None:
+                for entry in self._entries.values():
+                    entry.dirty = None
+                return
+            for granularity in GRANULARITIES:
+                entry = self._entries.get((user_id, granularity))
+                if entry is None or entry.dirty is None:
+                    continue
+                if dates is None:
+                    entry.dirty = None
+                else:
+                    entry.dirty.update(period_start(d, granularity) for d in dates)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def _replace_periods(frame, fresh, stale):
+    kept = frame[~frame["period_start"].isin(stale)]
+    return pd.concat([kept, fresh], ignore_index=True).sort_values("period_start", ignore_index=True)
+
+def _fetch_periods(user_id, granularity, periods):
+    """Runs TRAINING_PERIODS and TOP_SETS for all periods, or just `periods`."""
+    params = {
+        "user_id": user_id,
+        "granularity": granularity,
+        "periods": periods,
+        "first_period": periods[0] if periods else None,
+        "end_date": _period_end(periods[-1], granularity) if periods else None,
+    }
+    with backend.transaction() as cur:
+        cur.execute(queries.TRAINING_PERIODS, params)
+        totals = cur.fetchall()
+        cur.execute(queries.TOP_SETS, params)
+        top_sets = cur.fetchall()
+
+    totals = pd.DataFrame(totals, columns=["period_start", "workouts", "minutes", "volume_kg"])
+    totals["period_start"] = pd.to_datetime(totals["period_start"])
+    totals = totals.astype({"workouts": "int64", "minutes": "int64", "volume_kg": "float64"})
+    top_sets = pd.DataFrame(top_sets, columns=["period_start", "exercise_name", "weight_kg", "reps", "e1rm_kg"])
+    top_sets["period_start"] = pd.to_datetime(top_sets["period_start"])
+    top_sets = top_sets.astype({"weight_kg": "float64", "reps": "int64", "e1rm_kg": "float64"})
+    return totals.sort_values("period_start", ignore_index=True), top_sets
+
+# Process-wide cache, kept current by the backend's workout change callbacks.
+default_cache = PeriodCache()
+backend.on_workouts_changed(default_cache.mark_dirty)
+
+def _check_granularity(granularity):
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {sorted(GRANULARITIES)}")
+
+def training_series(user_id, granularity="week", fill_gaps=True):
+    """Returns one row per period (indexed by its first day) from the first workout to the last.
+
+    Columns: workouts, minutes, volume_kg, minutes_per_workout, volume_rolling
+    (mean over the last ROLLING_PERIODS periods) and volume_change_pct (vs the
+    previous period). With `fill_gaps`, periods without workouts appear as zeros.
+    """
+    _check_granularity(granularity)
+    totals, _ = default_cache.get(user_id, granularity, _fetch_periods)
+    df = totals.set_index("period_start")
+    if fill_gaps and len(df):
+        periods = pd.date_range(df.index.min(), df.index.max(), freq=GRANULARITIES[granularity])
+        df = df.reindex(periods, fill_value=0)
+        df.index.name = "period_start"
+    workouts = df["workouts"].to_numpy()
+    df["minutes_per_workout"] = np.divide(
+        df["minutes"].to_numpy(), workouts, out=np.zeros(len(df)), where=workouts > 0
+    ).round(1)
+    df["volume_rolling"] = df["volume_kg"].rolling(ROLLING_PERIODS, min_periods=1).mean().round(1)
+    previous = df["volume_kg"].shift()
+    df["volume_change_pct"] = ((df["volume_kg"] - previous) / previous.where(previous > 0) * 100).round(1)
+    return df
+
+def e1rm_trend(user_id, granularity="week", exercises=None):
+    """Returns the top set of each exercise in each period it was trained, oldest first.
+
+    Columns: period_start, exercise_name, weight_kg, reps, e1rm_kg,
+    e1rm_best_so_far (running maximum) and e1rm_change (vs the previous period
+    the exercise was trained).
+    """
+    _check_granularity(granularity)
+    _, top_sets = default_cache.get(user_id, granularity, _fetch_periods)
+    df = top_sets
+    if exercises is not None:
+        df = df[df["exercise_name"].isin(exercises)]
+    df = df.sort_values(["exercise_name", "period_start"], ignore_index=True)
+    by_exercise = df.groupby("exercise_name")["e1rm_kg"]
+    df["e1rm_best_so_far"] = by_exercise.cummax()
+    df["e1rm_change"] = by_exercise.diff().round(2)
+    return df
+
+def e1rm_summary(user_id, granularity="week"):
+    """Returns one row per exercise: periods trained, latest and best e1RM, and the trend.
+
+    `trend_kg_per_period` is the least-squares slope of the top-set e1RM over
+    time, in kg per week or month.
+    """
+    df = e1rm_trend(user_id, granularity)
+    if df.empty:
+        return pd.DataFrame(columns=["exercise_name", "periods", "latest_e1rm_kg", "best_e1rm_kg", "trend_kg_per_period"])
+    x = (df["period_start"] - df["period_start"].min()).dt.days.to_numpy() / PERIOD_DAYS[granularity]
+    y = df["e1rm_kg"].to_numpy()
+    parts = pd.DataFrame({"exercise_name": df["exercise_name"], "x": x, "y": y, "xy": x * y, "xx": x * x})
+    means = parts.groupby("exercise_name").mean()
+    variance = means["xx"] - means["x"] ** 2
+    slope = ((means["xy"] - means["x"] * means["y"]) / variance.where(variance > 1e-9)).fillna(0.0)
+    grouped = df.groupby("exercise_name")["e1rm_kg"]
+    return pd.DataFrame({
+        "periods": grouped.size(),
+        "latest_e1rm_kg": grouped.last(),
+        "best_e1rm_kg": grouped.max(),
+        "trend_kg_per_period": slope.round(2),
+    }).reset_index()
+
+def cache_stats():
+    return dict(default_cache.stats)
@@ -3,6 +3,27 @@
 import psycopg2
 from psycopg2 import sql
 import datetime
+import functools
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import change_feed
+import ingest
+import instrumentation
+import loader
+import migrations
+import queries
+import query_cache
+import routing
+import sqlite_storage
+from db_pool import ConnectionPool
+from instrumentation import timed
+from query_cache import cached
+from routing import replica_read
 
 # --- DATABASE CONNECTION ---
 # IMPORTANT: Replace with your actual PostgreSQL credentials
@@ -14,281 +35,1097 @@ DB_CONFIG = {
     "port": "5432"
 }
 
-def get_db_connection():
-    """Establishes and returns a database connection."""
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
-    except psycopg2.OperationalError as e:
-        print(f"Error connecting to the database: {e}")
-        return None
+# Storage engine. "postgres" uses DB_CONFIG and everything below; "sqlite"
+# keeps the whole database in one local file (sqlite_storage.py), for
+# single-user deployments that should start without a database server. With
+# it there are no replicas or change feed, and the operations tools
+# (partitioning, importer, datagen, rollups rebuild, explain_check) stay
+# PostgreSQL-only. Switch at runtime with use_storage().
+STORAGE_CONFIG = {
+    "engine": "postgres",
+    "sqlite_path": "fitness.db",
+    "busy_timeout": 5.0,    # seconds a write waits for another one to finish
+    "max_connections": 8,   # connections shared by all threads
+}
+STORAGE_ENGINES = ("postgres", "sqlite")
+
+# Errors the database drivers raise, for the functions that report them.
+DATABASE_ERRORS = (psycopg2.Error, sqlite3.Error)
+
+# Connection pool settings. Connections are borrowed per call and returned
+# afterwards, so a Streamlit rerun reuses warm connections instead of paying
+# for TCP, auth and backend start-up on every query.
+POOL_CONFIG = {
+    "minconn": 1,
+    "maxconn": 10,
+    "timeout": 5.0,         # seconds to wait for a free connection
+    "check_after": 30.0,    # health-check connections idle longer than this
+    "max_lifetime": 3600.0  # recycle connections older than this
+}
+
+# Read replicas (see routing.py). Each entry overrides DB_CONFIG keys, usually
+# host and port, and gets a pool sized like POOL_CONFIG. With none configured
+# every read goes to DB_CONFIG.
+REPLICAS = []
+
+ROUTING_CONFIG = {
+    "max_staleness": 5.0,        # seconds a replica may lag behind and still serve reads
+    "sticky_seconds": 10.0,      # a session reads from the primary this long after it writes
+    "lag_check_interval": 1.0,   # seconds between lag measurements of each replica
+    "retry_after": 30.0,         # seconds an unreachable replica is skipped for
+}
+
+# Change feed (change_feed.py): a listener thread evicting cached reads as soon
+# as other processes' writes commit.
+CHANGE_FEED_CONFIG = {
+    "enabled": True,
+    "live_refresh_seconds": 2.0,   # how often live page sections look for applied changes
+    "max_reconnect_delay": 30.0,   # longest wait between attempts to reconnect the listener
+}
+
+# Write-behind workout logging (ingest.py). When enabled, log_workout() returns
+# once the workout is in a local journal and a background thread writes queued
+# workouts in batched transactions. Each app process needs its own journal.
+# The session that logged a queued workout reads its own writes once it lands.
+INGEST_CONFIG = {
+    "enabled": False,
+    "journal_path": "workouts.journal",
+    "batch_size": 200,          # most workouts written per transaction
+    "linger_seconds": 0.05,     # how long a batch may wait to fill up
+    "max_pending": 10000,       # queued workouts before log_workout() has to wait for room
+    "submit_timeout": 2.0,      # seconds log_workout() waits for room before writing directly
+    "fsync": True,              # False: queued workouts survive a process crash, not a power cut
+    "key_retention_days": 7,    # how long idempotency keys of written workouts are kept
+    "key_prune_interval": 3600.0,   # seconds between prunes of old keys, queued or written directly
+}
+
+# Seconds each cached read stays fresh. Writes made through this module evict
+# the affected entries straight away, so TTLs only bound staleness from writers
+# in other processes. Change at runtime with e.g. get_leaderboard.ttl = 10.
+CACHE_TTLS = {
+    "get_user_profile": 300,
+    "get_all_users": 60,
+    "get_friends": 300,
+    "get_active_goal": 300,
+    "get_goal_progress": 60,
+    "get_leaderboard": 30,
+    "get_workout_statistics": 300,
+    "get_personal_records": 300,
+    "get_duration_series": 300,
+    "get_workout_history_page": 300,
+    "get_exercise_catalog": 300,
+    "get_exercise_aliases": 300,
+    "get_friends_leaderboard": 30,
+    "search_users": 60,
+    # Also changes when friends add friends, which only this TTL picks up
+    "get_friend_suggestions": 300,
+}
+
+# Once workouts and exercises are partitioned by month (partitioning.py),
+# initialize_database() keeps partitions this many months ahead of today.
+PARTITION_MONTHS_AHEAD = 3
+
+# Per-call and per-statement timing, slow-query log and metrics (see
+# instrumentation.py). Off by default, when it costs one flag check per backend
+# call. Change at runtime with configure_instrumentation(enabled=True, ...).
+INSTRUMENTATION_CONFIG = {
+    "enabled": False,
+    "slow_query_ms": 100,           # statements at least this slow go to the slow-query log
+    "slow_log_size": 50,            # most recent slow statements kept
+    "explain_slow_queries": True,   # capture the EXPLAIN plan of slow statements
+}
+instrumentation.configure(**INSTRUMENTATION_CONFIG)
+
+_pool = None
+_router = None
+_change_feed = None
+_ingest_queue = None
+_sqlite = None
+_last_key_prune = None
+_queued_sessions = {}   # idempotency key -> session (routing.py) of workouts in the queue
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+    return _pool
+
+def embedded():
+    """True when the database is the local SQLite file rather than PostgreSQL."""
+    engine = STORAGE_CONFIG["engine"]
+    if engine not in STORAGE_ENGINES:
+        raise ValueError(f"Unknown storage engine {engine!r}, expected one of {STORAGE_ENGINES}")
+    return engine == "sqlite"
+
+def get_sqlite():
+    """Returns the process-wide SQLite storage, creating it on first use."""
+    global _sqlite
+    if _sqlite is None:
+        with _pool_lock:
+            if _sqlite is None:
+                _sqlite = sqlite_storage.SQLiteStorage(
+                    STORAGE_CONFIG["sqlite_path"], STORAGE_CONFIG["busy_timeout"], STORAGE_CONFIG["max_connections"]
+                )
+    return _sqlite
+
+@contextmanager
+def transaction():
+    """Borrows a pooled connection and yields a cursor inside one transaction.
+
+    The transaction is committed when the block exits normally and rolled back
+    if it raises; the connection always goes back to the pool.
+    """
+    if embedded():
+        with get_sqlite().transaction(timed=instrumentation.enabled()) as cur:
+            yield cur
+        return
+    if not instrumentation.enabled():
+        with get_pool().transaction() as cur:
+            yield cur
+        return
+    started = time.perf_counter()
+    with get_pool().transaction(cursor_factory=instrumentation.TimedCursor) as cur:
+        instrumentation.default_recorder.record_acquire(time.perf_counter() - started)
+        yield cur
+
+def get_router():
+    """Returns the process-wide read router (routing.py), creating it on first use."""
+    global _router
+    if _router is None:
+        primary = get_pool()
+        with _pool_lock:
+            if _router is None:
+                replicas = [
+                    routing.Replica(f"{c.get('host', DB_CONFIG.get('host'))}:{c.get('port', DB_CONFIG.get('port', 5432))}",
+                                    {**DB_CONFIG, **c}, POOL_CONFIG)
+                    for c in REPLICAS
+                ]
+                _router = routing.Router(primary, replicas, **ROUTING_CONFIG)
+                # A replica read can predate writes that already invalidated its
+                # cache entry: don't cache results until replicas have caught up
+                # with an invalidation, nor serve them to a session reading its
+                # own writes.
+                cache = query_cache.default_cache
+                cache.settle_seconds = _router.max_staleness + _router.lag_check_interval if replicas else 0.0
+                cache.bypass = _router.sticky if replicas else None
+    return _router
+
+@contextmanager
+def read_transaction():
+    """Like transaction(), for reads: runs on a replica when one is fresh enough.
+
+    Functions using it are wrapped in routing.replica_read, so that a read
+    failing on a replica is retried on the primary.
+    """
+    if embedded():
+        with get_sqlite().transaction(read_only=True, timed=instrumentation.enabled()) as cur:
+            yield cur
+        return
+    if not instrumentation.enabled():
+        with get_router().read_transaction() as cur:
+            yield cur
+        return
+    started = time.perf_counter()
+    with get_router().read_transaction(cursor_factory=instrumentation.TimedCursor) as cur:
+        instrumentation.default_recorder.record_acquire(time.perf_counter() - started)
+        yield cur
+
+def record_write():
+    """Keeps the current session's reads on the primary for a while (read-your-writes)."""
+    routing.record_write()
+
+def writes(func):
+    """Marks functions that write: the calling session then reads its own writes."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_write()
+    return wrapper
+
+def use_session(key):
+    """Ties this context's reads and writes to session `key`, e.g. a browser session."""
+    routing.set_session(key)
+
+def configure_routing(**settings):
+    """Changes ROUTING_CONFIG; takes effect for the router created next (after close_pool())."""
+    ROUTING_CONFIG.update(settings)
+    close_pool()
+
+def get_routing_stats():
+    """Returns reads per target and each replica's lag and state."""
+    return get_router().stats()
+
+def get_pool_stats():
+    """Returns connection pool counters (size, idle, in use, waits, timeouts)."""
+    return get_pool().stats()
+
+def get_storage_stats():
+    """Returns the SQLite storage's connection and transaction counters (None on PostgreSQL)."""
+    return get_sqlite().stats() if embedded() else None
+
+def get_cache_stats():
+    """Returns per-function cache hit/miss/eviction counters."""
+    return query_cache.stats()
+
+# --- INSTRUMENTATION ---
+def configure_instrumentation(**settings):
+    """Turns timing on or off and changes the slow-query settings (see INSTRUMENTATION_CONFIG)."""
+    INSTRUMENTATION_CONFIG.update(settings)
+    instrumentation.configure(**settings)
+
+def get_query_performance():
+    """Returns per-function and per-statement timings and the slow-query log, hottest first."""
+    return instrumentation.snapshot()
+
+def reset_query_performance():
+    instrumentation.reset()
+
+def get_metrics_text():
+    """Returns timings, pool, cache and write-behind queue counters in the Prometheus text format."""
+    lines = [instrumentation.prometheus_text().rstrip("\n")]
+    if embedded():
+        storage = get_storage_stats()
+        for key in ("connections", "in_use"):
+            lines.append(f"# TYPE fitness_sqlite_{key} gauge")
+            lines.append(f"fitness_sqlite_{key} {storage[key]}")
+        for key in ("connections_created", "transactions", "read_transactions", "rollbacks", "borrow_timeouts"):
+            lines.append(f"# TYPE fitness_sqlite_{key}_total counter")
+            lines.append(f"fitness_sqlite_{key}_total {storage[key]}")
+    else:
+        pool = get_pool_stats()
+        for key in ("size", "idle", "in_use", "maxconn"):
+            lines.append(f"# TYPE fitness_db_pool_{key} gauge")
+            lines.append(f"fitness_db_pool_{key} {pool[key]}")
+        for key in ("connections_created", "connections_closed", "borrows", "borrow_timeouts", "health_check_failures"):
+            lines.append(f"# TYPE fitness_db_pool_{key}_total counter")
+            lines.append(f"fitness_db_pool_{key}_total {pool[key]}")
+    cache = get_cache_stats()
+    for counter in ("hits", "misses", "bypasses", "evictions", "invalidations"):
+        lines.append(f"# TYPE fitness_query_cache_{counter}_total counter")
+        for name in sorted(cache):
+            lines.append(f'fitness_query_cache_{counter}_total{{function="{name}"}} {cache[name][counter]}')
+    if _ingest_queue is not None:
+        queue = _ingest_queue.stats()
+        for key in ("depth", "in_flight", "oldest_age_seconds", "journal_bytes", "flush_seconds_max"):
+            lines.append(f"# TYPE fitness_ingest_{key} gauge")
+            lines.append(f"fitness_ingest_{key} {queue[key]}")
+        for key in ("submitted", "written", "already_written", "rejected", "batches", "retries", "full"):
+            lines.append(f"# TYPE fitness_ingest_{key}_total counter")
+            lines.append(f"fitness_ingest_{key}_total {queue[key]}")
+        lines.append("# TYPE fitness_ingest_flush_seconds summary")
+        lines.append(f"fitness_ingest_flush_seconds_sum {queue['flush_seconds_total']}")
+        lines.append(f"fitness_ingest_flush_seconds_count {queue['batches']}")
+    return "\n".join(lines) + "\n"
+
+_metrics_server = None
+
+def serve_metrics(port=9464):
+    """Serves get_metrics_text() at http://<host>:<port>/metrics, once per process."""
+    global _metrics_server
+    with _pool_lock:
+        if _metrics_server is None:
+            _metrics_server = instrumentation.serve_metrics(port, get_metrics_text)
+    return _metrics_server
+
+def close_pool():
+    """Closes all pooled connections, e.g. on shutdown or in tests."""
+    global _pool, _router, _change_feed, _ingest_queue, _sqlite
+    # Queued workouts are written first, through the pool being closed.
+    with _pool_lock:
+        queue, _ingest_queue = _ingest_queue, None
+    if queue is not None:
+        queue.stop()
+    with _pool_lock:
+        if _change_feed is not None:
+            _change_feed.stop()
+            _change_feed = None
+        if _router is not None:
+            _router.close()
+            _router = None
+            query_cache.default_cache.settle_seconds = 0.0
+            query_cache.default_cache.bypass = None
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+        if _sqlite is not None:
+            _sqlite.close()
+            _sqlite = None
+
+def use_schema(schema):
+    """Points all connections at `schema` instead of the default search_path (None to reset).
+
+    Used by the data generator and benchmarks to work on a separate dataset
+    in the same database. Closes the current pool and clears the cache; the
+    next initialize_database() migrates that schema.
+    """
+    global _schema_ready
+    if schema is not None and not re.fullmatch(r"[a-z_][a-z0-9_]*", schema):
+        raise ValueError(f"Invalid schema name {schema!r}")
+    close_pool()
+    with _schema_lock:
+        if schema is None:
+            DB_CONFIG.pop("options", None)
+        else:
+            DB_CONFIG["options"] = f"-c search_path={schema}"
+        _schema_ready = False
+    query_cache.clear()
+
+def use_storage(engine, **settings):
+    """Switches to storage `engine` ("postgres" or "sqlite"), e.g. use_storage("sqlite", sqlite_path="app.db").
+
+    Other keyword arguments update STORAGE_CONFIG. Closes the current
+    connections and forgets every cached read; the next initialize_database()
+    migrates the new database.
+    """
+    global _schema_ready
+    if engine not in STORAGE_ENGINES:
+        raise ValueError(f"Unknown storage engine {engine!r}, expected one of {STORAGE_ENGINES}")
+    close_pool()
+    with _schema_lock:
+        STORAGE_CONFIG.update(settings, engine=engine)
+        _schema_ready = False
+    reset_caches()
 
 # --- DATABASE INITIALIZATION ---
+# The schema lives in migrations/*.sql (see migrations.py). It is brought up to
+# date once per process; after that initialize_database() does no DDL and no
+# round trip at all, so it is safe to call on every Streamlit rerun.
+_schema_ready = False
+_schema_lock = threading.Lock()
+
 def initialize_database():
-    """Creates all necessary tables if they don't exist."""
-    conn = get_db_connection()
-    if not conn:
+    """Applies pending schema migrations, once per process."""
+    global _schema_ready
+    if _schema_ready:
         return
-        
-    commands = [
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            user_id SERIAL PRIMARY KEY,
-            name VARCHAR(255) NOT NULL,
-            email VARCHAR(255) UNIQUE NOT NULL,
-            weight_kg NUMERIC(5, 2)
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS friends (
-            user_id INTEGER REFERENCES users(user_id),
-            friend_id INTEGER REFERENCES users(user_id),
-            PRIMARY KEY (user_id, friend_id)
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS workouts (
-            workout_id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL REFERENCES users(user_id),
-            workout_date DATE NOT NULL,
-            duration_minutes INTEGER
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS exercises (
-            exercise_id SERIAL PRIMARY KEY,
-            workout_id INTEGER NOT NULL REFERENCES workouts(workout_id) ON DELETE CASCADE,
-            exercise_name VARCHAR(255) NOT NULL,
-            sets INTEGER,
-            reps INTEGER,
-            weight_kg NUMERIC(6, 2)
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS goals (
-            goal_id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL REFERENCES users(user_id),
-            goal_description TEXT,
-            target_value INTEGER,
-            start_date DATE DEFAULT CURRENT_DATE,
-            end_date DATE,
-            is_active BOOLEAN DEFAULT TRUE
-        )
-        """
-    ]
-    try:
-        with conn.cursor() as cur:
-            for command in commands:
-                cur.execute(command)
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Error initializing database: {e}")
-    finally:
-        conn.close()
+    with _schema_lock:
+        if _schema_ready:
+            return
+        try:
+            if embedded():
+                for version, name in get_sqlite().migrate():
+                    print(f"Applied migration sqlite/{version:04d}_{name}")
+                _schema_ready = True
+                return
+            with transaction() as cur:
+                applied = migrations.migrate(cur)
+                cur.execute(queries.CREATE_MONTHLY_PARTITIONS, {
+                    "first_month": datetime.date.today(),
+                    "months_ahead": PARTITION_MONTHS_AHEAD,
+                })
+                partitions = [(month, action) for month, action in cur.fetchall() if action != "exists"]
+            for version, name in applied:
+                print(f"Applied migration {version:04d}_{name}")
+            for month, action in partitions:
+                print(f"Partitions for {month:%Y-%m}: {action}")
+            _schema_ready = True
+        except DATABASE_ERRORS as e:
+            print(f"Error initializing database: {e}")
 
 # --- USER PROFILE (CRUD) ---
+@cached(CACHE_TTLS["get_user_profile"], tags=lambda args, user: [f"user:{args[0]}"])
+@timed
+@replica_read
 def get_user_profile(user_id):
     """READ: Fetches a user's profile."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute("SELECT name, email, weight_kg FROM users WHERE user_id = %s", (user_id,))
+    with read_transaction() as cur:
+        cur.execute(queries.USER_PROFILE, (user_id,))
         user = cur.fetchone()
-    conn.close()
     return user
 
+@writes
+@timed
 def update_user_profile(user_id, name, email, weight):
     """UPDATE: Updates a user's profile information."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute(
-            "UPDATE users SET name = %s, email = %s, weight_kg = %s WHERE user_id = %s",
-            (name, email, weight, user_id)
-        )
-        conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute(queries.UPDATE_USER_PROFILE, (name, email, weight, user_id))
+    # The name also appears in user lists, friend lists and the leaderboard
+    query_cache.invalidate(f"user:{user_id}", "users")
 
+@cached(CACHE_TTLS["get_all_users"], tags=lambda args, users: ["users"])
+@timed
+@replica_read
 def get_all_users(exclude_user_id):
     """READ: Fetches all users, excluding the specified user."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute("SELECT user_id, name FROM users WHERE user_id != %s", (exclude_user_id,))
+    with read_transaction() as cur:
+        cur.execute(queries.ALL_USERS, (exclude_user_id,))
         users = cur.fetchall()
-    conn.close()
     return users
 
 # --- WORKOUTS (CRUD) ---
-def log_workout(user_id, date, duration, exercises):
-    """CREATE: Logs a new workout and its associated exercises in a transaction."""
-    conn = get_db_connection()
+# What log_workout() did with a workout.
+WORKOUT_WRITTEN = "written"
+WORKOUT_QUEUED = "queued"         # in the write-behind queue, written shortly after
+WORKOUT_DUPLICATE = "duplicate"   # its idempotency key was already claimed: logged before
+
+@timed
+def log_workout(user_id, date, duration, exercises, idempotency_key=None):
+    """CREATE: Logs a new workout and its associated exercises in a transaction.
+
+    Returns WORKOUT_WRITTEN, WORKOUT_QUEUED (INGEST_CONFIG enabled: written
+    shortly after, see ingest.py) or WORKOUT_DUPLICATE when a workout with the
+    same `idempotency_key` was logged before. Database errors are raised, so
+    the caller can retry with the same key.
+    """
+    if INGEST_CONFIG["enabled"] or idempotency_key is not None:
+        entry = workout_entry(user_id, date, duration, exercises, idempotency_key)
+        if queue_workout(entry):
+            return WORKOUT_QUEUED
+        try:
+            skipped = write_workout_batch([entry])
+        finally:
+            record_write()
+        return WORKOUT_DUPLICATE if skipped else WORKOUT_WRITTEN
+    new_names = has_new_exercise_names([ex['name'] for ex in exercises])
     try:
-        with conn.cursor() as cur:
+        with transaction() as cur:
             # Insert into workouts table
-            cur.execute(
-                "INSERT INTO workouts (user_id, workout_date, duration_minutes) VALUES (%s, %s, %s) RETURNING workout_id",
-                (user_id, date, duration)
-            )
+            cur.execute(queries.INSERT_WORKOUT, (user_id, date, duration))
             workout_id = cur.fetchone()[0]
 
-            # Insert into exercises table
-            for ex in exercises:
-                cur.execute(
-                    "INSERT INTO exercises (workout_id, exercise_name, sets, reps, weight_kg) VALUES (%s, %s, %s, %s, %s)",
-                    (workout_id, ex['name'], ex['sets'], ex['reps'], ex['weight'])
-                )
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Database error during workout log: {e}")
-        conn.rollback()
+            # Insert all exercises in one multi-row statement
+            if exercises:
+                cur.execute(queries.INSERT_WORKOUT_EXERCISES, exercise_params(workout_id, date, exercises))
     finally:
-        conn.close()
+        record_write()
+    invalidate_workouts(user_id, [date])
+    if new_names:
+        query_cache.invalidate("exercise_catalog")
+    return WORKOUT_WRITTEN
+
+def queue_workout(entry):
+    """Hands a workout entry to the write-behind queue if INGEST_CONFIG enables it; returns whether it did."""
+    queue = start_ingest() if INGEST_CONFIG["enabled"] else None
+    if queue is None:
+        return False
+    with _pool_lock:
+        if len(_queued_sessions) > 2 * INGEST_CONFIG["max_pending"]:
+            _queued_sessions.clear()   # keys of rejected entries never land
+        _queued_sessions[entry['key']] = routing.current_session()
+    try:
+        queue.submit(entry, timeout=INGEST_CONFIG["submit_timeout"])
+        return True
+    except ingest.QueueUnavailable as e:
+        print(f"Writing workout directly: {e}")
+        return False
+
+def workout_entry(user_id, date, duration, exercises, idempotency_key=None):
+    """A workout as queued by ingest.py: a JSON-serializable dict with an idempotency key."""
+    return {
+        "key": idempotency_key or uuid.uuid4().hex,
+        "user_id": user_id,
+        "workout_date": _as_date(date).isoformat(),
+        "duration": duration,
+        "exercises": [
+            {"name": ex['name'], "sets": ex['sets'], "reps": ex['reps'],
+             "weight": None if ex['weight'] is None else float(ex['weight'])}
+            for ex in exercises
+        ],
+    }
+
+@timed
+def write_workout_batch(entries):
+    """Writes workout entries (see workout_entry()) in one transaction; returns how many were written before.
+
+    Entries whose idempotency key was already claimed are skipped.
+    """
+    new_names = has_new_exercise_names([ex['name'] for entry in entries for ex in entry['exercises']])
+    with transaction() as cur:
+        cur.execute(queries.CLAIM_IDEMPOTENCY_KEYS, ([entry['key'] for entry in entries],))
+        workout_ids = dict(cur.fetchall())
+        new = [entry for entry in entries if entry['key'] in workout_ids]
+        if new:
+            workout_params, exercise_batch = workout_batch_params(new, workout_ids)
+            cur.execute(queries.INSERT_WORKOUT_BATCH, workout_params)
+            if exercise_batch:
+                cur.execute(queries.INSERT_EXERCISE_BATCH, exercise_batch)
+    workouts_landed(entries, new, new_names)
+    # Workouts logged directly claim keys too, with no queue to prune them.
+    prune_idempotency_keys_periodically()
+    return len(entries) - len(new)
+
+def workout_batch_params(new, workout_ids):
+    """Parameters of queries.INSERT_WORKOUT_BATCH and INSERT_EXERCISE_BATCH (None without exercises).
 
+    `new` are the entries to insert, `workout_ids` maps their keys to the ids
+    CLAIM_IDEMPOTENCY_KEYS reserved.
+    """
+    workout_params = {
+        "workout_ids": [workout_ids[entry['key']] for entry in new],
+        "user_ids": [entry['user_id'] for entry in new],
+        "dates": [entry['workout_date'] for entry in new],
+        "durations": [entry['duration'] for entry in new],
+    }
+    exercises = [(workout_ids[entry['key']], entry['workout_date'], ex) for entry in new for ex in entry['exercises']]
+    if not exercises:
+        return workout_params, None
+    return workout_params, {
+        "workout_ids": [workout_id for workout_id, _, _ in exercises],
+        "dates": [workout_date for _, workout_date, _ in exercises],
+        "names": [ex['name'] for _, _, ex in exercises],
+        "sets": [ex['sets'] for _, _, ex in exercises],
+        "reps": [ex['reps'] for _, _, ex in exercises],
+        "weights": [ex['weight'] for _, _, ex in exercises],
+    }
+
+def workouts_landed(entries, new, new_names):
+    """Cache and routing bookkeeping once a batch of `entries` committed, `new` of them written."""
+    dates_by_user = {}
+    for entry in new:
+        dates_by_user.setdefault(entry['user_id'], []).append(entry['workout_date'])
+    for user_id, dates in dates_by_user.items():
+        invalidate_workouts(user_id, dates)
+    if new and new_names:
+        query_cache.invalidate("exercise_catalog")
+    # Sessions whose queued workouts just landed now read their own writes.
+    with _pool_lock:
+        sessions = {_queued_sessions.pop(entry['key']) for entry in entries if entry['key'] in _queued_sessions}
+    for session_key in sessions:
+        routing.record_write_in(session_key)
+
+def exercise_params(workout_id, workout_date, exercises):
+    """Builds the parameters of queries.INSERT_WORKOUT_EXERCISES from exercise dicts."""
+    return {
+        "workout_id": workout_id,
+        "workout_date": workout_date,
+        "names": [ex['name'] for ex in exercises],
+        "sets": [ex['sets'] for ex in exercises],
+        "reps": [ex['reps'] for ex in exercises],
+        "weights": [ex['weight'] for ex in exercises],
+    }
+
+def invalidate_workouts(user_id, dates):
+    """Evicts cached reads affected by new or removed workouts of `user_id` on `dates`.
+
+    `dates` may be None when they are not known (e.g. after a bulk import).
+    Callbacks registered with on_workouts_changed() are told as well.
+    """
+    tags = [f"workouts:{user_id}"]
+    if dates is None:
+        tags.append("leaderboard")
+    else:
+        dates = [_as_date(d) for d in dates]
+        # The leaderboard only shows the current week. Start a day early, since the
+        # database and this process may disagree on what "today" is.
+        today = datetime.date.today()
+        week_start = today - datetime.timedelta(days=today.weekday() + 1)
+        if any(d >= week_start for d in dates):
+            tags.append("leaderboard")
+    query_cache.invalidate(*tags)
+    for callback in _workout_listeners:
+        callback(user_id, dates)
+
+def _as_date(d):
+    if isinstance(d, str):
+        return datetime.date.fromisoformat(d)
+    if isinstance(d, datetime.datetime):
+        return d.date()
+    return d
+
+# Callbacks run after workouts change, for caches that live outside query_cache
+# (e.g. analytics.py's per-period aggregates).
+_workout_listeners = []
+
+def on_workouts_changed(callback):
+    """Registers callback(user_id, dates) to run after a user's workouts change.
+
+    dates may be None when they are not known, and user_id None when any
+    user's workouts may have changed.
+    """
+    _workout_listeners.append(callback)
+
+@timed
+@replica_read
 def get_user_workouts(user_id):
     """READ: Fetches a history of workouts for a user."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute(
-            "SELECT workout_id, workout_date, duration_minutes FROM workouts WHERE user_id = %s ORDER BY workout_date DESC",
-            (user_id,)
-        )
+    with read_transaction() as cur:
+        cur.execute(queries.USER_WORKOUTS, (user_id,))
         workouts = cur.fetchall()
-    conn.close()
     return workouts
 
+@timed
+@replica_read
 def get_workout_details(workout_id):
     """READ: Fetches exercises for a specific workout."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute(
-            "SELECT exercise_name, sets, reps, weight_kg FROM exercises WHERE workout_id = %s",
-            (workout_id,)
-        )
+    with read_transaction() as cur:
+        cur.execute(queries.WORKOUT_DETAILS, (workout_id,))
         details = cur.fetchall()
-    conn.close()
     return details
     
+@cached(CACHE_TTLS["get_workout_history_page"], tags=lambda args, page: [f"workouts:{args[0]}"])
+@timed
+@replica_read
+def get_workout_history_page(user_id, limit=20, cursor=None):
+    """READ: Fetches one page of a user's workouts, newest first, with their exercises.
+
+    Returns (workouts, next_cursor). Each workout is a tuple
+    (workout_id, workout_date, duration_minutes, exercises), where exercises is a
+    list of (exercise_name, sets, reps, weight_kg). Pass next_cursor back in to
+    get the following page; it is None on the last page.
+    """
+    query, params = history_page_params(user_id, limit, cursor)
+    with read_transaction() as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+    return build_history_page(rows, limit)
+
+def history_page_params(user_id, limit, cursor):
+    """Returns (query, params) for one history page; fetches one extra row to detect the end."""
+    params = {"user_id": user_id, "limit": limit + 1}
+    if cursor is None:
+        return queries.WORKOUT_HISTORY_FIRST_PAGE, params
+    params["before_date"], params["before_id"] = cursor
+    return queries.WORKOUT_HISTORY_NEXT_PAGE, params
+
+def build_history_page(rows, limit):
+    """Groups joined workout/exercise rows into (workouts, next_cursor)."""
+    workouts = []
+    for workout_id, workout_date, duration, name, sets, reps, weight in rows:
+        if not workouts or workouts[-1][0] != workout_id:
+            workouts.append((workout_id, workout_date, duration, []))
+        if name is not None:
+            workouts[-1][3].append((name, sets, reps, weight))
+
+    next_cursor = None
+    if len(workouts) > limit:
+        workouts = workouts[:limit]
+        next_cursor = (workouts[-1][1], workouts[-1][0])
+    return workouts, next_cursor
+
+@cached(CACHE_TTLS["get_duration_series"], tags=lambda args, series: [f"workouts:{args[0]}"])
+@timed
+@replica_read
+def get_duration_series(user_id, max_points=52):
+    """READ: Returns [(period_start, total_minutes), ...] with at most `max_points` points."""
+    with read_transaction() as cur:
+        cur.execute(queries.DURATION_SERIES, {"user_id": user_id, "max_points": max_points})
+        series = cur.fetchall()
+    return series
+    
 # --- FRIENDS (CRUD) ---
+@cached(
+    CACHE_TTLS["get_friends"],
+    # Also tagged with each friend, whose name is part of the result
+    tags=lambda args, friends: [f"friends:{args[0]}"] + [f"user:{friend_id}" for friend_id, _ in friends]
+)
+@timed
+@replica_read
 def get_friends(user_id):
     """READ: Fetches a user's friends."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT u.user_id, u.name 
-            FROM users u
-            JOIN friends f ON u.user_id = f.friend_id
-            WHERE f.user_id = %s
-            """, (user_id,)
-        )
+    with read_transaction() as cur:
+        cur.execute(queries.FRIENDS, (user_id,))
         friends = cur.fetchall()
-    conn.close()
     return friends
 
+@writes
+@timed
 def add_friend(user_id, friend_id):
     """CREATE: Adds a friend connection."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute("INSERT INTO friends (user_id, friend_id) VALUES (%s, %s)", (user_id, friend_id))
-        conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute(queries.ADD_FRIEND, (user_id, friend_id))
+    query_cache.invalidate(f"friends:{user_id}")
 
+@writes
+@timed
 def remove_friend(user_id, friend_id):
     """DELETE: Removes a friend connection."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute("DELETE FROM friends WHERE user_id = %s AND friend_id = %s", (user_id, friend_id))
-        conn.commit()
-    conn.close()
-    
+    with transaction() as cur:
+        cur.execute(queries.REMOVE_FRIEND, (user_id, friend_id))
+    query_cache.invalidate(f"friends:{user_id}")
+
+# Searches shorter than this match name prefixes only; longer ones match
+# anywhere in the name (trigram-indexed when pg_trgm is installed).
+SEARCH_SUBSTRING_MIN_LENGTH = 3
+
+@cached(CACHE_TTLS["search_users"], tags=lambda args, page: ["users", f"friends:{args[0]}"])
+@timed
+@replica_read
+def search_users(user_id, query, limit=20, cursor=None):
+    """READ: Finds users to add as friends by name, one page at a time.
+
+    Returns (users, next_cursor), where users is a list of (user_id, name) that
+    excludes the user and their friends. Pass next_cursor back in to get the
+    following page; it is None on the last page.
+    """
+    sql_text, params = search_users_params(user_id, query, limit, cursor)
+    with read_transaction() as cur:
+        cur.execute(sql_text, params)
+        rows = cur.fetchall()
+    return build_search_page(rows, limit)
+
+def search_users_params(user_id, query, limit, cursor):
+    """Returns (query, params) for one search page; fetches one extra row to detect the end."""
+    query = query.strip()
+    substring = len(query) >= SEARCH_SUBSTRING_MIN_LENGTH
+    params = {
+        "user_id": user_id,
+        # LIKE wildcards typed by the user match themselves
+        "query": query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"),
+        "limit": limit + 1,
+    }
+    if cursor is None:
+        return (queries.SEARCH_USERS_BY_SUBSTRING if substring else queries.SEARCH_USERS_BY_PREFIX), params
+    params["after_name"], params["after_id"] = cursor
+    return (queries.SEARCH_USERS_BY_SUBSTRING_NEXT if substring else queries.SEARCH_USERS_BY_PREFIX_NEXT), params
+
+def build_search_page(rows, limit):
+    """Turns SEARCH_USERS rows into (users, next_cursor)."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][2], rows[-1][0])
+    return [(user_id, name) for user_id, name, _ in rows], next_cursor
+
+@cached(
+    CACHE_TTLS["get_friend_suggestions"],
+    tags=lambda args, suggestions: [f"friends:{args[0]}"] + [f"user:{user_id}" for user_id, _, _ in suggestions]
+)
+@timed
+@replica_read
+def get_friend_suggestions(user_id, limit=10, max_friends=200, max_per_friend=50):
+    """READ: Returns (user_id, name, mutual_friends) for friends of the user's friends.
+
+    Follows at most `max_friends` friends and `max_per_friend` of each one's
+    friends, so large friend lists cost no more than small ones.
+    """
+    params = {"user_id": user_id, "limit": limit, "max_friends": max_friends, "max_per_friend": max_per_friend}
+    with read_transaction() as cur:
+        cur.execute(queries.FRIEND_SUGGESTIONS, params)
+        suggestions = cur.fetchall()
+    return suggestions
+
 # --- GOALS (CRUD) ---
+@writes
+@timed
 def set_goal(user_id, description, target_value):
     """CREATE: Sets a new fitness goal for the user."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
+    with transaction() as cur:
         # Deactivate old goals of the same type if necessary
-        cur.execute("UPDATE goals SET is_active = FALSE WHERE user_id = %s", (user_id,))
-        cur.execute(
-            "INSERT INTO goals (user_id, goal_description, target_value) VALUES (%s, %s, %s)",
-            (user_id, description, target_value)
-        )
-        conn.commit()
-    conn.close()
+        cur.execute(queries.DEACTIVATE_GOALS, (user_id,))
+        cur.execute(queries.INSERT_GOAL, (user_id, description, target_value))
+    query_cache.invalidate(f"goals:{user_id}")
     
+@cached(CACHE_TTLS["get_active_goal"], tags=lambda args, goal: [f"goals:{args[0]}"])
+@timed
+@replica_read
 def get_active_goal(user_id):
     """READ: Fetches the current active goal for a user."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute(
-            "SELECT goal_description, target_value FROM goals WHERE user_id = %s AND is_active = TRUE",
-            (user_id,)
-        )
+    with read_transaction() as cur:
+        cur.execute(queries.ACTIVE_GOAL, (user_id,))
         goal = cur.fetchone()
-    conn.close()
     return goal
+
+@cached(
+    CACHE_TTLS["get_goal_progress"],
+    tags=lambda args, progress: [f"goals:{args[0]}", f"workouts:{args[0]}"]
+)
+@timed
+@replica_read
+def get_goal_progress(user_id):
+    """This week's progress towards the active goal, or None without one (see build_goal_progress)."""
+    with read_transaction() as cur:
+        cur.execute(queries.GOAL_PROGRESS, (user_id,))
+        row = cur.fetchone()
+    return build_goal_progress(row)
+
+def build_goal_progress(row):
+    """Turns the GOAL_PROGRESS row into a dict.
+
+    `streak_weeks` counts consecutive weeks on target up to this one, or is
+    None until the batch evaluation (goals.py) has covered this week.
+    """
+    if row is None:
+        return None
+    description, target, workouts, minutes, streak_weeks = row
+    return {
+        'description': description,
+        'target': target,
+        'workouts': workouts,
+        'minutes': minutes,
+        'remaining': max(target - workouts, 0) if target else 0,
+        'percent': min(round(100 * workouts / target), 100) if target else 0,
+        'met': bool(target) and workouts >= target,
+        'streak_weeks': streak_weeks,
+    }
     
+# --- EXERCISE CATALOG ---
+# Exercises reference a catalog of exercise types (migration 0010); the names
+# users type are looked up among the aliases, normalized the same way as the
+# database's normalize_exercise_name(). Unknown names are added to the catalog
+# by the database when the exercise is written. See catalog.py.
+def normalize_exercise_name(name):
+    """Lower case with whitespace collapsed, like the SQL function of the same name."""
+    return " ".join(name.split()).lower()
+
+@cached(CACHE_TTLS["get_exercise_catalog"], tags=lambda args, catalog: ["exercise_catalog"])
+@timed
+@replica_read
+def get_exercise_catalog():
+    """READ: Returns (exercise_type_id, name) for every exercise type, by name."""
+    with read_transaction() as cur:
+        cur.execute(queries.EXERCISE_CATALOG)
+        catalog = cur.fetchall()
+    return catalog
+
+@cached(CACHE_TTLS["get_exercise_aliases"], tags=lambda args, aliases: ["exercise_catalog"])
+@timed
+@replica_read
+def get_exercise_aliases():
+    """READ: Returns {normalized alias: canonical name} for every known alias."""
+    with read_transaction() as cur:
+        cur.execute(queries.EXERCISE_ALIASES)
+        aliases = dict(cur.fetchall())
+    return aliases
+
+def has_new_exercise_names(names):
+    """Whether writing `names` adds to the catalog, so its cached reads must be evicted afterwards."""
+    aliases = get_exercise_aliases()
+    return any(normalize_exercise_name(name) not in aliases for name in names)
+
 # --- BUSINESS INSIGHTS & LEADERBOARD ---
+@cached(
+    CACHE_TTLS["get_leaderboard"],
+    tags=lambda args, board: ["leaderboard"] + [f"user:{user_id}" for user_id, _, _ in board]
+)
+@timed
+@replica_read
 def get_leaderboard():
-    """Calculates leaderboard data based on total workout minutes in the current week."""
-    conn = get_db_connection()
-    query = """
-    SELECT
-        u.name,
-        COALESCE(SUM(w.duration_minutes), 0) AS total_minutes
-    FROM
-        users u
-    LEFT JOIN
-        workouts w ON u.user_id = w.user_id
-    WHERE
-        w.workout_date >= date_trunc('week', CURRENT_DATE)
-    GROUP BY
-        u.name
-    ORDER BY
-        total_minutes DESC;
-    """
-    with conn.cursor() as cur:
-        cur.execute(query)
+    """Returns (user_id, name, total_minutes) for the current week, most minutes first."""
+    with read_transaction() as cur:
+        cur.execute(queries.LEADERBOARD)
         leaderboard = cur.fetchall()
-    conn.close()
     return leaderboard
 
+@cached(
+    CACHE_TTLS["get_friends_leaderboard"],
+    tags=lambda args, board: ["leaderboard", f"friends:{args[0]}"]
+    + [f"user:{row[1]}" for row in board["top"] + board["around"]]
+)
+@timed
+@replica_read
+def get_friends_leaderboard(user_id, top=3, neighbours=2):
+    """READ: Ranks the user among their friends by minutes this week.
+
+    Returns a dict with the user's rank, the number of people ranked, the `top`
+    rows and the rows `neighbours` places either side of the user that are not
+    already in `top`. Each row is (rank, user_id, name, total_minutes); ties
+    share a rank.
+    """
+    with read_transaction() as cur:
+        cur.execute(queries.FRIENDS_LEADERBOARD, {"user_id": user_id, "top": top, "neighbours": neighbours})
+        rows = cur.fetchall()
+    return build_friends_leaderboard(rows, user_id, top)
+
+def build_friends_leaderboard(rows, user_id, top):
+    """Turns FRIENDS_LEADERBOARD rows into the friends leaderboard dict."""
+    board = {"rank": None, "members": 0, "top": [], "around": []}
+    for position, rank, member_id, name, total_minutes, members in rows:
+        board["members"] = members
+        if member_id == user_id:
+            board["rank"] = rank
+        board["top" if position <= top else "around"].append((rank, member_id, name, total_minutes))
+    return board
+
+@cached(CACHE_TTLS["get_workout_statistics"], tags=lambda args, stats: [f"workouts:{args[0]}"])
+@timed
+@replica_read
 def get_workout_statistics(user_id):
-    """Calculates aggregate statistics for a user's workouts."""
-    conn = get_db_connection()
-    stats = {}
-    with conn.cursor() as cur:
-        # COUNT: Total workouts
-        cur.execute("SELECT COUNT(*) FROM workouts WHERE user_id = %s", (user_id,))
-        stats['total_workouts'] = cur.fetchone()[0]
-
-        # SUM: Total duration
-        cur.execute("SELECT SUM(duration_minutes) FROM workouts WHERE user_id = %s", (user_id,))
-        total_duration = cur.fetchone()[0]
-        stats['total_duration'] = total_duration if total_duration else 0
-
-        # AVG: Average duration
-        cur.execute("SELECT AVG(duration_minutes) FROM workouts WHERE user_id = %s", (user_id,))
-        avg_duration = cur.fetchone()[0]
-        stats['avg_duration'] = round(avg_duration, 2) if avg_duration else 0
-        
-        # MIN/MAX weight for a specific exercise (e.g., 'Bench Press')
-        cur.execute("""
-            SELECT MIN(weight_kg), MAX(weight_kg) 
-            FROM exercises 
-            WHERE workout_id IN (SELECT workout_id FROM workouts WHERE user_id = %s)
-            AND exercise_name = 'Bench Press'
-            """, (user_id,))
-        min_max_weight = cur.fetchone()
-        stats['min_bench_press'] = min_max_weight[0] if min_max_weight else 0
-        stats['max_bench_press'] = min_max_weight[1] if min_max_weight else 0
-
-    conn.close()
-    return stats
+    """Calculates aggregate statistics for a user's workouts in a single query."""
+    with read_transaction() as cur:
+        cur.execute(queries.WORKOUT_STATISTICS, (user_id,))
+        row = cur.fetchone()
+    return build_workout_statistics(row)
+
+def build_workout_statistics(row):
+    """Turns the WORKOUT_STATISTICS row into the statistics dict."""
+    total_workouts, total_duration, avg_duration = row
+    return {
+        'total_workouts': total_workouts,
+        'total_duration': total_duration,
+        'avg_duration': avg_duration if avg_duration else 0,
+    }
+
+@cached(CACHE_TTLS["get_personal_records"], tags=lambda args, records: [f"workouts:{args[0]}"])
+@timed
+@replica_read
+def get_personal_records(user_id):
+    """READ: Returns (exercise, best weight, best volume, best estimated 1RM) for every exercise type."""
+    with read_transaction() as cur:
+        cur.execute(queries.PERSONAL_RECORDS, (user_id,))
+        records = cur.fetchall()
+    return records
+
+# --- CHANGE FEED ---
+def start_change_feed():
+    """Starts this process's change feed listener if enabled and not running; returns it (or None)."""
+    global _change_feed
+    if not CHANGE_FEED_CONFIG["enabled"] or embedded():
+        return None
+    if _change_feed is None:
+        with _pool_lock:
+            if _change_feed is None:
+                _change_feed = change_feed.ChangeFeed(
+                    dict(DB_CONFIG), apply=apply_change, reset=reset_caches,
+                    max_reconnect_delay=CHANGE_FEED_CONFIG["max_reconnect_delay"]
+                ).start()
+    return _change_feed
+
+def get_change_feed():
+    """The running change feed, or None."""
+    return _change_feed
+
+def apply_change(change):
+    """Evicts the cached reads a change notification (migration 0012) makes stale."""
+    table = change["table"]
+    if change.get("all"):
+        # Too many rows changed to list, or the table was truncated.
+        if table == "workouts":
+            reset_caches()
+        else:
+            query_cache.clear()
+        return
+    keys = change["keys"]
+    if table == "workouts":
+        dates_by_user = {}
+        for user_id, workout_date in keys:
+            dates_by_user.setdefault(user_id, []).append(workout_date)
+        for user_id, dates in dates_by_user.items():
+            invalidate_workouts(user_id, dates)
+    elif table == "friends":
+        query_cache.invalidate(*[f"friends:{user_id}" for user_id in keys])
+    elif table == "goals":
+        query_cache.invalidate(*[f"goals:{user_id}" for user_id in keys])
+    elif table == "users":
+        # Names also appear in user lists, friend lists and leaderboards
+        query_cache.invalidate("users", *[f"user:{user_id}" for user_id in keys])
+
+def reset_caches():
+    """Forgets every cached read, including those kept outside query_cache."""
+    query_cache.clear()
+    for callback in _workout_listeners:
+        callback(None, None)
+
+# --- WRITE-BEHIND INGESTION ---
+def start_ingest():
+    """Starts this process's write-behind queue if not running; returns it (None if its journal is taken)."""
+    global _ingest_queue
+    if _ingest_queue is None:
+        with _pool_lock:
+            if _ingest_queue is None:
+                queue = ingest.IngestQueue(
+                    INGEST_CONFIG["journal_path"], write=write_workout_batch, prune=prune_idempotency_keys_periodically,
+                    batch_size=INGEST_CONFIG["batch_size"], linger_seconds=INGEST_CONFIG["linger_seconds"],
+                    max_pending=INGEST_CONFIG["max_pending"], fsync=INGEST_CONFIG["fsync"],
+                    prune_interval=INGEST_CONFIG["key_prune_interval"]
+                )
+                try:
+                    _ingest_queue = queue.start()
+                except (RuntimeError, OSError) as e:
+                    print(f"Cannot queue workouts, writing them directly: {e}")
+    return _ingest_queue
+
+def get_ingest_queue():
+    """The running write-behind queue, or None."""
+    return _ingest_queue
+
+def prune_idempotency_keys(days=None):
+    """Forgets the idempotency keys of workouts written over `days` days ago; returns how many."""
+    days = INGEST_CONFIG["key_retention_days"] if days is None else days
+    with transaction() as cur:
+        cur.execute(queries.PRUNE_IDEMPOTENCY_KEYS, (days,))
+        return cur.rowcount
+
+def prune_idempotency_keys_periodically():
+    """prune_idempotency_keys() at most once per INGEST_CONFIG["key_prune_interval"] in this process."""
+    global _last_key_prune
+    now = time.monotonic()
+    with _pool_lock:
+        if _last_key_prune is not None and now - _last_key_prune < INGEST_CONFIG["key_prune_interval"]:
+            return
+        _last_key_prune = now
+    try:
+        prune_idempotency_keys()
+    except DATABASE_ERRORS as e:
+        print(f"Could not prune idempotency keys: {e}")
+
+# --- REQUEST-SCOPED LOADING ---
+def _first(rows):
+    return rows[0] if rows else None
+
+# How fetch_batch() gets each cached read as part of one combined query (loader.py):
+# function name -> plan(*args) returning (query, params, finish), where
+# finish(rows) turns the query's rows into what the function returns.
+BATCH_PLANS = {
+    "get_user_profile": lambda user_id: (queries.USER_PROFILE, (user_id,), _first),
+    "get_all_users": lambda exclude_user_id: (queries.ALL_USERS, (exclude_user_id,), list),
+    "get_workout_history_page": lambda user_id, limit, cursor: (
+        *history_page_params(user_id, limit, cursor), lambda rows: build_history_page(rows, limit)),
+    "get_duration_series": lambda user_id, max_points: (
+        queries.DURATION_SERIES, {"user_id": user_id, "max_points": max_points}, list),
+    "get_friends": lambda user_id: (queries.FRIENDS, (user_id,), list),
+    "search_users": lambda user_id, query, limit, cursor: (
+        *search_users_params(user_id, query, limit, cursor), lambda rows: build_search_page(rows, limit)),
+    "get_friend_suggestions": lambda user_id, limit, max_friends, max_per_friend: (
+        queries.FRIEND_SUGGESTIONS,
+        {"user_id": user_id, "limit": limit, "max_friends": max_friends, "max_per_friend": max_per_friend}, list),
+    "get_active_goal": lambda user_id: (queries.ACTIVE_GOAL, (user_id,), _first),
+    "get_goal_progress": lambda user_id: (
+        queries.GOAL_PROGRESS, (user_id,), lambda rows: build_goal_progress(_first(rows))),
+    "get_exercise_catalog": lambda: (queries.EXERCISE_CATALOG, None, list),
+    "get_exercise_aliases": lambda: (queries.EXERCISE_ALIASES, None, dict),
+    "get_leaderboard": lambda: (queries.LEADERBOARD, None, list),
+    "get_friends_leaderboard": lambda user_id, top, neighbours: (
+        queries.FRIENDS_LEADERBOARD, {"user_id": user_id, "top": top, "neighbours": neighbours},
+        lambda rows: build_friends_leaderboard(rows, user_id, top)),
+    "get_workout_statistics": lambda user_id: (
+        queries.WORKOUT_STATISTICS, (user_id,), lambda rows: build_workout_statistics(rows[0])),
+    "get_personal_records": lambda user_id: (queries.PERSONAL_RECORDS, (user_id,), list),
+}
+
+def request_scope():
+    """Context in which each read runs at most once; wrap a page render (one rerun) in it."""
+    return query_cache.request_scope()
+
+def prefetch(*calls):
+    """Fetches several reads in one round trip, e.g. prefetch((get_user_profile, 1), (get_leaderboard,)).
+
+    Reads already cached are skipped and the rest run as one combined query;
+    their results fill the cache and the current request_scope(), where the
+    page's own calls then find them. Returns the results in call order.
+    """
+    return query_cache.prefetch(calls, _fetch_missing)
+
+def _fetch_missing(calls):
+    """prefetch()'s misses: those with a plan in one combined query, any others one by one."""
+    batched = [i for i, (func, _) in enumerate(calls) if func.__name__ in BATCH_PLANS]
+    results = {}
+    # The combined query (loader.py) is PostgreSQL's; SQLite has no round trips to save.
+    if len(batched) > 1 and not embedded():
+        results = dict(zip(batched, fetch_batch([(calls[i][0].__name__, calls[i][1]) for i in batched])))
+    return [results[i] if i in results else func.uncached(*args) for i, (func, args) in enumerate(calls)]
+
+@timed
+@replica_read
+def fetch_batch(calls):
+    """READ: Runs [(function name, args), ...] from BATCH_PLANS as one query; returns their results."""
+    plans = [BATCH_PLANS[name](*args) for name, args in calls]
+    with read_transaction() as cur:
+        results = loader.fetch_many(cur, [(query, params) for query, params, _ in plans])
+    return [finish(rows) for (_, _, finish), rows in zip(plans, results)]
 
 # --- SEEDING (for demonstration purposes) ---
+@writes
+@timed
 def seed_data():
     """Adds some sample data to the database."""
-    conn = get_db_connection()
     try:
-        with conn.cursor() as cur:
+        with transaction() as cur:
             # Check if data exists
             cur.execute("SELECT COUNT(*) FROM users")
             if cur.fetchone()[0] > 0:
@@ -318,18 +1155,14 @@ def seed_data():
             ]
             cur.executemany("INSERT INTO workouts (user_id, workout_date, duration_minutes) VALUES (%s, %s, %s)", workouts_to_add)
             
-            # Seed exercises
+            # Seed exercises (each repeats its workout's date)
             exercises_to_add = [
                 (1, 'Bench Press', 3, 10, 50.0), (1, 'Squat', 4, 8, 80.0), # Workout 1
                 (2, 'Running', 1, 1, 0), (2, 'Pull-ups', 5, 5, 0), # Workout 2
                 (3, 'Yoga', 1, 1, 0), # Workout 3
                 (4, 'Bench Press', 3, 12, 52.5), (4, 'Deadlift', 3, 6, 100.0) # Workout 4
             ]
-            cur.executemany("INSERT INTO exercises (workout_id, exercise_name, sets, reps, weight_kg) VALUES (%s, %s, %s, %s, %s)", exercises_to_add)
-
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Error seeding data: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
\ No newline at end of file
+            exercises_to_add = [(w, workouts_to_add[w - 1][1], *rest) for w, *rest in exercises_to_add]
+            cur.executemany("INSERT INTO exercises (workout_id, workout_date, exercise_name, sets, reps, weight_kg) VALUES (%s, %s, %s, %s, %s, %s)", exercises_to_add)
+    except DATABASE_ERRORS as e:
+        print(f"Error seeding data: {e}")
\ No newline at end of file
@@ -0,0 +1,256 @@
+# backend_async.py
+
+import asyncio
+
+import backend
+import queries
+import query_cache
+
+# Asyncio variant of the backend surface, for serving many concurrent requests
+# (e.g. a JSON API) from one event loop. It runs the same SQL as backend.py
+# (queries.py) through psycopg 3's async driver and pool, and returns the same
+# shapes. Needs psycopg 3 with its pool (pip install "psycopg[binary,pool]"),
+# which the rest of the app does not.
+#
+# Reads go through the same query cache as their sync counterparts, and writes
+# evict it exactly like them, so a process mixing both APIs shares cached reads
+# and never serves stale ones; writes also mark the session as having written
+# (routing.py). log_workout() takes an idempotency key and uses the write-behind
+# queue like backend.log_workout(). Differences from backend.py:
+#   - reads always go to the primary: there is no replica routing here;
+#   - PostgreSQL only: backend.STORAGE_CONFIG's SQLite engine is not supported;
+#   - there is no request_scope()/prefetch() batching; load_* run their reads
+#     concurrently instead.
+#
+#   await backend_async.open_pool()
+#   overview = await backend_async.load_user_overview(1)
+#   await backend_async.close_pool()
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+async def open_pool():
+    """Opens the process-wide async pool (sized like backend.POOL_CONFIG)."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    try:
+        from psycopg_pool import AsyncConnectionPool
+    except ImportError:
+        raise RuntimeError('The async backend needs psycopg 3 and its pool: pip install "psycopg[binary,pool]"') from None
+    async with _pool_lock:
+        if _pool is None:
+            pool = AsyncConnectionPool(
+                kwargs=backend.DB_CONFIG,
+                min_size=backend.POOL_CONFIG["minconn"],
+                max_size=backend.POOL_CONFIG["maxconn"],
+                timeout=backend.POOL_CONFIG["timeout"],
+                max_lifetime=backend.POOL_CONFIG["max_lifetime"],
+                check=AsyncConnectionPool.check_connection,
+                open=False,
+            )
+            await pool.open(wait=True)
+            _pool = pool
+    return _pool
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+async def get_pool_stats():
+    return (await open_pool()).get_stats()
+
+async def _fetch(query, params=None, one=False):
+    pool = await open_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            return await (cur.fetchone() if one else cur.fetchall())
+
+async def _cached(func, args, fetch):
+    """Awaits fetch() for sync read `func` called with `args`, through func's query cache entry."""
+    key = (func.__name__,) + func.bind(*args)
+    cache = func.cache or query_cache.default_cache
+    if not cache.enabled:
+        return await fetch()
+    hit, value = cache.lookup(key)
+    if hit:
+        return value
+    result = await fetch()
+    cache.store(key, result, func.ttl, func.tags(key[1:], result) if func.tags else (), value)
+    return result
+
+async def _execute(query, params=None):
+    pool = await open_pool()
+    async with pool.connection() as conn:
+        await conn.execute(query, params)
+
+# --- USER PROFILE ---
+async def get_user_profile(user_id):
+    return await _cached(backend.get_user_profile, (user_id,),
+                         lambda: _fetch(queries.USER_PROFILE, (user_id,), one=True))
+
+async def update_user_profile(user_id, name, email, weight):
+    await _execute(queries.UPDATE_USER_PROFILE, (name, email, weight, user_id))
+    query_cache.invalidate(f"user:{user_id}", "users")
+    backend.record_write()
+
+async def get_all_users(exclude_user_id):
+    return await _cached(backend.get_all_users, (exclude_user_id,),
+                         lambda: _fetch(queries.ALL_USERS, (exclude_user_id,)))
+
+# --- WORKOUTS ---
+async def log_workout(user_id, date, duration, exercises, idempotency_key=None):
+    """Logs a workout and its exercises in one transaction, as backend.log_workout() does.
+
+    Returns backend.WORKOUT_WRITTEN, WORKOUT_QUEUED or WORKOUT_DUPLICATE;
+    database errors are raised.
+    """
+    pool = await open_pool()
+    if backend.INGEST_CONFIG["enabled"] or idempotency_key is not None:
+        entry = backend.workout_entry(user_id, date, duration, exercises, idempotency_key)
+        # The queue may have to wait for room; not on the event loop.
+        if await asyncio.to_thread(backend.queue_workout, entry):
+            return backend.WORKOUT_QUEUED
+        try:
+            async with pool.connection() as conn:
+                async with conn.transaction():
+                    cur = await conn.execute(queries.CLAIM_IDEMPOTENCY_KEYS, ([entry['key']],))
+                    workout_ids = dict(await cur.fetchall())
+                    new = [entry] if workout_ids else []
+                    if new:
+                        workout_params, exercise_batch = backend.workout_batch_params(new, workout_ids)
+                        await conn.execute(queries.INSERT_WORKOUT_BATCH, workout_params)
+                        if exercise_batch:
+                            await conn.execute(queries.INSERT_EXERCISE_BATCH, exercise_batch)
+        finally:
+            backend.record_write()
+        # New names may have been added to the catalog; checking would mean a sync read.
+        backend.workouts_landed([entry], new, new_names=bool(exercises))
+        await asyncio.to_thread(backend.prune_idempotency_keys_periodically)
+        return backend.WORKOUT_WRITTEN if new else backend.WORKOUT_DUPLICATE
+    try:
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                cur = await conn.execute(queries.INSERT_WORKOUT, (user_id, date, duration))
+                workout_id = (await cur.fetchone())[0]
+                if exercises:
+                    await conn.execute(queries.INSERT_WORKOUT_EXERCISES, backend.exercise_params(workout_id, date, exercises))
+    finally:
+        backend.record_write()
+    backend.invalidate_workouts(user_id, [date])
+    if exercises:
+        # New names may have been added to the catalog; checking would mean a sync read.
+        query_cache.invalidate("exercise_catalog")
+    return backend.WORKOUT_WRITTEN
+
+async def get_user_workouts(user_id):
+    return await _fetch(queries.USER_WORKOUTS, (user_id,))
+
+async def get_workout_details(workout_id):
+    return await _fetch(queries.WORKOUT_DETAILS, (workout_id,))
+
+async def get_workout_history_page(user_id, limit=20, cursor=None):
+    async def fetch():
+        query, params = backend.history_page_params(user_id, limit, cursor)
+        return backend.build_history_page(await _fetch(query, params), limit)
+    return await _cached(backend.get_workout_history_page, (user_id, limit, cursor), fetch)
+
+async def get_duration_series(user_id, max_points=52):
+    return await _cached(backend.get_duration_series, (user_id, max_points),
+                         lambda: _fetch(queries.DURATION_SERIES, {"user_id": user_id, "max_points": max_points}))
+
+# --- FRIENDS ---
+async def get_friends(user_id):
+    return await _cached(backend.get_friends, (user_id,), lambda: _fetch(queries.FRIENDS, (user_id,)))
+
+async def add_friend(user_id, friend_id):
+    await _execute(queries.ADD_FRIEND, (user_id, friend_id))
+    query_cache.invalidate(f"friends:{user_id}")
+    backend.record_write()
+
+async def remove_friend(user_id, friend_id):
+    await _execute(queries.REMOVE_FRIEND, (user_id, friend_id))
+    query_cache.invalidate(f"friends:{user_id}")
+    backend.record_write()
+
+async def search_users(user_id, query, limit=20, cursor=None):
+    async def fetch():
+        sql_text, params = backend.search_users_params(user_id, query, limit, cursor)
+        return backend.build_search_page(await _fetch(sql_text, params), limit)
+    return await _cached(backend.search_users, (user_id, query, limit, cursor), fetch)
+
+async def get_friend_suggestions(user_id, limit=10, max_friends=200, max_per_friend=50):
+    params = {"user_id": user_id, "limit": limit, "max_friends": max_friends, "max_per_friend": max_per_friend}
+    return await _cached(backend.get_friend_suggestions, (user_id, limit, max_friends, max_per_friend),
+                         lambda: _fetch(queries.FRIEND_SUGGESTIONS, params))
+
+# --- GOALS ---
+async def set_goal(user_id, description, target_value):
+    pool = await open_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            await conn.execute(queries.DEACTIVATE_GOALS, (user_id,))
+            await conn.execute(queries.INSERT_GOAL, (user_id, description, target_value))
+    query_cache.invalidate(f"goals:{user_id}")
+    backend.record_write()
+
+async def get_active_goal(user_id):
+    return await _cached(backend.get_active_goal, (user_id,), lambda: _fetch(queries.ACTIVE_GOAL, (user_id,), one=True))
+
+async def get_goal_progress(user_id):
+    async def fetch():
+        return backend.build_goal_progress(await _fetch(queries.GOAL_PROGRESS, (user_id,), one=True))
+    return await _cached(backend.get_goal_progress, (user_id,), fetch)
+
+# --- BUSINESS INSIGHTS & LEADERBOARD ---
+async def get_leaderboard():
+    return await _cached(backend.get_leaderboard, (), lambda: _fetch(queries.LEADERBOARD))
+
+async def get_friends_leaderboard(user_id, top=3, neighbours=2):
+    async def fetch():
+        rows = await _fetch(queries.FRIENDS_LEADERBOARD, {"user_id": user_id, "top": top, "neighbours": neighbours})
+        return backend.build_friends_leaderboard(rows, user_id, top)
+    return await _cached(backend.get_friends_leaderboard, (user_id, top, neighbours), fetch)
+
+async def get_workout_statistics(user_id):
+    async def fetch():
+        return backend.build_workout_statistics(await _fetch(queries.WORKOUT_STATISTICS, (user_id,), one=True))
+    return await _cached(backend.get_workout_statistics, (user_id,), fetch)
+
+async def get_personal_records(user_id):
+    return await _cached(backend.get_personal_records, (user_id,), lambda: _fetch(queries.PERSONAL_RECORDS, (user_id,)))
+
+# --- PAGE-LEVEL READS ---
+async def load_user_overview(user_id):
+    """Fetches everything a user's dashboard shows, with the queries running concurrently.
+
+    Each read borrows its own pooled connection, so the total latency is that
+    of the slowest query rather than the sum of all of them.
+    """
+    profile, friends, goal, leaderboard, stats, records = await asyncio.gather(
+        get_user_profile(user_id),
+        get_friends(user_id),
+        get_active_goal(user_id),
+        get_leaderboard(),
+        get_workout_statistics(user_id),
+        get_personal_records(user_id),
+    )
+    return {
+        "profile": profile,
+        "friends": friends,
+        "active_goal": goal,
+        "leaderboard": leaderboard,
+        "statistics": stats,
+        "personal_records": records,
+    }
+
+async def load_progress_page(user_id, limit=20, cursor=None):
+    """Fetches one history page and the chart series concurrently."""
+    (workouts, next_cursor), series = await asyncio.gather(
+        get_workout_history_page(user_id, limit, cursor),
+        get_duration_series(user_id),
+    )
+    return {"workouts": workouts, "next_cursor": next_cursor, "duration_series": series}
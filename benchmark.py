@@ -0,0 +1,281 @@
+# benchmark.py
+
+import argparse
+import datetime
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import backend
+import datagen
+import query_cache
+
+# Times every backend function at p50/p95/p99 on synthetic datasets of several
+# sizes (datagen.py) and at several concurrency levels, and writes a JSON
+# report. Reports are stable (sorted keys, one entry per dataset size,
+# concurrency and function), so two versions can be compared with a plain diff
+# or with --baseline:
+#
+#   python benchmark.py --sizes 1000,10000 --concurrency 1,8 --output before.json
+#   python benchmark.py --sizes 1000,10000 --concurrency 1,8 --output after.json --baseline before.json
+#
+# Each size is loaded into its own schema (bench_<users>), see --reuse. The
+# query cache is off unless --cache is given, so the numbers are database
+# round trips rather than dictionary lookups. Write functions change the
+# benchmark dataset, never the application's tables.
+
+def _user(rng, s):
+    return rng.choice(s["users"])[0]
+
+def _deep_page(rng, s):
+    # A page starting at a random workout of its owner's history.
+    workout_id, user_id, workout_date = rng.choice(s["workouts"])
+    return (user_id, 20, (workout_date, workout_id))
+
+def _sample_exercises(rng):
+    names = rng.sample(list(datagen.EXERCISES), 3)
+    return [{"name": n, "sets": 3, "reps": 8, "weight": 60.0} for n in names]
+
+def _friends_page(rng, s):
+    # Everything the Friends & Leaderboard page reads, for backend.prefetch().
+    user_id = _user(rng, s)
+    return ((backend.get_user_profile, user_id), (backend.get_friends_leaderboard, user_id),
+            (backend.get_friends, user_id), (backend.get_friend_suggestions, user_id))
+
+def _unfriend(rng, s):
+    user_id, friend_id = _user(rng, s), _user(rng, s)
+    with backend.transaction() as cur:
+        cur.execute("DELETE FROM friends WHERE user_id = %s AND friend_id = %s", (user_id, friend_id))
+    return (user_id, friend_id)
+
+def _befriend(rng, s):
+    user_id, friend_id = _user(rng, s), _user(rng, s)
+    with backend.transaction() as cur:
+        cur.execute(
+            "INSERT INTO friends (user_id, friend_id) VALUES (%s, %s) ON CONFLICT DO NOTHING", (user_id, friend_id)
+        )
+    return (user_id, friend_id)
+
+# (name, function, builds the arguments from (rng, samples) outside the timed call, writes?)
+OPERATIONS = [
+    ("get_user_profile", backend.get_user_profile, lambda rng, s: (_user(rng, s),), False),
+    ("get_all_users", backend.get_all_users, lambda rng, s: (_user(rng, s),), False),
+    ("get_user_workouts", backend.get_user_workouts, lambda rng, s: (_user(rng, s),), False),
+    ("get_workout_details", backend.get_workout_details, lambda rng, s: (rng.choice(s["workouts"])[0],), False),
+    ("get_workout_history_page (first)", backend.get_workout_history_page,
+     lambda rng, s: (_user(rng, s), 20, None), False),
+    ("get_workout_history_page (deep)", backend.get_workout_history_page, _deep_page, False),
+    ("get_duration_series", backend.get_duration_series, lambda rng, s: (_user(rng, s),), False),
+    ("get_friends", backend.get_friends, lambda rng, s: (_user(rng, s),), False),
+    ("get_friends_leaderboard", backend.get_friends_leaderboard, lambda rng, s: (_user(rng, s),), False),
+    ("get_friend_suggestions", backend.get_friend_suggestions, lambda rng, s: (_user(rng, s),), False),
+    ("search_users", backend.search_users, lambda rng, s: (_user(rng, s), rng.choice(s["users"])[1][:2]), False),
+    ("get_active_goal", backend.get_active_goal, lambda rng, s: (_user(rng, s),), False),
+    ("get_goal_progress", backend.get_goal_progress, lambda rng, s: (_user(rng, s),), False),
+    ("get_leaderboard", backend.get_leaderboard, lambda rng, s: (), False),
+    ("get_workout_statistics", backend.get_workout_statistics, lambda rng, s: (_user(rng, s),), False),
+    ("get_personal_records", backend.get_personal_records, lambda rng, s: (_user(rng, s),), False),
+    ("prefetch (friends page)", backend.prefetch, _friends_page, False),
+    ("log_workout", backend.log_workout,
+     lambda rng, s: (_user(rng, s), datetime.date.today(), 45, _sample_exercises(rng)), True),
+    # Writes the profile back unchanged, so emails stay unique.
+    ("update_user_profile", backend.update_user_profile, lambda rng, s: rng.choice(s["users"]), True),
+    ("set_goal", backend.set_goal, lambda rng, s: (_user(rng, s), "Workout 4 times a week", 4), True),
+    ("add_friend", backend.add_friend, _unfriend, True),
+    ("remove_friend", backend.remove_friend, _befriend, True),
+]
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+def load_samples(rng, n=500):
+    """Picks random existing users (id, name, email, weight) and workouts (id, user, date)."""
+    with backend.transaction() as cur:
+        cur.execute("SELECT min(user_id), max(user_id) FROM users")
+        low, high = cur.fetchone()
+        cur.execute(
+            "SELECT user_id, name, email, weight_kg FROM users WHERE user_id = ANY(%s) ORDER BY user_id",
+            ([rng.randint(low, high) for _ in range(n)],)
+        )
+        users = cur.fetchall()
+        cur.execute("SELECT min(workout_id), max(workout_id) FROM workouts")
+        low, high = cur.fetchone()
+        workouts = []
+        if low is not None:
+            cur.execute(
+                "SELECT workout_id, user_id, workout_date FROM workouts WHERE workout_id = ANY(%s) ORDER BY workout_id",
+                ([rng.randint(low, high) for _ in range(n)],)
+            )
+            workouts = cur.fetchall()
+    if not users or not workouts:
+        raise RuntimeError("The benchmark dataset has no users or workouts")
+    return {"users": users, "workouts": workouts}
+
+def run_operation(func, make_args, samples, calls, concurrency, seed):
+    """Makes `calls` timed calls spread over `concurrency` threads; returns a result dict."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index, n):
+        rng = random.Random(f"{seed}:{index}")
+        mine, failed = [], 0
+        for _ in range(n):
+            try:
+                args = make_args(rng, samples)
+                started = time.perf_counter()
+                func(*args)
+            except Exception:
+                failed += 1
+                continue
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    shares = [calls // concurrency + (1 if i < calls % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(shares)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "calls": len(latencies),
+        "errors": sum(errors),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "mean_ms": ms(sum(latencies) / len(latencies) if latencies else None),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "calls_per_sec": round(len(latencies) / wall, 1) if wall > 0 else None,
+    }
+
+def _schema_has_data():
+    with backend.transaction() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM workouts)")
+        return cur.fetchone()[0]
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, report, max_regression=None):
+    """Prints p50/p95 changes against a baseline report; returns the entries that regressed."""
+    key = lambda r: (r["dataset_users"], r["concurrency"], r["function"])
+    old = {key(r): r for r in baseline["results"]}
+    regressions = []
+    print(f"{'dataset':>8} {'conc':>4}  {'function':<34} {'p50 ms':>17} {'p95 ms':>17} {'change':>8}")
+    for r in report["results"]:
+        before = old.get(key(r))
+        if not before or not before["p95_ms"] or r["p95_ms"] is None:
+            continue
+        change = (r["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        flag = ""
+        if max_regression is not None and change > max_regression:
+            regressions.append(r)
+            flag = "  REGRESSION"
+        print(
+            f"{r['dataset_users']:>8} {r['concurrency']:>4}  {r['function']:<34} "
+            f"{before['p50_ms']:>7} -> {r['p50_ms']:<7} {before['p95_ms']:>7} -> {r['p95_ms']:<7} {change:>+7.1f}%{flag}"
+        )
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark backend functions on synthetic datasets.")
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated user counts, one dataset each")
+    parser.add_argument("--workouts-per-user", type=int, default=50)
+    parser.add_argument("--exercises-per-workout", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end-date", type=datetime.date.fromisoformat, help="passed to datagen (default today)")
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated thread counts")
+    parser.add_argument("--calls", type=int, default=200, help="timed calls per function and concurrency level")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed calls before each measurement")
+    parser.add_argument("--only", help="comma-separated substrings; benchmark only matching functions")
+    parser.add_argument("--read-only", action="store_true", help="skip functions that write")
+    parser.add_argument("--cache", action="store_true", help="leave the query cache on")
+    parser.add_argument("--reuse", action="store_true", help="reuse a bench_<users> schema that already has data")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--max-regression", type=float, help="exit 1 if any p95 grew by more than this percent")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    operations = [
+        op for op in OPERATIONS
+        if not (args.read_only and op[3])
+        and (not args.only or any(part in op[0] for part in args.only.split(",")))
+    ]
+    backend.POOL_CONFIG["maxconn"] = max(backend.POOL_CONFIG["maxconn"], max(levels))
+    query_cache.default_cache.enabled = args.cache
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "settings": {k: str(v) if isinstance(v, datetime.date) else v for k, v in vars(args).items()},
+        },
+        "datasets": [],
+        "results": [],
+    }
+
+    for users in sizes:
+        schema = f"bench_{users}"
+        datagen.prepare_schema(schema)
+        load = None
+        if not (args.reuse and _schema_has_data()):
+            datagen.prepare_schema(schema, drop=True)
+            print(f"Loading {users} users into {schema} ...")
+            load = datagen.generate(users, args.workouts_per_user, args.exercises_per_workout,
+                                    seed=args.seed, end_date=args.end_date)
+        with backend.transaction() as cur:
+            cur.execute("SHOW server_version")
+            report["meta"]["server_version"] = cur.fetchone()[0]
+        report["datasets"].append({"users": users, "schema": schema, "load": load})
+
+        samples = load_samples(random.Random(f"{args.seed}:samples"))
+        for concurrency in levels:
+            for name, func, make_args, _ in operations:
+                run_operation(func, make_args, samples, args.warmup, 1, f"{args.seed}:warmup:{name}")
+                result = run_operation(func, make_args, samples, args.calls, concurrency, f"{args.seed}:{name}")
+                result.update({"dataset_users": users, "concurrency": concurrency, "function": name})
+                report["results"].append(result)
+                print(
+                    f"{users:>8} users  c={concurrency:<3} {name:<34} p50 {result['p50_ms']:>8} ms  "
+                    f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {result['errors']}"
+                )
+    backend.use_schema(None)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True, default=str)
+        f.write("\n")
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.max_regression)
+        if regressions:
+            print(f"{len(regressions)} functions regressed by more than {args.max_regression}% at p95")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,238 @@
+# catalog.py
+
+import argparse
+import difflib
+import sys
+import time
+
+import psycopg2
+from psycopg2 import sql
+
+import backend
+import partitioning
+import queries
+import query_cache
+
+# The exercise catalog (migration 0010): canonical exercise types, the aliases
+# they are known by, and the integer exercise_type_id exercise rows reference.
+# Per-exercise stats and personal records group on that id, so "bench press",
+# "Bench  Press" and "bench" are one exercise.
+#
+#   python catalog.py backfill              # fill exercise_type_id on existing rows, online
+#   python catalog.py status
+#   python catalog.py suggest "benchpress"
+#   python catalog.py alias "flat bench" "Bench Press"
+#   python catalog.py merge "Bench" "Bench Press"
+#
+# The migration backfills small tables itself. On large ones it leaves the
+# column NULL for `backfill`, which works through exercises in short keyset
+# batches, each its own transaction, so writers are never blocked for long, and
+# then builds the per-type index without locking out writes. Rows without a
+# type are left out of personal records and analytics until they are filled.
+
+BACKFILL_BATCH_SIZE = 5000
+
+# How close (difflib ratio, 0..1) a name must be to an alias to count as a typo of it.
+MATCH_CUTOFF = 0.85
+
+INDEX_NAME = "exercises_exercise_type_id_workout_id_idx"
+
+def suggest(name, limit=5, cutoff=0.6):
+    """Canonical names of the exercise types closest to `name`, best first."""
+    key = backend.normalize_exercise_name(name)
+    if not key:
+        return []
+    aliases = backend.get_exercise_aliases()
+    suggestions = []
+    for alias in difflib.get_close_matches(key, aliases, n=limit * 3, cutoff=cutoff):
+        if aliases[alias] not in suggestions:
+            suggestions.append(aliases[alias])
+    return suggestions[:limit]
+
+def match(name):
+    """The canonical name `name` stands for: a known alias, else a near-certain typo of one.
+
+    Returns None for names that are new to the catalog.
+    """
+    key = backend.normalize_exercise_name(name)
+    aliases = backend.get_exercise_aliases()
+    if key in aliases:
+        return aliases[key]
+    close = suggest(name, limit=1, cutoff=MATCH_CUTOFF)
+    return close[0] if close else None
+
+def resolve_types(cur, names, known=None):
+    """Returns {name: exercise_type_id} for `names`, adding new ones to the catalog.
+
+    `known` is an optional dict of already resolved names, updated in place, so
+    bulk loaders ask the database about each distinct name only once.
+    """
+    known = {} if known is None else known
+    missing = sorted({name for name in names if name not in known})
+    if missing:
+        cur.execute(queries.RESOLVE_EXERCISE_TYPES, (missing,))
+        known.update(cur.fetchall())
+        query_cache.invalidate("exercise_catalog")
+    return {name: known[name] for name in names}
+
+def _exercise_type(cur, name):
+    cur.execute(queries.EXERCISE_TYPE_BY_NAME, (name,))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"Unknown exercise: {name!r}")
+    return row
+
+def add_alias(alias, name):
+    """Makes `alias` another name of the exercise type `name`; returns False if the alias was taken."""
+    with backend.transaction() as cur:
+        type_id, _ = _exercise_type(cur, name)
+        cur.execute(queries.ADD_EXERCISE_ALIAS, (alias, type_id))
+        added = cur.rowcount == 1
+    query_cache.invalidate("exercise_catalog")
+    return added
+
+def merge(from_name, into_name):
+    """Folds the exercise type `from_name` into `into_name`: aliases, exercises and records.
+
+    Returns the number of exercise rows moved.
+    """
+    with backend.transaction() as cur:
+        from_id, _ = _exercise_type(cur, from_name)
+        into_id, _ = _exercise_type(cur, into_name)
+        if from_id == into_id:
+            return 0
+        params = {"from": from_id, "into": into_id}
+        cur.execute(queries.MERGE_EXERCISE_ALIASES, params)
+        cur.execute(queries.MERGE_EXERCISES, params)
+        moved = cur.rowcount
+        cur.execute(queries.DELETE_EXERCISE_TYPE, (from_id,))
+    # Any user's records may have changed.
+    query_cache.clear()
+    return moved
+
+def backfill(batch_size=BACKFILL_BATCH_SIZE, after_id=0, progress=None):
+    """Fills exercise_type_id on existing rows in batches, then builds the per-type index.
+
+    Each batch is its own short transaction; pass `after_id` (the last id
+    reported to `progress(last_id, rows_seen)`) to resume an interrupted run.
+    Returns a report dict.
+    """
+    started = time.perf_counter()
+    batches = 0
+    while True:
+        with backend.transaction() as cur:
+            cur.execute(queries.BACKFILL_EXERCISE_TYPES, (after_id, batch_size))
+            last_id = cur.fetchone()[0]
+        if last_id is None:
+            break
+        after_id = last_id
+        batches += 1
+        if progress:
+            progress(last_id, batches * batch_size)
+    index = build_index()
+    with backend.transaction() as cur:
+        cur.execute(queries.UNTYPED_EXERCISES)
+        untyped = cur.fetchone()[0]
+    query_cache.clear()
+    return {
+        "batches": batches,
+        "last_id": after_id,
+        "untyped": untyped,
+        "index": index,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def build_index():
+    """Creates the (exercise_type_id, workout_id) index without blocking writes, if missing.
+
+    Returns 'exists' or 'created'.
+    """
+    with backend.transaction() as cur:
+        cur.execute(queries.EXERCISE_TYPE_INDEX_VALID)
+        if cur.fetchone()[0]:
+            return "exists"
+        partitioned = partitioning.is_partitioned(cur)
+        parts = [p["name"] for p in partitioning.partitions(cur, "exercises")] if partitioned else []
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    conn = psycopg2.connect(**backend.DB_CONFIG)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            if not partitioned:
+                # A previous attempt that failed leaves an invalid index behind.
+                cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(INDEX_NAME)))
+                cur.execute(sql.SQL("CREATE INDEX CONCURRENTLY {} ON exercises (exercise_type_id, workout_id)").format(
+                    sql.Identifier(INDEX_NAME)))
+                return "created"
+            # Partitioned tables cannot be indexed concurrently: build an index on
+            # the parent only, then each partition's concurrently, and attach them.
+            cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON ONLY exercises (exercise_type_id, workout_id)").format(
+                sql.Identifier(INDEX_NAME)))
+            for part in parts:
+                part_index = f"{part}_exercise_type_id_workout_id_idx"
+                cur.execute(sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} (exercise_type_id, workout_id)").format(
+                    sql.Identifier(part_index), sql.Identifier(part)))
+                cur.execute(sql.SQL("ALTER INDEX {} ATTACH PARTITION {}").format(
+                    sql.Identifier(INDEX_NAME), sql.Identifier(part_index)))
+    finally:
+        conn.close()
+    return "created"
+
+def status():
+    """Catalog size and how many exercise rows still lack a type."""
+    with backend.transaction() as cur:
+        cur.execute(queries.UNTYPED_EXERCISES)
+        untyped = cur.fetchone()[0]
+        cur.execute(queries.EXERCISE_TYPE_INDEX_VALID)
+        indexed = cur.fetchone()[0]
+    return {
+        "types": len(backend.get_exercise_catalog()),
+        "aliases": len(backend.get_exercise_aliases()),
+        "untyped": untyped,
+        "indexed": indexed,
+    }
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Manage the exercise catalog.")
+    parser.add_argument("command", choices=("backfill", "status", "suggest", "alias", "merge"))
+    parser.add_argument("names", nargs="*", help="suggest: NAME; alias: ALIAS NAME; merge: FROM INTO")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--after-id", type=int, default=0, help="resume a backfill after this exercise_id")
+    args = parser.parse_args(argv)
+    expected = {"suggest": 1, "alias": 2, "merge": 2}.get(args.command, 0)
+    if len(args.names) != expected:
+        parser.error(f"{args.command} takes {expected} name(s)")
+
+    backend.initialize_database()
+    if args.command == "backfill":
+        report = backfill(args.batch_size, args.after_id,
+                          progress=lambda last_id, rows: print(f"  up to exercise_id {last_id}", flush=True))
+        print(
+            f"Backfilled in {report['batches']} batches ({report['seconds']}s); index {report['index']}; "
+            f"{report['untyped']} rows without a type."
+        )
+        return 0 if report["untyped"] == 0 else 1
+    if args.command == "suggest":
+        for name in suggest(args.names[0]):
+            print(name)
+        return 0
+    try:
+        if args.command == "alias":
+            added = add_alias(*args.names)
+            print("Alias added." if added else f"{args.names[0]!r} is already an alias; use merge to move it.")
+            return 0 if added else 1
+        if args.command == "merge":
+            print(f"Moved {merge(*args.names)} exercises.")
+            return 0
+    except ValueError as e:
+        print(e)
+        return 1
+
+    report = status()
+    print(f"{report['types']} exercise types, {report['aliases']} aliases")
+    print(f"{report['untyped']} exercises without a type; index {'ready' if report['indexed'] else 'missing'}")
+    return 0 if report["untyped"] == 0 and report["indexed"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,142 @@
+# change_feed.py
+
+import argparse
+import json
+import select
+import sys
+import threading
+import time
+
+import psycopg2
+
+# Listens on the channel migration 0012's triggers NOTIFY, so that writes made
+# by other processes (other app servers, importer.py, goals.py, psql) evict
+# this process's cached reads as soon as they commit, instead of when the TTLs
+# run out. backend.start_change_feed() runs one ChangeFeed per process, on a
+# dedicated primary connection (replicas do not deliver notifications):
+#
+#   feed = ChangeFeed(backend.DB_CONFIG, apply=backend.apply_change, reset=backend.reset_caches)
+#   feed.start()
+#
+# Notifications sent while the listener is disconnected are lost, so every
+# (re)connect resets the caches. Only notifications from the schema the
+# connection's search_path selects are applied. This process's own writes come
+# back too; evicting their entries a second time is harmless.
+#
+#   python change_feed.py              # print changes as they arrive
+
+CHANNEL = "fitness_changes"
+
+class ChangeFeed:
+    """Background listener applying change notifications to the caches."""
+
+    def __init__(self, conn_kwargs, apply, reset, poll_seconds=1.0, max_reconnect_delay=30.0):
+        self.conn_kwargs = conn_kwargs
+        self.apply = apply              # apply(change dict) for each notification of our schema
+        self.reset = reset              # reset() after each (re)connect
+        self.poll_seconds = poll_seconds
+        self.max_reconnect_delay = max_reconnect_delay
+        self.schema = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._versions = {}             # table -> number of changes applied
+        self._stats = {"connected": False, "notifications": 0, "ignored": 0, "errors": 0, "reconnects": 0,
+                       "last_change_at": None}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def version(self, *tables):
+        """A number that grows whenever a change to any of `tables` is applied (or the caches are reset)."""
+        with self._lock:
+            return sum(self._versions.get(table, 0) for table in tables) + self._versions.get(None, 0)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, versions=dict(self._versions))
+
+    def _bump(self, table, **counters):
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+            for name, n in counters.items():
+                self._stats[name] += n
+            self._stats["last_change_at"] = time.time()
+
+    def _run(self):
+        delay = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.conn_kwargs)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                    cur.execute("SELECT current_schema()")
+                    self.schema = cur.fetchone()[0]
+                self.reset()
+                self._bump(None)
+                with self._lock:
+                    self._stats["connected"] = True
+                delay = 1.0
+                self._listen(conn)
+            except (psycopg2.Error, OSError) as e:
+                print(f"Change feed disconnected: {e}")
+            finally:
+                with self._lock:
+                    self._stats["connected"] = False
+                if conn is not None:
+                    conn.close()
+            if not self._stop.wait(delay):
+                delay = min(delay * 2, self.max_reconnect_delay)
+                with self._lock:
+                    self._stats["reconnects"] += 1
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], self.poll_seconds) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                self._handle(conn.notifies.pop(0).payload)
+
+    def _handle(self, payload):
+        try:
+            change = json.loads(payload)
+            if change.get("schema") != self.schema:
+                with self._lock:
+                    self._stats["ignored"] += 1
+                return
+            self.apply(change)
+        except Exception as e:
+            print(f"Change feed could not apply {payload[:200]!r}: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+            return
+        self._bump(change["table"], notifications=1)
+
+def main(argv):
+    import backend
+
+    parser = argparse.ArgumentParser(description="Print change notifications as they arrive.")
+    parser.parse_args(argv)
+    backend.initialize_database()
+    feed = ChangeFeed(backend.DB_CONFIG, apply=lambda change: print(json.dumps(change)), reset=lambda: None).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        feed.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,330 @@
+# datagen.py
+
+import argparse
+import csv
+import datetime
+import io
+import random
+import sys
+import time
+
+from psycopg2 import sql
+
+import backend
+import catalog
+import queries
+
+# Deterministic synthetic dataset for load tests and benchmarks. The same seed,
+# parameters and end date always produce the same users, friendships, goals,
+# workouts and exercises (only the ids depend on what the sequences hand out),
+# so benchmark runs of different versions measure the same data. Rows are
+# streamed into PostgreSQL with COPY in chunks, so memory use does not grow
+# with the dataset. About 100k users and 50M exercises:
+#
+#   python datagen.py --schema bench --users 100000 --workouts-per-user 170 --exercises-per-workout 3
+#
+# With --schema the dataset goes into its own schema (created and migrated on
+# demand) next to the application's tables, see backend.use_schema().
+DEFAULT_CHUNK_ROWS = 50000
+
+FIRST_NAMES = [
+    "Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn",
+    "Priya", "Arjun", "Mei", "Hiro", "Lena", "Omar", "Sofia", "Mateo", "Aisha", "Noah",
+    "Emma", "Liam", "Olivia", "Ethan", "Zara", "Ivan", "Chloe", "Kofi", "Nina", "Luca",
+]
+
+LAST_NAMES = [
+    "Smith", "Patel", "Garcia", "Chen", "Kim", "Nguyen", "Müller", "Rossi", "Silva", "Khan",
+    "Johnson", "Brown", "Lopez", "Sato", "Ivanova", "Okafor", "Dubois", "Jensen", "Cohen", "Singh",
+]
+
+# name -> (popularity, kind, typical working weight as a fraction of body weight)
+EXERCISES = {
+    "Bench Press": (10, "lift", 0.8),
+    "Squat": (9, "lift", 1.1),
+    "Deadlift": (8, "lift", 1.3),
+    "Overhead Press": (5, "lift", 0.5),
+    "Rows": (5, "lift", 0.7),
+    "Lat Pulldown": (4, "lift", 0.7),
+    "Leg Press": (4, "lift", 1.8),
+    "Hip Thrust": (3, "lift", 1.2),
+    "Bicep Curls": (5, "lift", 0.2),
+    "Lunges": (3, "lift", 0.4),
+    "Calf Raises": (2, "lift", 0.6),
+    "Pull-ups": (5, "bodyweight", 0),
+    "Tricep Dips": (3, "bodyweight", 0),
+    "Plank": (3, "bodyweight", 0),
+    "Running": (8, "cardio", 0),
+    "Cycling": (5, "cardio", 0),
+    "Rowing": (3, "cardio", 0),
+    "Yoga": (3, "cardio", 0),
+}
+
+# Relative likelihood of training on Monday ... Sunday.
+WEEKDAY_WEIGHTS = (1.0, 0.95, 0.85, 0.9, 0.65, 0.75, 0.5)
+
+# Goals are evaluated as workouts per week (goals.py, get_goal_progress), so
+# every generated target has to be one.
+GOAL_TEMPLATES = [
+    ("Workout {} times a week", 2, 6),
+]
+
+class _CopyBuffer:
+    """CSV rows waiting to be COPYed into one table."""
+
+    def __init__(self, statement):
+        self.statement = statement
+        self._reset()
+
+    def _reset(self):
+        self.buf = io.StringIO()
+        self.writer = csv.writer(self.buf)
+        self.rows = 0
+
+    def add(self, row):
+        self.writer.writerow(row)
+        self.rows += 1
+
+    def flush(self, cur):
+        """COPYs the buffered rows; returns how many there were."""
+        rows = self.rows
+        if rows:
+            self.buf.seek(0)
+            cur.copy_expert(self.statement, self.buf)
+        self._reset()
+        return rows
+
+def _user_profiles(rng, users, span_days):
+    """Returns one (first, last, weight, first_day, last_day, intensity) per user.
+
+    Days count backwards from the end date. Sign-ups grow over time, a quarter
+    of the users stop training at some point, and how often people train is
+    heavy-tailed.
+    """
+    profiles = []
+    for _ in range(users):
+        first_day = max(1, int(span_days * rng.random() ** 1.5))
+        last_day = int(first_day * rng.random()) if rng.random() < 0.25 else 0
+        weight = round(min(140.0, max(45.0, rng.gauss(75, 13))), 1)
+        intensity = rng.lognormvariate(0, 0.6)
+        profiles.append((rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), weight, first_day, last_day, intensity))
+    return profiles
+
+def _workout_counts(profiles, total):
+    """Splits `total` workouts across users in proportion to activity, summing exactly to `total`."""
+    weights = [(first_day - last_day + 1) * intensity for _, _, _, first_day, last_day, intensity in profiles]
+    scale = total / sum(weights) if weights else 0
+    counts, cumulative, assigned = [], 0.0, 0
+    for w in weights:
+        cumulative += w * scale
+        n = round(cumulative) - assigned
+        counts.append(n)
+        assigned += n
+    return counts
+
+def _program(rng, weight):
+    """Picks a user's regular exercises and their starting working weights."""
+    names = list(EXERCISES)
+    popularity = [EXERCISES[n][0] for n in names]
+    size = rng.randint(3, 8)
+    program = {}
+    while len(program) < size:
+        name = rng.choices(names, popularity)[0]
+        _, kind, ratio = EXERCISES[name]
+        program[name] = weight * ratio * rng.lognormvariate(0, 0.25) if kind == "lift" else None
+    return program
+
+def _exercise_row(rng, workout_id, workout_date, name, type_id, base_weight, progress):
+    kind = EXERCISES[name][1]
+    if kind == "lift":
+        # Working weight climbs about 30% over the user's history, in 2.5 kg steps.
+        load = base_weight * (0.85 + 0.3 * progress + rng.gauss(0, 0.04))
+        weight = max(2.5, round(load / 2.5) * 2.5)
+        return (workout_id, workout_date, name, type_id, rng.randint(3, 5), rng.choice((5, 6, 8, 8, 10, 10, 12)), weight)
+    if kind == "bodyweight":
+        return (workout_id, workout_date, name, type_id, rng.randint(2, 5), rng.randint(5, 20), None)
+    return (workout_id, workout_date, name, type_id, 1, 1, None)
+
+def _reserve_ids(cur, statement, n):
+    cur.execute(statement, (n,))
+    return [row[0] for row in cur.fetchall()]
+
+def generate(users=1000, workouts_per_user=50, exercises_per_workout=3.0, avg_friends=10, years=2,
+             seed=0, end_date=None, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None):
+    """Loads a synthetic dataset into the tables on the current search_path.
+
+    Returns a report dict with row counts, elapsed seconds and rows/sec.
+    `progress(report)` is called after every committed chunk of workouts.
+    """
+    end_date = end_date or datetime.date.today()
+    span_days = max(1, int(years * 365))
+    started = time.perf_counter()
+    report = {"users": 0, "friends": 0, "goals": 0, "workouts": 0, "exercises": 0}
+
+    # Separate streams per table, so e.g. a change to goal generation does not
+    # reshuffle the workouts.
+    profiles = _user_profiles(random.Random(f"{seed}:users"), users, span_days)
+    counts = _workout_counts(profiles, users * workouts_per_user)
+    day_strings = [(end_date - datetime.timedelta(days=d)).isoformat() for d in range(span_days + 1)]
+    day_weights = [WEEKDAY_WEIGHTS[(end_date - datetime.timedelta(days=d)).weekday()] for d in range(span_days + 1)]
+
+    # --- users ---
+    with backend.transaction() as cur:
+        user_ids = _reserve_ids(cur, queries.RESERVE_USER_IDS, users) if users else []
+    copy_users = _CopyBuffer(queries.COPY_USERS)
+    for start in range(0, users, chunk_rows):
+        with backend.transaction() as cur:
+            for user_id, (first, last, weight, _, _, _) in zip(user_ids[start:start + chunk_rows], profiles[start:start + chunk_rows]):
+                email = f"{first}.{last}.{user_id}@example.com".lower()
+                copy_users.add((user_id, f"{first} {last}", email, weight))
+            report["users"] += copy_users.flush(cur)
+
+    # --- friends: mostly within a neighbourhood of ids, some long-range, heavy-tailed degrees ---
+    rng = random.Random(f"{seed}:friends")
+    copy_friends = _CopyBuffer(queries.COPY_FRIENDS_STAGING)
+    with backend.transaction() as cur:
+        cur.execute(queries.CREATE_FRIENDS_STAGING)
+        for i in range(users if users > 1 else 0):
+            degree = min(users - 1, 500, round(avg_friends / 2 * rng.paretovariate(2)))
+            for _ in range(degree):
+                if rng.random() < 0.8:
+                    j = (i + rng.choice((-1, 1)) * rng.randint(1, 50)) % users
+                else:
+                    j = rng.randrange(users)
+                if j == i:
+                    continue
+                copy_friends.add((user_ids[i], user_ids[j]))
+                if rng.random() < 0.6:
+                    copy_friends.add((user_ids[j], user_ids[i]))
+            if copy_friends.rows >= chunk_rows:
+                copy_friends.flush(cur)
+        copy_friends.flush(cur)
+        cur.execute(queries.INSERT_FRIENDS_FROM_STAGING)
+        report["friends"] = cur.rowcount
+
+    # --- goals: a few past ones, the latest usually still active ---
+    rng = random.Random(f"{seed}:goals")
+    copy_goals = _CopyBuffer(queries.COPY_GOALS)
+    with backend.transaction() as cur:
+        for user_id, (_, _, _, first_day, last_day, _) in zip(user_ids, profiles):
+            if rng.random() >= 0.6:
+                continue
+            starts = sorted((rng.randint(last_day, first_day) for _ in range(rng.randint(1, 3))), reverse=True)
+            for k, start_day in enumerate(starts):
+                description, low, high = rng.choice(GOAL_TEMPLATES)
+                target = rng.randint(low, high)
+                latest = k == len(starts) - 1
+                active = latest and last_day == 0 and rng.random() < 0.8
+                end = None if active else day_strings[starts[k + 1] if not latest else last_day]
+                copy_goals.add((user_id, description.format(target), target, day_strings[start_day], end, active))
+            if copy_goals.rows >= chunk_rows:
+                report["goals"] += copy_goals.flush(cur)
+        report["goals"] += copy_goals.flush(cur)
+
+    # --- workouts and exercises, committed every `chunk_rows` rows ---
+    rng = random.Random(f"{seed}:workouts")
+    copy_workouts = _CopyBuffer(queries.COPY_WORKOUTS)
+    copy_exercises = _CopyBuffer(queries.COPY_EXERCISES)
+    reserved = []
+    with backend.transaction() as cur:
+        exercise_types = catalog.resolve_types(cur, list(EXERCISES))
+
+    def flush():
+        with backend.transaction() as cur:
+            report["workouts"] += copy_workouts.flush(cur)
+            report["exercises"] += copy_exercises.flush(cur)
+        if progress:
+            progress(report)
+
+    for user_id, (_, _, weight, first_day, last_day, _), n in zip(user_ids, profiles, counts):
+        if not n:
+            continue
+        program = _program(rng, weight)
+        names = list(program)
+        duration = rng.choice((30, 45, 45, 60, 60, 75, 90))
+        active_days = first_day - last_day
+        days = []
+        while len(days) < n:
+            d = last_day + int(rng.random() * (active_days + 1))
+            if rng.random() < day_weights[d]:
+                days.append(d)
+        days.sort(reverse=True)
+        for d in days:
+            if not reserved:
+                with backend.transaction() as cur:
+                    reserved = _reserve_ids(cur, queries.RESERVE_WORKOUT_IDS, chunk_rows)
+                reserved.reverse()
+            workout_id = reserved.pop()
+            copy_workouts.add((workout_id, user_id, day_strings[d], max(10, min(180, int(rng.gauss(duration, 12))))))
+            k = max(1, round(rng.gauss(exercises_per_workout, 1.0)))
+            chosen = rng.sample(names, k) if k <= len(names) else rng.choices(names, k=k)
+            progress_fraction = (first_day - d) / active_days if active_days else 1.0
+            for name in chosen:
+                copy_exercises.add(_exercise_row(
+                    rng, workout_id, day_strings[d], name, exercise_types[name], program[name], progress_fraction
+                ))
+        if copy_workouts.rows + copy_exercises.rows >= chunk_rows:
+            flush()
+    if copy_workouts.rows or copy_exercises.rows:
+        flush()
+
+    with backend.transaction() as cur:
+        for table in ("users", "friends", "goals", "workouts", "exercises", "weekly_activity", "personal_records"):
+            cur.execute(f"ANALYZE {table}")
+
+    elapsed = time.perf_counter() - started
+    rows = sum(report.values())
+    report.update({
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else float(rows),
+        "seed": seed,
+        "end_date": end_date.isoformat(),
+    })
+    return report
+
+def prepare_schema(schema, drop=False):
+    """Creates (or, with `drop`, recreates) `schema` and points the backend at it, migrated."""
+    with backend.transaction() as cur:
+        if drop:
+            cur.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(schema)))
+        cur.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(schema)))
+    backend.use_schema(schema)
+    backend.initialize_database()
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Load a deterministic synthetic dataset through COPY.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workouts-per-user", type=int, default=50, help="average; activity varies a lot per user")
+    parser.add_argument("--exercises-per-workout", type=float, default=3.0, help="average")
+    parser.add_argument("--friends", type=int, default=10, help="average friends per user")
+    parser.add_argument("--years", type=float, default=2, help="how far back the history goes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end-date", type=datetime.date.fromisoformat,
+                        help="last day of the history (default today); fix it for reproducible datasets")
+    parser.add_argument("--schema", help="load into this schema instead of the application tables")
+    parser.add_argument("--drop", action="store_true", help="drop the schema first")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="rows per committed transaction")
+    args = parser.parse_args(argv)
+
+    if args.schema:
+        prepare_schema(args.schema, args.drop)
+    else:
+        backend.initialize_database()
+
+    def progress(report):
+        print(f"  committed {report['workouts']} workouts, {report['exercises']} exercises")
+
+    report = generate(
+        args.users, args.workouts_per_user, args.exercises_per_workout, args.friends, args.years,
+        args.seed, args.end_date, args.chunk_rows, progress,
+    )
+    print(
+        f"Loaded {report['users']} users, {report['friends']} friendships, {report['goals']} goals, "
+        f"{report['workouts']} workouts and {report['exercises']} exercises "
+        f"in {report['seconds']}s ({report['rows_per_sec']} rows/sec)"
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
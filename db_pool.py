@@ -0,0 +1,219 @@
+# db_pool.py
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(PoolError):
+    """Raised when no connection could be borrowed within the borrow timeout."""
+
+
+class ConnectionPool:
+    """A thread-safe, bounded pool of psycopg2 connections.
+
+    `minconn` connections are opened up front and more are created lazily up
+    to `maxconn`. Idle connections are health-checked before being handed out
+    again, and connections older than `max_lifetime` seconds are recycled;
+    those closed this way are not replaced until a borrow needs one, so the
+    pool can shrink below `minconn` while it is quiet.
+    """
+
+    def __init__(self, conn_kwargs, minconn=1, maxconn=10, timeout=5.0,
+                 check_after=30.0, max_lifetime=3600.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("expected 0 <= minconn <= maxconn and maxconn >= 1")
+        self.conn_kwargs = dict(conn_kwargs)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle = deque()       # (conn, created_at, last_used_at)
+        self._in_use = {}          # id(conn) -> created_at
+        self._size = 0             # open connections + connections being opened
+        self._closed = False
+        self._stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "borrows": 0,
+            "returns": 0,
+            "borrow_timeouts": 0,
+            "health_check_failures": 0,
+            "total_wait_seconds": 0.0,
+        }
+
+        for _ in range(minconn):
+            conn = self._connect()
+            with self._cond:
+                self._stats["connections_created"] += 1
+                self._size += 1
+                self._idle.append((conn, time.monotonic(), time.monotonic()))
+
+    # --- CONNECTION LIFECYCLE ---
+    def _connect(self):
+        return psycopg2.connect(**self.conn_kwargs)
+
+    def _discard(self, conn):
+        """Closes a connection and frees its slot. Caller must not hold the lock."""
+        try:
+            if not conn.closed:
+                conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["connections_closed"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn, created_at, last_used_at):
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if now - created_at > self.max_lifetime:
+            return False
+        if now - last_used_at < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    # --- BORROW / RETURN ---
+    def getconn(self, timeout=None):
+        """Borrows a connection, waiting up to `timeout` seconds for one to free up."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            candidate = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("connection pool is closed")
+                    if self._idle:
+                        candidate = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["borrow_timeouts"] += 1
+                        raise PoolTimeout(
+                            f"no database connection available within {timeout:.1f}s "
+                            f"(pool size {self.maxconn})"
+                        )
+                    self._cond.wait(remaining)
+
+            if candidate is None:
+                try:
+                    conn = self._connect()
+                except psycopg2.Error:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+            else:
+                conn, created_at, last_used_at = candidate
+                if not self._is_healthy(conn, created_at, last_used_at):
+                    self._discard(conn)
+                    continue
+
+            with self._cond:
+                if candidate is None:
+                    self._stats["connections_created"] += 1
+                self._in_use[id(conn)] = created_at
+                self._stats["borrows"] += 1
+                self._stats["total_wait_seconds"] += time.monotonic() - started
+            return conn
+
+    def putconn(self, conn, close=False):
+        """Returns a borrowed connection, rolling back any transaction left open."""
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+            self._stats["returns"] += 1
+        if created_at is None:
+            raise PoolError("trying to return a connection that was not borrowed from this pool")
+
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        if close or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that borrows a connection and always returns it."""
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken or conn.closed)
+
+    @contextmanager
+    def transaction(self, timeout=None, cursor_factory=None):
+        """Yields a cursor inside a transaction: commit on success, rollback on error."""
+        with self.connection(timeout) as conn:
+            try:
+                with conn.cursor(cursor_factory=cursor_factory) as cur:
+                    yield cur
+                conn.commit()
+            except BaseException:
+                if not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        pass   # raise the original error; putconn() discards the connection
+                raise
+
+    # --- INTROSPECTION / SHUTDOWN ---
+    def stats(self):
+        """Returns a snapshot of pool sizes and counters."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "minconn": self.minconn,
+                "maxconn": self.maxconn,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+            })
+        borrows = snapshot["borrows"]
+        snapshot["avg_wait_ms"] = round(1000 * snapshot["total_wait_seconds"] / borrows, 3) if borrows else 0.0
+        return snapshot
+
+    def closeall(self):
+        """Closes idle connections and refuses further borrows."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._discard(conn)
@@ -0,0 +1,204 @@
+# explain_check.py
+
+import argparse
+import json
+import sys
+
+import backend
+import catalog
+import goals
+import migrations
+import partitioning
+import queries
+
+# Scratch schema the synthetic dataset is loaded into. Everything happens in a
+# single transaction that is rolled back at the end, so the real tables are
+# never touched.
+SCRATCH_SCHEMA = "explain_check"
+
+TABLES = ("users", "friends", "workouts", "exercises", "goals", "weekly_activity", "personal_records", "goal_progress")
+
+EXERCISE_NAMES = [
+    "Bench Press", "Squat", "Deadlift", "Overhead Press", "Pull-ups", "Rows",
+    "Lunges", "Leg Press", "Bicep Curls", "Tricep Dips", "Running", "Cycling",
+    "Rowing", "Plank", "Yoga Flow", "Lat Pulldown", "Hip Thrust", "Calf Raises",
+]
+
+# (label, SQL, function building the parameters from sample ids, relations allowed to be seq-scanned)
+CHECKS = [
+    ("get_user_profile", queries.USER_PROFILE, lambda s: (s["user_id"],), ()),
+    ("get_user_workouts", queries.USER_WORKOUTS, lambda s: (s["user_id"],), ()),
+    ("get_workout_history_page (first)", queries.WORKOUT_HISTORY_FIRST_PAGE,
+     lambda s: {"user_id": s["user_id"], "limit": 21}, ()),
+    ("get_workout_history_page (next)", queries.WORKOUT_HISTORY_NEXT_PAGE,
+     lambda s: {"user_id": s["user_id"], "limit": 21, "before_date": s["workout_date"], "before_id": s["workout_id"]}, ()),
+    ("get_duration_series", queries.DURATION_SERIES, lambda s: {"user_id": s["user_id"], "max_points": 52}, ()),
+    ("get_workout_details", queries.WORKOUT_DETAILS, lambda s: (s["workout_id"],), ()),
+    ("get_friends", queries.FRIENDS, lambda s: (s["user_id"],), ()),
+    ("search_users (prefix)", queries.SEARCH_USERS_BY_PREFIX,
+     lambda s: {"user_id": s["user_id"], "query": "user 1", "limit": 21}, ()),
+    ("search_users (prefix, next)", queries.SEARCH_USERS_BY_PREFIX_NEXT,
+     lambda s: {"user_id": s["user_id"], "query": "user 1", "limit": 21, "after_name": "user 1", "after_id": 1}, ()),
+    ("get_friend_suggestions", queries.FRIEND_SUGGESTIONS,
+     lambda s: {"user_id": s["user_id"], "limit": 10, "max_friends": 200, "max_per_friend": 50}, ()),
+    ("friends reverse lookup", queries.FRIENDED_BY, lambda s: (s["user_id"],), ()),
+    ("get_active_goal", queries.ACTIVE_GOAL, lambda s: (s["user_id"],), ()),
+    ("get_goal_progress", queries.GOAL_PROGRESS, lambda s: (s["user_id"],), ()),
+    ("set_goal (deactivate)", queries.DEACTIVATE_GOALS, lambda s: (s["user_id"],), ()),
+    # Every user active this week is returned, often a large share of all
+    # users, so hashing users can beat per-row index lookups for that join.
+    ("get_leaderboard", queries.LEADERBOARD, lambda s: None, ("users",)),
+    ("get_friends_leaderboard", queries.FRIENDS_LEADERBOARD,
+     lambda s: {"user_id": s["user_id"], "top": 3, "neighbours": 2}, ()),
+    ("get_workout_statistics", queries.WORKOUT_STATISTICS, lambda s: (s["user_id"],), ()),
+    ("get_personal_records", queries.PERSONAL_RECORDS, lambda s: (s["user_id"],), ()),
+]
+# Only checked where migration 0011 could create the trigram index, which
+# needs the pg_trgm extension.
+TRIGRAM_CHECKS = [
+    ("search_users (substring)", queries.SEARCH_USERS_BY_SUBSTRING,
+     lambda s: {"user_id": s["user_id"], "query": "ser 12", "limit": 21}, ()),
+]
+# Not checked: get_all_users returns every other user, so a sequential scan is
+# the right plan for it.
+
+def load_synthetic_dataset(cur, users, workouts_per_user, exercises_per_workout):
+    """Fills the (empty) tables on the current search_path with synthetic rows."""
+    cur.execute("""
+        INSERT INTO users (name, email, weight_kg)
+        SELECT 'User ' || g, 'user' || g || '@example.com', round((50 + random() * 50)::numeric, 2)
+        FROM generate_series(1, %s) AS g
+    """, (users,))
+    # Roughly ten friends each, spread over the whole id range.
+    cur.execute("""
+        INSERT INTO friends (user_id, friend_id)
+        SELECT g, 1 + mod(g + k * 7919, %s)
+        FROM generate_series(1, %s) AS g, generate_series(1, 10) AS k
+        WHERE 1 + mod(g + k * 7919, %s) <> g
+        ON CONFLICT DO NOTHING
+    """, (users, users, users))
+    # Workouts spread evenly over the last two years.
+    cur.execute("""
+        INSERT INTO workouts (user_id, workout_date, duration_minutes)
+        SELECT 1 + mod(g, %s), CURRENT_DATE - (random() * 730)::int, 20 + (random() * 70)::int
+        FROM generate_series(1, %s) AS g
+    """, (users, users * workouts_per_user))
+    types = catalog.resolve_types(cur, EXERCISE_NAMES)
+    cur.execute("""
+        INSERT INTO exercises (workout_id, workout_date, exercise_name, exercise_type_id, sets, reps, weight_kg)
+        SELECT x.workout_id, x.workout_date, (%(names)s::text[])[x.i], (%(types)s::int[])[x.i],
+               1 + (random() * 4)::int, 1 + (random() * 12)::int, round((random() * 150)::numeric, 1)
+        FROM (
+            SELECT w.workout_id, w.workout_date, 1 + floor(random() * cardinality(%(names)s::text[]))::int AS i
+            FROM workouts w, generate_series(1, %(per_workout)s) AS k
+        ) x
+    """, {
+        "names": EXERCISE_NAMES,
+        "types": [types[name] for name in EXERCISE_NAMES],
+        "per_workout": exercises_per_workout,
+    })
+    # A few past goals per user, the last one active.
+    cur.execute("""
+        INSERT INTO goals (user_id, goal_description, target_value, is_active)
+        SELECT g, 'Workout ' || k || ' times a week', k, k = 3
+        FROM generate_series(1, %s) AS g, generate_series(1, 3) AS k
+    """, (users,))
+    # Goal progress as the nightly batch would leave it.
+    cur.execute(queries.EVALUATE_GOALS, {"week_start": goals.week_start()})
+    for table in TABLES:
+        cur.execute(f"ANALYZE {table}")
+
+def iter_plan_nodes(plan):
+    """Yields every node of an EXPLAIN (FORMAT JSON) plan tree."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from iter_plan_nodes(child)
+
+def explain(cur, sql_text, params):
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql_text, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+def _parents(cur, names):
+    """Maps partitions and partition indexes (see partitioning.py) to (parent name, pages)."""
+    cur.execute("""
+        SELECT c.relname, COALESCE(parent.relname, c.relname), c.relpages
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        LEFT JOIN pg_class parent ON parent.oid = i.inhparent
+        WHERE c.relname = ANY(%s) AND c.relnamespace = current_schema()::regnamespace
+    """, (list(names),))
+    return {name: (parent, pages) for name, parent, pages in cur.fetchall()}
+
+def run_checks(cur, samples, checks=CHECKS):
+    """EXPLAINs every checked query; returns a list of result dicts."""
+    results = []
+    for label, sql_text, make_params, allowed_seq_scans in checks:
+        nodes = list(iter_plan_nodes(explain(cur, sql_text, make_params(samples))))
+        index_names = {n["Index Name"] for n in nodes if "Index Name" in n}
+        scanned = {n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan" and "Relation Name" in n}
+        parents = _parents(cur, index_names | scanned)
+        indexes = sorted({parents.get(name, (name, 0))[0] for name in index_names})
+        # Scanning an empty partition reads nothing.
+        seq_scans = sorted({
+            parents[name][0] for name in scanned
+            if name in parents and parents[name][0] in TABLES and parents[name][0] not in allowed_seq_scans
+            and (parents[name][0] == name or parents[name][1] > 0)
+        })
+        results.append({
+            "query": label,
+            "ok": bool(indexes) and not seq_scans,
+            "indexes": indexes,
+            "seq_scans": seq_scans,
+        })
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Check that every backend query is served by an index on a large synthetic dataset."
+    )
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--workouts-per-user", type=int, default=30)
+    parser.add_argument("--exercises-per-workout", type=int, default=3)
+    parser.add_argument("--partitioned", action="store_true",
+                        help="partition workouts and exercises by month first (partitioning.py)")
+    args = parser.parse_args(argv)
+
+    with backend.get_pool().connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"CREATE SCHEMA {SCRATCH_SCHEMA}")
+                cur.execute(f"SET LOCAL search_path TO {SCRATCH_SCHEMA}")
+                migrations.migrate(cur)
+                print(f"Loading {args.users} users, {args.users * args.workouts_per_user} workouts ...")
+                load_synthetic_dataset(cur, args.users, args.workouts_per_user, args.exercises_per_workout)
+                if args.partitioned:
+                    partitioning.convert_tables(cur)
+
+                sample_user = args.users // 2
+                cur.execute(
+                    "SELECT workout_id, workout_date FROM workouts WHERE user_id = %s ORDER BY workout_id LIMIT 1",
+                    (sample_user,)
+                )
+                workout_id, workout_date = cur.fetchone()
+                samples = {"user_id": sample_user, "workout_id": workout_id, "workout_date": workout_date}
+                cur.execute("SELECT to_regclass('users_lower_name_trgm_idx') IS NOT NULL")
+                trigram = cur.fetchone()[0]
+                results = run_checks(cur, samples, CHECKS + TRIGRAM_CHECKS if trigram else CHECKS)
+        finally:
+            conn.rollback()
+
+    if not trigram:
+        print("pg_trgm is not installed: substring user search not checked.")
+    for r in results:
+        status = "OK  " if r["ok"] else "FAIL"
+        detail = ", ".join(r["indexes"]) or "no index"
+        if r["seq_scans"]:
+            detail += f"; seq scan on {', '.join(r['seq_scans'])}"
+        print(f"{status} {r['query']:<40} {detail}")
+    return 0 if all(r["ok"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
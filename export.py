@@ -0,0 +1,218 @@
+# export.py
+
+import argparse
+import csv
+import datetime
+import decimal
+import json
+import os
+import sys
+import time
+
+import backend
+import queries
+
+# Streams workout history out of the database at steady memory, whatever its
+# size: rows come through a named (server-side) cursor `fetch_size` at a time
+# and are written out as they arrive. CSV and JSON Lines use the same layout as
+# importer.py, so an export can be imported into another database:
+#
+#   python export.py alice.csv --user-id 1
+#   python export.py nightly.parquet --start-date 2024-01-01
+#
+# Exporting everything reads from a single REPEATABLE READ snapshot, so the
+# file is consistent even while users keep logging workouts.
+DEFAULT_FETCH_SIZE = 2000
+
+COLUMNS = ["user_id", "workout_ref", "workout_date", "duration_minutes", "exercise_name", "sets", "reps", "weight_kg"]
+
+def iter_history(user_id=None, start_date=None, end_date=None, fetch_size=DEFAULT_FETCH_SIZE):
+    """Yields EXPORT_HISTORY rows one by one from a server-side cursor.
+
+    The connection stays borrowed until the generator is exhausted or closed.
+    """
+    params = {"user_id": user_id, "start_date": start_date, "end_date": end_date}
+    with backend.get_pool().connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            with conn.cursor(name="export_history") as cur:
+                cur.itersize = fetch_size
+                cur.execute(queries.EXPORT_HISTORY, params)
+                yield from cur
+        finally:
+            conn.rollback()
+
+def _json_value(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+class _CsvWriter:
+    """One line per exercise (a workout without exercises is one line with no exercise)."""
+
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        pass
+
+class _JsonlWriter:
+    """One line per workout, with its exercises nested; buffers a single workout."""
+
+    def __init__(self, f):
+        self.f = f
+        self.workout = None
+
+    def write(self, row):
+        user_id, workout_id, workout_date, duration, name, sets, reps, weight = row
+        if self.workout is None or self.workout["workout_ref"] != workout_id:
+            self._flush()
+            self.workout = {
+                "user_id": user_id,
+                "workout_ref": workout_id,
+                "workout_date": workout_date.isoformat(),
+                "duration_minutes": duration,
+                "exercises": [],
+            }
+        if name is not None:
+            self.workout["exercises"].append(
+                {"exercise_name": name, "sets": sets, "reps": reps, "weight_kg": _json_value(weight)}
+            )
+
+    def _flush(self):
+        if self.workout is not None:
+            self.f.write(json.dumps(self.workout, ensure_ascii=False) + "\n")
+            self.workout = None
+
+    def close(self):
+        self._flush()
+
+class _ParquetWriter:
+    """Flat rows like the CSV, written as one row group per `batch_rows` rows."""
+
+    def __init__(self, path, batch_rows):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow") from None
+        self.pa = pa
+        self.schema = pa.schema([
+            ("user_id", pa.int32()),
+            ("workout_ref", pa.int32()),
+            ("workout_date", pa.date32()),
+            ("duration_minutes", pa.int32()),
+            ("exercise_name", pa.string()),
+            ("sets", pa.int32()),
+            ("reps", pa.int32()),
+            ("weight_kg", pa.decimal128(6, 2)),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.batch_rows = batch_rows
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            columns = [list(column) for column in zip(*self.rows)]
+            self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+def _detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    raise ValueError(f"Cannot tell the format of {path!r}; pass fmt='csv', 'jsonl' or 'parquet'")
+
+def export_history(path, user_id=None, start_date=None, end_date=None, fmt=None,
+                   fetch_size=DEFAULT_FETCH_SIZE, progress=None):
+    """Writes one user's (or, with user_id=None, everyone's) workouts between the dates to `path`.
+
+    Dates are inclusive and optional. Returns a report dict with workout and
+    exercise counts, elapsed seconds and rows/sec; `progress(report)` is called
+    after every `fetch_size` rows.
+    """
+    fmt = fmt or _detect_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}; expected one of {list(FORMATS)}")
+
+    started = time.perf_counter()
+    report = {"workouts": 0, "exercises": 0}
+    f = None
+    if fmt == "parquet":
+        writer = _ParquetWriter(path, max(fetch_size, 10000))
+    else:
+        f = open(path, "w", newline="", encoding="utf-8")
+        writer = _CsvWriter(f) if fmt == "csv" else _JsonlWriter(f)
+
+    rows = iter_history(user_id, start_date, end_date, fetch_size)
+    try:
+        last_workout = None
+        for n, row in enumerate(rows, start=1):
+            writer.write(row)
+            if row[1] != last_workout:
+                report["workouts"] += 1
+                last_workout = row[1]
+            if row[4] is not None:
+                report["exercises"] += 1
+            if progress and n % fetch_size == 0:
+                progress(report)
+        writer.close()
+    finally:
+        rows.close()
+        if f is not None:
+            f.close()
+
+    elapsed = time.perf_counter() - started
+    total = report["workouts"] + report["exercises"]
+    report.update({
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(total / elapsed, 1) if elapsed > 0 else float(total),
+    })
+    return report
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Stream workout history to CSV, JSON Lines or Parquet.")
+    parser.add_argument("path")
+    parser.add_argument("--user-id", type=int, help="export one user (default: everyone)")
+    parser.add_argument("--start-date", type=datetime.date.fromisoformat, help="first day, inclusive")
+    parser.add_argument("--end-date", type=datetime.date.fromisoformat, help="last day, inclusive")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument("--fetch-size", type=int, default=DEFAULT_FETCH_SIZE, help="rows per round trip")
+    args = parser.parse_args(argv)
+
+    def progress(report):
+        print(f"  exported {report['workouts']} workouts, {report['exercises']} exercises")
+
+    backend.initialize_database()
+    report = export_history(args.path, args.user_id, args.start_date, args.end_date, args.format,
+                            args.fetch_size, progress)
+    print(
+        f"Exported {report['workouts']} workouts and {report['exercises']} exercises "
+        f"in {report['seconds']}s ({report['rows_per_sec']} rows/sec)"
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
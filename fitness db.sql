@@ -5,6 +5,12 @@
 -- I. DATA DEFINITION LANGUAGE (DDL) - CREATING TABLES
 -- =================================================================
 
+-- The schema is defined once, in the numbered files under migrations/, which
+-- backend.py applies automatically (or run `python migrations.py`). This
+-- script includes the same files, so run it with psql from this directory:
+--   psql -d fitnessdb -f "fitness db.sql"
+-- `python migrations.py --check` verifies that the list below is complete.
+--
 -- Drop tables in reverse order of dependency to ensure clean setup if they already exist.
 -- Useful for resetting the database during development.
 -- DROP TABLE IF EXISTS goals;
@@ -12,50 +18,23 @@
 -- DROP TABLE IF EXISTS workouts;
 -- DROP TABLE IF EXISTS friends;
 -- DROP TABLE IF EXISTS users;
-
--- Table to store user profile information
-CREATE TABLE IF NOT EXISTS users (
-    user_id SERIAL PRIMARY KEY,
-    name VARCHAR(255) NOT NULL,
-    email VARCHAR(255) UNIQUE NOT NULL,
-    weight_kg NUMERIC(5, 2)
-);
-
--- Table to manage friendships (many-to-many relationship between users)
-CREATE TABLE IF NOT EXISTS friends (
-    user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
-    friend_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
-    PRIMARY KEY (user_id, friend_id)
-);
-
--- Table to store workout session logs
-CREATE TABLE IF NOT EXISTS workouts (
-    workout_id SERIAL PRIMARY KEY,
-    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-    workout_date DATE NOT NULL,
-    duration_minutes INTEGER
-);
-
--- Table to store details of exercises performed in a workout
-CREATE TABLE IF NOT EXISTS exercises (
-    exercise_id SERIAL PRIMARY KEY,
-    workout_id INTEGER NOT NULL REFERENCES workouts(workout_id) ON DELETE CASCADE,
-    exercise_name VARCHAR(255) NOT NULL,
-    sets INTEGER,
-    reps INTEGER,
-    weight_kg NUMERIC(6, 2)
-);
-
--- Table to store personal fitness goals
-CREATE TABLE IF NOT EXISTS goals (
-    goal_id SERIAL PRIMARY KEY,
-    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-    goal_description TEXT,
-    target_value INTEGER,
-    start_date DATE DEFAULT CURRENT_DATE,
-    end_date DATE,
-    is_active BOOLEAN DEFAULT TRUE
-);
+-- DROP TABLE IF EXISTS schema_version;
+
+\ir migrations/0001_initial.sql
+\ir migrations/0002_cascade_user_deletes.sql
+\ir migrations/0003_hot_path_indexes.sql
+\ir migrations/0004_weekly_activity_rollup.sql
+\ir migrations/0005_personal_records.sql
+\ir migrations/0006_workout_history_keyset.sql
+\ir migrations/0007_exercise_workout_date.sql
+\ir migrations/0008_partition_maintenance.sql
+\ir migrations/0009_goal_progress.sql
+\ir migrations/0010_exercise_catalog.sql
+\ir migrations/0011_friend_discovery.sql
+\ir migrations/0012_change_feed.sql
+\ir migrations/0013_ingest_keys.sql
+\ir migrations/0014_scoped_personal_records.sql
+\ir migrations/0015_split_default_partitions.sql
 
 
 -- =================================================================
@@ -63,7 +42,7 @@ CREATE TABLE IF NOT EXISTS goals (
 -- =================================================================
 
 -- Clear existing data to prevent duplicates on re-run
-TRUNCATE TABLE users, friends, workouts, exercises, goals RESTART IDENTITY CASCADE;
+TRUNCATE TABLE users, friends, workouts, exercises, goals, ingested_workouts RESTART IDENTITY CASCADE;
 
 -- Insert sample users
 -- The main user for the application will be Alice (user_id=1)
@@ -90,25 +69,25 @@ INSERT INTO workouts (user_id, workout_date, duration_minutes) VALUES
 (3, '2025-08-15', 90);  -- Charlie's workout (last week, won't appear on leaderboard)
 
 -- Insert sample exercises linked to the workouts above
-INSERT INTO exercises (workout_id, exercise_name, sets, reps, weight_kg) VALUES
+INSERT INTO exercises (workout_id, workout_date, exercise_name, sets, reps, weight_kg) VALUES
 -- Exercises for Alice's first workout (ID 1)
-(1, 'Bench Press', 3, 10, 50.0),
-(1, 'Squat', 4, 8, 80.0),
+(1, '2025-08-19', 'Bench Press', 3, 10, 50.0),
+(1, '2025-08-19', 'Squat', 4, 8, 80.0),
 
 -- Exercises for Bob's workout (ID 2)
-(2, 'Running', 1, 1, 0), -- Using 0 weight for cardio
-(2, 'Pull-ups', 5, 5, 0), -- Bodyweight exercise
+(2, '2025-08-18', 'Running', 1, 1, 0), -- Using 0 weight for cardio
+(2, '2025-08-18', 'Pull-ups', 5, 5, 0), -- Bodyweight exercise
 
 -- Exercises for Diana's workout (ID 3)
-(3, 'Yoga Flow', 1, 1, 0),
+(3, '2025-08-20', 'Yoga Flow', 1, 1, 0),
 
 -- Exercises for Alice's second workout (ID 4)
-(4, 'Bench Press', 3, 12, 52.5),
-(4, 'Deadlift', 3, 6, 100.0),
+(4, '2025-08-21', 'Bench Press', 3, 12, 52.5),
+(4, '2025-08-21', 'Deadlift', 3, 6, 100.0),
 
 -- Exercises for Charlie's workout (ID 5)
-(5, 'Leg Press', 4, 12, 150.0),
-(5, 'Bicep Curls', 3, 15, 15.0);
+(5, '2025-08-15', 'Leg Press', 4, 12, 150.0),
+(5, '2025-08-15', 'Bicep Curls', 3, 15, 15.0);
 
 -- Insert a sample goal for the main user (Alice)
 INSERT INTO goals (user_id, goal_description, target_value) VALUES
@@ -3,6 +3,9 @@
 import streamlit as st
 import pandas as pd
 import backend as be
+import analytics
+import catalog
+import uuid
 from datetime import datetime
 
 # --- CONFIGURATION ---
@@ -11,27 +14,56 @@ MAIN_USER_ID = 1 # The application is designed for a single main user (user_id=1
 
 def main():
     # --- INITIALIZATION ---
+    # Each browser session reads its own writes even when reads go to replicas.
+    be.use_session(st.session_state.setdefault('session_id', uuid.uuid4().hex))
     be.initialize_database()
+    # Evicts cached reads when other processes write (a no-op once running)
+    be.start_change_feed()
     # On first run, add some sample data to showcase features
     if 'seeded' not in st.session_state:
         be.seed_data()
         st.session_state['seeded'] = True
 
-    # --- FETCH USER'S NAME FOR PERSONALIZED GREETING ---
-    user_profile = be.get_user_profile(MAIN_USER_ID)
-    # Get the first name for a friendly greeting
-    user_name = user_profile[0].split()[0] if user_profile else "User"
-
-    # --- UPDATED PERSONALIZED TITLE ---
-    st.title(f"Hi {user_name}! 👋")
-    st.subheader("Welcome to your Personal Fitness Tracker")
-
     # --- SIDEBAR NAVIGATION ---
-    menu = ["My Profile", "Log a New Workout", "My Progress", "Friends & Leaderboard", "Set a Goal", "Business Insights"]
+    menu = ["My Profile", "Log a New Workout", "My Progress", "Friends & Leaderboard", "Set a Goal", "Business Insights", "Query Performance"]
     choice = st.sidebar.selectbox("Menu", menu)
     st.sidebar.markdown("---")
-    st.sidebar.info(f"Logged in as: {user_profile[0] if user_profile else 'User'}")
 
+    # Each read runs at most once per rerun, and the page's reads are fetched
+    # together with the greeting's in a single round trip.
+    with be.request_scope():
+        # --- FETCH USER'S NAME FOR PERSONALIZED GREETING ---
+        user_profile = be.prefetch((be.get_user_profile, MAIN_USER_ID), *page_reads(choice))[0]
+        # Get the first name for a friendly greeting
+        user_name = user_profile[0].split()[0] if user_profile else "User"
+
+        # --- UPDATED PERSONALIZED TITLE ---
+        st.title(f"Hi {user_name}! 👋")
+        st.subheader("Welcome to your Personal Fitness Tracker")
+        st.sidebar.info(f"Logged in as: {user_profile[0] if user_profile else 'User'}")
+
+        show_page(choice)
+
+def page_reads(choice):
+    """The backend reads the page `choice` makes on every rerun, as (function, *args) for be.prefetch()."""
+    if choice == "Log a New Workout":
+        return [(be.get_exercise_catalog,)]
+    if choice == "My Progress":
+        cursor = st.session_state.get('history_cursors', [None])[-1]
+        return [(be.get_workout_history_page, MAIN_USER_ID, HISTORY_PAGE_SIZE, cursor), (be.get_duration_series, MAIN_USER_ID)]
+    if choice == "Friends & Leaderboard":
+        if st.session_state.get('leaderboard_scope', "Friends") == "Friends":
+            board = (be.get_friends_leaderboard, MAIN_USER_ID)
+        else:
+            board = (be.get_leaderboard,)
+        return [board, (be.get_friends, MAIN_USER_ID), (be.get_friend_suggestions, MAIN_USER_ID)]
+    if choice == "Set a Goal":
+        return [(be.get_goal_progress, MAIN_USER_ID)]
+    if choice == "Business Insights":
+        return [(be.get_workout_statistics, MAIN_USER_ID), (be.get_personal_records, MAIN_USER_ID)]
+    return []
+
+def show_page(choice):
     # --- PAGE ROUTING ---
     if choice == "My Profile":
         profile_page()
@@ -45,6 +77,8 @@ def main():
         goal_page()
     elif choice == "Business Insights":
         insights_page()
+    elif choice == "Query Performance":
+        query_performance_page()
 
 # --- UI PAGES ---
 def profile_page():
@@ -78,10 +112,18 @@ def log_workout_page():
         st.markdown("---")
         st.subheader("Exercises")
 
+        # Exercises are picked from the catalog; new names can be typed in and
+        # are added to it when the workout is logged.
+        exercise_names = [name for _, name in be.get_exercise_catalog()]
+
         # Dynamically render exercise input fields based on session state
         for i, ex in enumerate(st.session_state.exercises):
             cols = st.columns([3, 1, 1, 1])
-            ex['name'] = cols[0].text_input(f"Exercise Name", value=ex.get('name', ''), key=f"name_{i}")
+            options = exercise_names if not ex.get('name') or ex['name'] in exercise_names else exercise_names + [ex['name']]
+            ex['name'] = cols[0].selectbox(
+                f"Exercise Name", options, index=options.index(ex['name']) if ex.get('name') else None,
+                accept_new_options=True, placeholder="Choose or type an exercise", key=f"name_{i}"
+            )
             ex['sets'] = cols[1].number_input(f"Sets", min_value=1, step=1, value=ex.get('sets', 3), key=f"sets_{i}")
             ex['reps'] = cols[2].number_input(f"Reps", min_value=1, step=1, value=ex.get('reps', 10), key=f"reps_{i}")
             ex['weight'] = cols[3].number_input(f"Weight (kg)", min_value=0.0, step=0.5, format="%.1f", value=ex.get('weight', 20.0), key=f"weight_{i}")
@@ -90,15 +132,35 @@ def log_workout_page():
         submitted = st.form_submit_button("Log Workout")
         if submitted:
             # Filter out empty exercise names before logging
-            valid_exercises = [ex for ex in st.session_state.exercises if ex['name'].strip()]
+            valid_exercises = [ex for ex in st.session_state.exercises if (ex['name'] or '').strip()]
             if not valid_exercises:
                 st.warning("Please add at least one exercise.")
             else:
-                be.log_workout(MAIN_USER_ID, date, duration, valid_exercises)
-                st.success("Workout logged successfully!")
-                # Clean up session state for the next entry
-                del st.session_state.exercises 
-                st.rerun()
+                # Typos of known exercises ("benchpress") are logged as the exercise.
+                for ex in valid_exercises:
+                    known = catalog.match(ex['name'])
+                    if known and known != ex['name']:
+                        st.toast(f"Logged '{ex['name']}' as {known}.")
+                        ex['name'] = known
+                # One key per filled-in form, so a double submit logs the workout once
+                key = st.session_state.setdefault('workout_key', uuid.uuid4().hex)
+                try:
+                    status = be.log_workout(MAIN_USER_ID, date, duration, valid_exercises, idempotency_key=key)
+                except be.DATABASE_ERRORS as e:
+                    # Keep the form and its key: submitting again cannot log it twice.
+                    st.error(f"Could not log the workout, please try again. ({e})")
+                else:
+                    if status == be.WORKOUT_QUEUED:
+                        st.success("Workout saved! It will show up in your history in a moment.")
+                    elif status == be.WORKOUT_DUPLICATE:
+                        st.info("This workout was already logged.")
+                    else:
+                        st.success("Workout logged successfully!")
+                    # Clean up session state for the next entry
+                    del st.session_state.exercises
+                    del st.session_state.workout_key
+                    st.session_state.pop('history_cursors', None)
+                    st.rerun()
 
     # --- "Add Another Exercise" button is now OUTSIDE the form ---
     if st.button("Add Another Exercise"):
@@ -106,31 +168,80 @@ def log_workout_page():
         st.session_state.exercises.append({'name': '', 'sets': 3, 'reps': 10, 'weight': 20.0})
         st.rerun()
 
+HISTORY_PAGE_SIZE = 20
+
 def progress_page():
     st.header("📈 My Progress")
-    workouts = be.get_user_workouts(MAIN_USER_ID)
 
-    if not workouts:
+    # Keyset pagination: remember the cursor that starts each page we have seen
+    if 'history_cursors' not in st.session_state:
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+    workouts, next_cursor = be.get_workout_history_page(MAIN_USER_ID, HISTORY_PAGE_SIZE, cursors[-1])
+
+    if not workouts and len(cursors) == 1:
         st.info("You haven't logged any workouts yet. Go to 'Log a New Workout' to get started!")
         return
 
-    df_workouts = pd.DataFrame(workouts, columns=['ID', 'Date', 'Duration (min)'])
-    st.write("Your Workout History:")
+    # Visualize progress over time (at most one point per bucket of weeks)
+    series = be.get_duration_series(MAIN_USER_ID)
+    if series:
+        st.subheader("Workout Minutes Over Time")
+        df_series = pd.DataFrame(series, columns=['Period', 'Minutes']).set_index('Period')
+        st.line_chart(df_series['Minutes'])
+
+    df_workouts = pd.DataFrame([w[:3] for w in workouts], columns=['ID', 'Date', 'Duration (min)'])
+    st.write(f"Your Workout History (page {len(cursors)}):")
     st.dataframe(df_workouts, use_container_width=True, hide_index=True)
 
-    # Visualize progress over time
-    if not df_workouts.empty:
-        st.subheader("Workout Duration Over Time")
-        chart_data = df_workouts.rename(columns={'Date': 'index'}).set_index('index')
-        st.line_chart(chart_data['Duration (min)'])
+    col1, col2 = st.columns(2)
+    if col1.button("⬅ Newer", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if col2.button("Older ➡", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
 
     st.subheader("Workout Details")
-    selected_id = st.selectbox("Select a workout to see details:", options=df_workouts['ID'], format_func=lambda x: f"Workout on {df_workouts[df_workouts['ID']==x]['Date'].iloc[0]}")
+    workouts_by_id = {w[0]: w for w in workouts}
+    selected_id = st.selectbox("Select a workout to see details:", options=list(workouts_by_id), format_func=lambda x: f"Workout on {workouts_by_id[x][1]}")
     if selected_id:
-        details = be.get_workout_details(selected_id)
-        df_details = pd.DataFrame(details, columns=['Exercise', 'Sets', 'Reps', 'Weight (kg)'])
+        df_details = pd.DataFrame(workouts_by_id[selected_id][3], columns=['Exercise', 'Sets', 'Reps', 'Weight (kg)'])
         st.table(df_details)
 
+FRIEND_SEARCH_PAGE_SIZE = 20
+
+def leaderboard_panel():
+    scope = st.session_state.get('leaderboard_scope', "Friends")
+    # Re-read only when the change feed has applied a change the board depends on
+    feed = be.get_change_feed()
+    version = (scope, feed.version("workouts", "users", "friends")) if feed else None
+    previous = st.session_state.get('live_leaderboard')
+    if version is not None and previous is not None and previous[0] == version:
+        board = previous[1]
+    else:
+        board = be.get_friends_leaderboard(MAIN_USER_ID) if scope == "Friends" else be.get_leaderboard()
+        st.session_state.live_leaderboard = (version, board)
+
+    columns = ['Rank', 'User ID', 'Name', 'Total Minutes']
+    if scope == "Friends":
+        if board['members'] <= 1:
+            st.info("Add friends to see how you compare.")
+            return
+        if st.session_state.get('friends_rank') not in (None, board['rank']):
+            st.toast(f"You're now #{board['rank']} among your friends!")
+        st.session_state.friends_rank = board['rank']
+        st.metric("Your Rank", f"#{board['rank']} of {board['members']}")
+        st.dataframe(pd.DataFrame(board['top'], columns=columns)[['Rank', 'Name', 'Total Minutes']], use_container_width=True, hide_index=True)
+        if board['around']:
+            st.write("Around you:")
+            st.dataframe(pd.DataFrame(board['around'], columns=columns)[['Rank', 'Name', 'Total Minutes']], use_container_width=True, hide_index=True)
+    elif board:
+        df_leaderboard = pd.DataFrame(board, columns=['User ID', 'Name', 'Total Minutes'])
+        st.dataframe(df_leaderboard[['Name', 'Total Minutes']], use_container_width=True, hide_index=True)
+    else:
+        st.info("No workouts logged by anyone this week.")
+
 def friends_leaderboard_page():
     st.header("🤝 Friends & Leaderboard")
     
@@ -139,17 +250,17 @@ def friends_leaderboard_page():
     with tab1:
         st.subheader("🏆 Weekly Leaderboard")
         st.write("Ranking based on total workout minutes for the current week.")
-        leaderboard_data = be.get_leaderboard()
-        if leaderboard_data:
-            df_leaderboard = pd.DataFrame(leaderboard_data, columns=['Name', 'Total Minutes'])
-            st.dataframe(df_leaderboard, use_container_width=True, hide_index=True)
+        st.radio("Rank me against:", ["Friends", "Everyone"], horizontal=True, key='leaderboard_scope')
+        # With the change feed running the leaderboard refreshes itself, without
+        # rerunning the page, once other people's workouts have been applied.
+        if be.get_change_feed() is None:
+            leaderboard_panel()
         else:
-            st.info("No workouts logged by anyone this week.")
+            st.fragment(run_every=be.CHANGE_FEED_CONFIG["live_refresh_seconds"])(leaderboard_panel)()
     
     with tab2:
         st.subheader("Manage Your Friends")
         current_friends = be.get_friends(MAIN_USER_ID)
-        friend_ids = [f[0] for f in current_friends]
         
         st.write("Your current friends:")
         if not current_friends:
@@ -162,33 +273,65 @@ def friends_leaderboard_page():
                     be.remove_friend(MAIN_USER_ID, friend_id)
                     st.success(f"Removed {friend_name} from your friends.")
                     st.rerun()
+
+        suggestions = be.get_friend_suggestions(MAIN_USER_ID)
+        if suggestions:
+            st.markdown("---")
+            st.write("People you may know:")
+            for user_id, name, mutual_friends in suggestions:
+                col1, col2 = st.columns([4, 1])
+                col1.write(f"- {name} ({mutual_friends} mutual friend{'s' if mutual_friends != 1 else ''})")
+                if col2.button("Add", key=f"suggest_{user_id}"):
+                    be.add_friend(MAIN_USER_ID, user_id)
+                    st.success(f"Added {name} to your friends.")
+                    st.rerun()
         
         st.markdown("---")
         st.write("Add a new friend:")
-        all_users = be.get_all_users(exclude_user_id=MAIN_USER_ID)
-        # Filter out users who are already friends
-        potential_friends = [user for user in all_users if user[0] not in friend_ids]
+        search = st.text_input("Search users by name:")
+        # Keyset pagination, as on the progress page; a new search starts over
+        if st.session_state.get('friend_search') != search:
+            st.session_state.friend_search = search
+            st.session_state.friend_search_cursors = [None]
+        cursors = st.session_state.friend_search_cursors
+        if not search.strip():
+            return
+        users, next_cursor = be.search_users(MAIN_USER_ID, search, FRIEND_SEARCH_PAGE_SIZE, cursors[-1])
         
-        if not potential_friends:
-            st.warning("No new users to add as friends.")
+        if not users:
+            st.warning("No new users match your search.")
         else:
-            friend_to_add_id = st.selectbox("Select a user to add:", options=[u[0] for u in potential_friends], format_func=lambda x: [u[1] for u in potential_friends if u[0] == x][0])
+            names_by_id = dict(users)
+            friend_to_add_id = st.selectbox("Select a user to add:", options=list(names_by_id), format_func=names_by_id.get)
             if st.button("Add Friend"):
                 be.add_friend(MAIN_USER_ID, friend_to_add_id)
                 st.success("Friend added successfully!")
                 st.rerun()
+        if len(cursors) > 1 or next_cursor is not None:
+            col1, col2 = st.columns(2)
+            if col1.button("⬅ Previous", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+            if col2.button("More ➡", disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
 
 def goal_page():
     st.header("🎯 Set a Goal")
     
-    active_goal = be.get_active_goal(MAIN_USER_ID)
-    if active_goal:
-        st.success(f"Your current goal: **{active_goal[0]}** (Target: {active_goal[1]} workouts per week)")
-        workouts_this_week = pd.DataFrame(be.get_leaderboard(), columns=['Name', 'Minutes'])
-        user_name = be.get_user_profile(MAIN_USER_ID)[0]
-        # This is a simplification; a more robust goal tracker would be needed
-        # for more complex goals. For "workouts per week", we can count them.
-        st.info("Goal progress tracking can be expanded here based on goal type.")
+    progress = be.get_goal_progress(MAIN_USER_ID)
+    if progress:
+        st.success(f"Your current goal: **{progress['description']}** (Target: {progress['target']} workouts per week)")
+        st.progress(progress['percent'] / 100, text=f"{progress['workouts']} of {progress['target']} workouts this week")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Workouts This Week", progress['workouts'])
+        col2.metric("Minutes This Week", progress['minutes'])
+        if progress['streak_weeks'] is not None:
+            col3.metric("Streak", f"{progress['streak_weeks']} weeks")
+        if progress['met']:
+            st.info("Goal met for this week. Keep it up!")
+        else:
+            st.info(f"{progress['remaining']} more workout(s) to reach your goal this week.")
     
     with st.form("set_goal_form"):
         st.write("Set a new weekly workout goal. This will replace your current one.")
@@ -212,11 +355,106 @@ def insights_page():
     col3.metric("Avg. Workout Duration", f"{stats.get('avg_duration', 0)} min")
     
     st.markdown("---")
-    st.subheader("Exercise Specific Insights")
+    st.subheader("Personal Records")
+    records = be.get_personal_records(MAIN_USER_ID)
+    if records:
+        df_records = pd.DataFrame(records, columns=['Exercise', 'Best Weight (kg)', 'Best Volume (kg)', 'Est. 1RM (kg)'])
+        st.dataframe(df_records, use_container_width=True, hide_index=True)
+        st.caption("Volume is sets × reps × weight in a single entry; 1RM is estimated with the Epley formula.")
+    else:
+        st.info("Log some exercises to start setting personal records.")
+
+    st.markdown("---")
+    st.subheader("Training Trends")
+    granularity = st.radio("Period", ["week", "month"], format_func=lambda g: "Weekly" if g == "week" else "Monthly", horizontal=True)
+    series = analytics.training_series(MAIN_USER_ID, granularity)
+    if series.empty:
+        st.info("Log some workouts to see your trends.")
+        return
     col1, col2 = st.columns(2)
-    col1.metric("Min Weight (Bench Press)", f"{stats.get('min_bench_press', 0)} kg")
-    col2.metric("Max Weight (Bench Press)", f"{stats.get('max_bench_press', 0)} kg")
-    st.caption("Note: Weight insights are shown for 'Bench Press' as an example.")
+    col1.write("Volume (kg, sets × reps × weight)")
+    col1.line_chart(series[['volume_kg', 'volume_rolling']].rename(columns={'volume_kg': 'Volume', 'volume_rolling': f'{analytics.ROLLING_PERIODS}-period average'}))
+    col2.write("Workouts and minutes")
+    col2.bar_chart(series[['workouts']].rename(columns={'workouts': 'Workouts'}))
+    col2.line_chart(series[['minutes']].rename(columns={'minutes': 'Minutes'}))
+
+    summary = analytics.e1rm_summary(MAIN_USER_ID, granularity)
+    if not summary.empty:
+        st.write("Estimated 1RM by exercise")
+        summary.columns = ['Exercise', 'Periods Trained', 'Latest e1RM (kg)', 'Best e1RM (kg)', f'Trend (kg/{granularity})']
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+        exercise = st.selectbox("Exercise", summary['Exercise'])
+        trend = analytics.e1rm_trend(MAIN_USER_ID, granularity, [exercise]).set_index('period_start')
+        st.line_chart(trend[['e1rm_kg', 'e1rm_best_so_far']].rename(columns={'e1rm_kg': 'Top set e1RM', 'e1rm_best_so_far': 'Best so far'}))
+
+def query_performance_page():
+    st.header("⏱️ Query Performance")
+    settings = be.INSTRUMENTATION_CONFIG
+    enabled = st.toggle("Record query timings", value=settings["enabled"])
+    slow_ms = st.number_input("Slow-query threshold (ms)", min_value=1, value=int(settings["slow_query_ms"]))
+    if enabled != settings["enabled"] or slow_ms != settings["slow_query_ms"]:
+        be.configure_instrumentation(enabled=enabled, slow_query_ms=slow_ms)
+    if st.button("Reset timings"):
+        be.reset_query_performance()
+
+    if be.REPLICAS:
+        st.subheader("Read Replicas")
+        routing_stats = be.get_routing_stats()
+        cols = st.columns(3)
+        cols[0].metric("Reads on Primary (after a write)", routing_stats['sticky_reads'])
+        cols[1].metric("Reads on Primary (no fresh replica)", routing_stats['fallback_reads'])
+        cols[2].metric("Reads on Replicas", sum(r['reads'] for r in routing_stats['replicas']))
+        st.dataframe(pd.DataFrame(routing_stats['replicas']), use_container_width=True, hide_index=True)
+
+    feed = be.get_change_feed()
+    if feed is not None:
+        st.subheader("Change Feed")
+        feed_stats = feed.stats()
+        cols = st.columns(3)
+        cols[0].metric("Listener", "Connected" if feed_stats['connected'] else "Reconnecting")
+        cols[1].metric("Changes Applied", feed_stats['notifications'])
+        cols[2].metric("Reconnects", feed_stats['reconnects'])
+
+    queue = be.get_ingest_queue()
+    if queue is not None:
+        st.subheader("Write-behind Queue")
+        queue_stats = queue.stats()
+        mean_flush_ms = queue_stats['flush_seconds_total'] * 1000 / queue_stats['batches'] if queue_stats['batches'] else 0.0
+        cols = st.columns(4)
+        cols[0].metric("Queued Workouts", queue_stats['depth'])
+        cols[1].metric("Oldest Queued", f"{queue_stats['oldest_age_seconds']:.1f} s")
+        cols[2].metric("Avg. Flush", f"{mean_flush_ms:.1f} ms")
+        cols[3].metric("Rejected", queue_stats['rejected'])
+        if queue_stats['depth'] and queue_stats['last_error']:
+            st.warning(f"Retrying: {queue_stats['last_error']}")
+
+    perf = be.get_query_performance()
+    if not perf["functions"] and not perf["statements"]:
+        st.info("No timings yet. Turn recording on and use the other pages.")
+        return
+
+    st.subheader("Hottest Queries")
+    df_statements = pd.DataFrame(perf["statements"])
+    df_statements['functions'] = df_statements['functions'].apply(", ".join)
+    df_statements = df_statements[['statement', 'calls', 'total_ms', 'mean_ms', 'p95_ms', 'max_ms', 'rows', 'errors', 'functions']]
+    df_statements.columns = ['Statement', 'Calls', 'Total (ms)', 'Mean (ms)', 'p95 (ms)', 'Max (ms)', 'Rows', 'Errors', 'Called From']
+    st.dataframe(df_statements, use_container_width=True, hide_index=True)
+
+    st.subheader("Backend Functions")
+    df_functions = pd.DataFrame(perf["functions"])
+    df_functions = df_functions[['function', 'calls', 'total_ms', 'mean_ms', 'p95_ms', 'max_ms', 'errors', 'acquire_mean_ms']]
+    df_functions.columns = ['Function', 'Calls', 'Total (ms)', 'Mean (ms)', 'p95 (ms)', 'Max (ms)', 'Errors', 'Avg. Connection Wait (ms)']
+    st.dataframe(df_functions, use_container_width=True, hide_index=True)
+    st.caption("Cached reads are only timed when they miss the cache; p95 is the upper bound of its histogram bucket.")
+
+    st.subheader(f"Slow Queries ({perf['slow_total']} total)")
+    for entry in perf["slow_queries"]:
+        with st.expander(f"{entry['at']} · {entry['statement']} · {entry['duration_ms']} ms · {entry['function']}"):
+            st.code(entry['sql'], language="sql")
+            if entry['params']:
+                st.caption(f"Parameters: {entry['params']}")
+            if entry['plan']:
+                st.code(entry['plan'])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
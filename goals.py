@@ -0,0 +1,94 @@
+# goals.py
+
+import argparse
+import datetime
+import sys
+import time
+
+import backend
+import queries
+
+# Batch goal evaluation. backend.get_goal_progress() answers for one user on
+# every page view; this evaluates every active goal at once, in a single
+# set-based statement over the weekly_activity rollup, and stores the results
+# in goal_progress (migration 0009) for cheap reads, e.g. by a nightly job
+# sending reminders to users short of their target or tracking streaks:
+#
+#   python goals.py evaluate                  # the current week
+#   python goals.py evaluate --week 2025-08-18
+#   python goals.py behind                    # who has not met their target yet
+#
+# Each run replaces every user's row, so running it several times a week is
+# fine; the streaks are recomputed from weekly_activity each time. Streaks show
+# up in backend.get_goal_progress() once its cache entry expires.
+
+def week_start(d=None):
+    """The Monday of the week containing `d` (default today)."""
+    d = d or datetime.date.today()
+    return d - datetime.timedelta(days=d.weekday())
+
+def evaluate(week=None):
+    """Evaluates all active goals for the week containing `week` (default today).
+
+    Returns a report dict: the week's start, goals evaluated, how many met
+    their target, rows removed for inactive goals and elapsed seconds.
+    """
+    started = time.perf_counter()
+    start = week_start(week)
+    with backend.transaction() as cur:
+        cur.execute(queries.EVALUATE_GOALS, {"week_start": start})
+        evaluated = cur.rowcount
+        cur.execute(queries.DELETE_STALE_GOAL_PROGRESS)
+        removed = cur.rowcount
+        cur.execute("SELECT count(*) FROM goal_progress WHERE week_start = %s AND met", (start,))
+        met = cur.fetchone()[0]
+    return {
+        "week_start": start,
+        "evaluated": evaluated,
+        "met": met,
+        "behind": evaluated - met,
+        "removed": removed,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def progress_for_week(week=None, met=None):
+    """Stored results for the week containing `week`, optionally only those that did (not) meet the target.
+
+    Returns a list of dicts; empty until evaluate() has run for that week.
+    """
+    with backend.transaction() as cur:
+        cur.execute(queries.GOAL_PROGRESS_FOR_WEEK, {"week_start": week_start(week), "met": met})
+        rows = cur.fetchall()
+    return [
+        {
+            "user_id": user_id,
+            "name": name,
+            "target": target,
+            "workouts": workouts,
+            "minutes": minutes,
+            "met": met,
+            "streak_weeks": streak_weeks,
+        }
+        for user_id, name, target, workouts, minutes, met, streak_weeks in rows
+    ]
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Evaluate weekly goal progress for all users.")
+    parser.add_argument("command", choices=("evaluate", "behind"))
+    parser.add_argument("--week", type=datetime.date.fromisoformat, help="any day of the week (default today)")
+    args = parser.parse_args(argv)
+
+    backend.initialize_database()
+    if args.command == "evaluate":
+        report = evaluate(args.week)
+        print(
+            f"Week of {report['week_start']}: {report['evaluated']} goals evaluated, {report['met']} met, "
+            f"{report['behind']} behind ({report['seconds']}s)"
+        )
+        return 0
+    for p in progress_for_week(args.week, met=False):
+        print(f"{p['user_id']:>8} {p['name']:<30} {p['workouts']}/{p['target']} workouts, {p['minutes']} min")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
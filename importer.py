@@ -0,0 +1,205 @@
+# importer.py
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from psycopg2.extras import execute_values
+
+import backend
+import catalog
+import queries
+
+# Input is one record per exercise, with the workout's columns repeated on each
+# record; `workout_ref` is the other tracker's workout id and groups records
+# into workouts. A workout with no exercises is a record with an empty
+# exercise_name. JSON Lines input may instead carry a nested "exercises" list
+# per workout record. A `user_id` column is only read when no user id is passed
+# to import_workout_history(). The records of one workout must be adjacent, as
+# export.py writes them: only the current chunk's workouts are remembered, so
+# memory stays bounded by the chunk size.
+#
+#   workout_ref,workout_date,duration_minutes,exercise_name,sets,reps,weight_kg
+#   a17,2024-03-02,55,Bench Press,3,10,50
+#   a17,2024-03-02,55,Squat,4,8,80
+DEFAULT_CHUNK_SIZE = 5000
+
+def _read_csv(f):
+    for line_no, record in enumerate(csv.DictReader(f), start=2):
+        yield line_no, record
+
+def _read_jsonl(f):
+    for line_no, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        nested = record.pop("exercises", None)
+        if not nested:
+            yield line_no, record
+            continue
+        for ex in nested:
+            yield line_no, {**record, **ex}
+
+READERS = {"csv": _read_csv, "jsonl": _read_jsonl}
+
+def _detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of {path!r}; pass fmt='csv' or fmt='jsonl'")
+
+def _int_or_none(value):
+    return None if value in (None, "") else int(value)
+
+def _float_or_none(value):
+    return None if value in (None, "") else float(value)
+
+class _Chunk:
+    """Workout and exercise rows waiting to be written in one transaction."""
+
+    def __init__(self):
+        self.workouts = []
+        self.exercises = []
+
+    def __len__(self):
+        return len(self.workouts) + len(self.exercises)
+
+def _copy_rows(cur, statement, rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    cur.copy_expert(statement, buf)
+
+def _flush(chunk, method, exercise_types):
+    with backend.transaction() as cur:
+        # Exercise types are looked up once per distinct name, not per row.
+        types = catalog.resolve_types(cur, [e[2] for e in chunk.exercises], exercise_types)
+        exercises = [(w, d, name, types[name], *rest) for w, d, name, *rest in chunk.exercises]
+        if method == "copy":
+            if chunk.workouts:
+                _copy_rows(cur, queries.COPY_WORKOUTS, chunk.workouts)
+            if exercises:
+                _copy_rows(cur, queries.COPY_EXERCISES, exercises)
+        else:
+            if chunk.workouts:
+                execute_values(cur, queries.INSERT_WORKOUTS_WITH_IDS, chunk.workouts, page_size=1000)
+            if exercises:
+                execute_values(cur, queries.INSERT_EXERCISES, exercises, page_size=1000)
+
+def import_records(records, user_id=None, chunk_size=DEFAULT_CHUNK_SIZE, method="copy", progress=None):
+    """Loads (line_no, record) pairs into workouts/exercises, committing every `chunk_size` rows.
+
+    Returns a report dict with row counts, elapsed seconds and rows/sec. Chunks
+    committed before an error stay committed; the error says which input line
+    was bad so the rest can be fixed and re-imported.
+    """
+    if method not in ("copy", "insert"):
+        raise ValueError("method must be 'copy' or 'insert'")
+
+    started = time.perf_counter()
+    workout_ids = {}   # (user_id, workout_ref) -> (reserved workout_id, workout_date) in this chunk
+    owners = set()     # users whose cached reads the import makes stale
+    exercise_types = {}   # exercise name -> exercise_type_id
+    reserved = []
+    chunk = _Chunk()
+    report = {"workouts": 0, "exercises": 0, "chunks": 0}
+
+    for line_no, record in records:
+        try:
+            owner = user_id if user_id is not None else int(record["user_id"])
+            key = (owner, str(record["workout_ref"]))
+            workout = workout_ids.get(key)
+            if workout is None:
+                if not reserved:
+                    with backend.transaction() as cur:
+                        cur.execute(queries.RESERVE_WORKOUT_IDS, (chunk_size,))
+                        reserved = [row[0] for row in cur.fetchall()]
+                        reserved.reverse()
+                if not record.get("workout_date"):
+                    raise ValueError("workout_date is required")
+                workout = workout_ids[key] = (reserved.pop(), record["workout_date"])
+                owners.add(owner)
+                chunk.workouts.append(
+                    (workout[0], owner, workout[1], _int_or_none(record.get("duration_minutes")))
+                )
+            name = (record.get("exercise_name") or "").strip()
+            if name:
+                chunk.exercises.append((
+                    workout[0], workout[1], name,
+                    _int_or_none(record.get("sets")),
+                    _int_or_none(record.get("reps")),
+                    _float_or_none(record.get("weight_kg")),
+                ))
+        except (KeyError, ValueError, TypeError) as e:
+            raise ValueError(f"Bad import record at line {line_no}: {e!r}") from e
+
+        if len(chunk) >= chunk_size:
+            _flush(chunk, method, exercise_types)
+            report["workouts"] += len(chunk.workouts)
+            report["exercises"] += len(chunk.exercises)
+            report["chunks"] += 1
+            chunk = _Chunk()
+            # Only the workout being read can still get more exercises.
+            workout_ids = {key: workout}
+            if progress:
+                progress(report)
+
+    if len(chunk):
+        _flush(chunk, method, exercise_types)
+        report["workouts"] += len(chunk.workouts)
+        report["exercises"] += len(chunk.exercises)
+        report["chunks"] += 1
+
+    for owner in owners:
+        backend.invalidate_workouts(owner, None)
+
+    elapsed = time.perf_counter() - started
+    rows = report["workouts"] + report["exercises"]
+    report.update({
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else float(rows),
+    })
+    return report
+
+def import_workout_history(path, user_id=None, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE, method="copy", progress=None):
+    """Streams a CSV or JSON Lines workout history file into the database.
+
+    The file is read one record at a time, so memory use depends on
+    `chunk_size`, not on the file size. See import_records() for the report.
+    """
+    fmt = fmt or _detect_format(path)
+    if fmt not in READERS:
+        raise ValueError(f"Unsupported import format {fmt!r}; expected one of {sorted(READERS)}")
+    with open(path, newline="", encoding="utf-8") as f:
+        return import_records(READERS[fmt](f), user_id, chunk_size, method, progress)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Bulk-import workout history from CSV or JSON Lines.")
+    parser.add_argument("path")
+    parser.add_argument("--user-id", type=int, help="owner of every workout (otherwise read from a user_id column)")
+    parser.add_argument("--format", choices=sorted(READERS), help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per committed transaction")
+    parser.add_argument("--method", choices=("copy", "insert"), default="copy")
+    args = parser.parse_args(argv)
+
+    def progress(report):
+        print(f"  committed {report['workouts']} workouts, {report['exercises']} exercises")
+
+    backend.initialize_database()
+    report = import_workout_history(args.path, args.user_id, args.format, args.chunk_size, args.method, progress)
+    print(
+        f"Imported {report['workouts']} workouts and {report['exercises']} exercises "
+        f"in {report['seconds']}s ({report['rows_per_sec']} rows/sec)"
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,373 @@
+# ingest.py
+
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: nothing stops two processes sharing a journal
+    fcntl = None
+
+import psycopg2
+from psycopg2.pool import PoolError
+
+# Write-behind queue for workout logging. submit() appends the workout to a
+# local journal and returns as soon as it is on disk; a background thread
+# writes queued workouts to the database in batches, one transaction each, so
+# a burst of N workouts costs a few commits instead of N. backend.log_workout()
+# uses one queue per process when INGEST_CONFIG is enabled:
+#
+#   queue = IngestQueue("workouts.journal", write=backend.write_workout_batch).start()
+#   queue.submit({"key": "...", "user_id": 1, "workout_date": "2024-03-02", "duration": 45, "exercises": []})
+#
+# The journal is JSON Lines: {"add": entry} when a workout is queued and
+# {"done": [key, ...]} once a batch is written. It is rewritten with only the
+# queued entries whenever the queue empties (or every `compact_after` done
+# entries), and replayed by start() after a crash. Every entry carries an
+# idempotency key that write() claims in the database (migration 0013) in the
+# same transaction as the workout, so entries written just before a crash,
+# and workouts submitted twice, are written once.
+#
+# Connection errors are retried, with backoff, for as long as it takes; the
+# queue keeps accepting workouts until `max_pending` are waiting, and then
+# submit() waits for room. Entries the database refuses (e.g. an unknown user)
+# are set aside in <journal>.rejected with the error.
+#
+#   python ingest.py status            # what a journal holds
+#   python ingest.py drain             # write what a stopped app left queued
+#   python ingest.py prune --days 7    # forget old idempotency keys
+
+# Errors after which the same batch is tried again later ("database is locked"
+# on the embedded SQLite engine)
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError, sqlite3.OperationalError)
+
+class QueueUnavailable(Exception):
+    """submit() could not queue a workout: the queue stayed full, or it is stopped."""
+
+def read_journal(path):
+    """Returns (entries still queued in the journal at `path`, oldest first, number of unreadable records)."""
+    entries, corrupt = OrderedDict(), 0
+    if not os.path.exists(path):
+        return entries, corrupt
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # An append cut short by a crash; it was never acknowledged.
+                corrupt += 1
+                continue
+            if "add" in record:
+                entries[record["add"]["key"]] = record["add"]
+            else:
+                for key in record["done"]:
+                    entries.pop(key, None)
+    return entries, corrupt
+
+class IngestQueue:
+    """Durable local queue of workouts, written to the database by a background thread."""
+
+    def __init__(self, path, write, prune=None, batch_size=200, linger_seconds=0.05, max_pending=10000,
+                 fsync=True, compact_after=10000, max_retry_delay=30.0, prune_interval=3600.0):
+        self.path = path
+        self.write = write              # write(entries) in one transaction; returns how many were already written
+        self.prune = prune              # prune() every prune_interval seconds, e.g. to forget old keys
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds    # wait this long for a batch to fill
+        self.max_pending = max_pending
+        self.fsync = fsync              # False: entries survive the process crashing, not the machine
+        self.compact_after = compact_after
+        self.max_retry_delay = max_retry_delay
+        self.prune_interval = prune_interval
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()   # key -> entry, oldest first
+        self._in_flight = 0
+        self._file = None
+        self._lock_file = None
+        self._done_since_compact = 0
+        # Group commit: one fsync covers every append made before it started.
+        self._sync_lock = threading.Lock()
+        self._appended = 0
+        self._synced = 0
+        self._stopping = False
+        self._halt = threading.Event()
+        self._thread = None
+        self._stats = {"submitted": 0, "duplicates": 0, "written": 0, "already_written": 0, "rejected": 0,
+                       "recovered": 0, "corrupt_records": 0, "batches": 0, "retries": 0, "full": 0,
+                       "flush_seconds_total": 0.0, "flush_seconds_max": 0.0, "last_flush_seconds": None,
+                       "lag_seconds_max": 0.0, "last_error": None}
+
+    def start(self):
+        """Takes the journal, queues what it still holds and starts writing."""
+        if self._thread is not None:
+            return self
+        self._lock_file = open(self.path + ".lock", "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                self._lock_file = None
+                raise RuntimeError(f"{self.path} is in use by another process") from None
+        with self._cond:
+            self._pending, corrupt = read_journal(self.path)
+            self._stats["recovered"] = len(self._pending)
+            self._stats["corrupt_records"] = corrupt
+            self._rewrite()
+        if self._pending:
+            print(f"Recovered {len(self._pending)} queued workouts from {self.path}")
+        self._stopping = False
+        self._halt.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """Writes what is queued, for up to `timeout` seconds, then stops; the rest stays in the journal."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._halt.set()
+            self._thread.join()
+            self._thread = None
+        with self._cond, self._sync_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+            self._cond.notify_all()
+
+    def submit(self, entry, timeout=None):
+        """Queues `entry`, a dict with a unique "key"; returns False if that key is already queued.
+
+        Returns once the entry is in the journal. While max_pending entries are
+        queued, waits up to `timeout` seconds (None: as long as it takes) for
+        room, then raises QueueUnavailable.
+        """
+        entry.setdefault("queued_at", time.time())
+        record = json.dumps({"add": entry}) + "\n"
+        with self._cond:
+            has_room = self._cond.wait_for(
+                lambda: len(self._pending) < self.max_pending or self._file is None, timeout
+            )
+            if self._file is None:
+                raise QueueUnavailable(f"the queue writing {self.path} is stopped")
+            if entry["key"] in self._pending:
+                self._stats["duplicates"] += 1
+                return False
+            if not has_room:
+                self._stats["full"] += 1
+                raise QueueUnavailable(f"{len(self._pending)} workouts are already queued")
+            self._append(record)
+            self._pending[entry["key"]] = entry
+            self._stats["submitted"] += 1
+            appended = self._appended
+            self._cond.notify_all()
+        if self.fsync:
+            self._sync(appended)
+        return True
+
+    def wait(self, timeout=None):
+        """Waits until everything queued so far is written; returns False on timeout."""
+        with self._cond:
+            queued = set(self._pending)
+            return self._cond.wait_for(lambda: queued.isdisjoint(self._pending) or self._file is None, timeout)
+
+    def stats(self):
+        """Queue depth and age, journal size, counters and flush timings."""
+        with self._cond:
+            oldest = next(iter(self._pending.values()), None)
+            return dict(
+                self._stats,
+                running=self._thread is not None,
+                depth=len(self._pending),
+                in_flight=self._in_flight,
+                oldest_age_seconds=time.time() - oldest["queued_at"] if oldest else 0.0,
+                journal_bytes=self._file.tell() if self._file is not None else 0,
+            )
+
+    # --- JOURNAL ---
+    # Callers hold self._cond.
+    def _append(self, record):
+        position = self._file.tell()
+        try:
+            self._file.write(record)
+            self._file.flush()
+        except OSError:
+            # Leave no partial record for the next append to be glued to.
+            self._file.truncate(position)
+            raise
+        self._appended += 1
+
+    def _sync(self, appended):
+        with self._sync_lock:
+            if self._synced >= appended or self._file is None:
+                return
+            upto = self._appended
+            os.fsync(self._file.fileno())
+            self._synced = upto
+
+    def _rewrite(self):
+        """Replaces the journal with one holding only the queued entries."""
+        with self._sync_lock:
+            temporary = self.path + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                for entry in self._pending.values():
+                    f.write(json.dumps({"add": entry}) + "\n")
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            if self._file is not None:
+                self._file.close()
+            # If the rename is lost in a crash the old journal comes back, and
+            # its extra entries are found to be written already.
+            os.replace(temporary, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._done_since_compact = 0
+            self._synced = self._appended
+
+    # --- WORKER ---
+    def _run(self):
+        delay = 1.0
+        last_prune = time.monotonic()
+        while not self._halt.is_set():
+            if self.prune is not None and time.monotonic() - last_prune >= self.prune_interval:
+                last_prune = time.monotonic()
+                try:
+                    self.prune()
+                except Exception as e:
+                    print(f"Could not prune idempotency keys: {e}")
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._pending or self._stopping, self.prune_interval):
+                    continue
+                if not self._pending:
+                    return
+                if len(self._pending) < self.batch_size and not self._stopping:
+                    self._cond.wait_for(lambda: len(self._pending) >= self.batch_size or self._stopping,
+                                        self.linger_seconds)
+                batch = list(itertools.islice(self._pending.values(), self.batch_size))
+                self._in_flight = len(batch)
+
+            started = time.perf_counter()
+            try:
+                already, rejected = self.write(batch), 0
+            except TRANSIENT_ERRORS as e:
+                self._failed(e)
+                if self._stopping or self._halt.wait(delay):
+                    return
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            except Exception:
+                # Some workout in the batch is refused; find out which.
+                batch, already, rejected = self._write_each(batch)
+            delay = 1.0
+            self._complete(batch, time.perf_counter() - started, already, rejected)
+
+    def _write_each(self, batch):
+        """Writes `batch` one entry at a time; returns (entries dealt with, already written, rejected)."""
+        handled, already, rejected = [], 0, 0
+        for entry in batch:
+            try:
+                already += self.write([entry])
+            except TRANSIENT_ERRORS as e:
+                self._failed(e)
+                break
+            except Exception as e:
+                self._reject(entry, e)
+                rejected += 1
+            handled.append(entry)
+        return handled, already, rejected
+
+    def _reject(self, entry, error):
+        print(f"Rejected queued workout {entry['key']}: {error}")
+        with open(self.path + ".rejected", "a", encoding="utf-8") as f:
+            f.write(json.dumps({"entry": entry, "error": str(error), "rejected_at": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _failed(self, error):
+        with self._cond:
+            self._in_flight = 0
+            self._stats["retries"] += 1
+            self._stats["last_error"] = str(error).strip()
+
+    def _complete(self, entries, seconds, already, rejected):
+        now = time.time()
+        with self._cond:
+            for entry in entries:
+                del self._pending[entry["key"]]
+            self._in_flight = 0
+            if self._file is not None:
+                if not self._pending or self._done_since_compact >= self.compact_after:
+                    self._rewrite()
+                else:
+                    self._append(json.dumps({"done": [entry["key"] for entry in entries]}) + "\n")
+                    self._done_since_compact += len(entries)
+            stats = self._stats
+            stats["batches"] += 1
+            stats["written"] += len(entries) - already - rejected
+            stats["already_written"] += already
+            stats["rejected"] += rejected
+            stats["flush_seconds_total"] += seconds
+            stats["flush_seconds_max"] = max(stats["flush_seconds_max"], seconds)
+            stats["last_flush_seconds"] = seconds
+            if entries:
+                stats["lag_seconds_max"] = max(stats["lag_seconds_max"], now - entries[0]["queued_at"])
+            self._cond.notify_all()
+
+def main(argv):
+    import backend  # imports this module
+
+    parser = argparse.ArgumentParser(description="Inspect or drain a write-behind workout journal.")
+    parser.add_argument("command", choices=("status", "drain", "prune"))
+    parser.add_argument("--journal", default=backend.INGEST_CONFIG["journal_path"])
+    parser.add_argument("--days", type=float, default=backend.INGEST_CONFIG["key_retention_days"],
+                        help="prune: forget idempotency keys older than this")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        entries, corrupt = read_journal(args.journal)
+        print(f"{len(entries)} workouts queued in {args.journal}")
+        if entries:
+            oldest = next(iter(entries.values()))
+            print(f"oldest queued {time.time() - oldest['queued_at']:.0f}s ago")
+        if corrupt:
+            print(f"{corrupt} unreadable records (appends cut short by a crash)")
+        if os.path.exists(args.journal + ".rejected"):
+            with open(args.journal + ".rejected", encoding="utf-8") as f:
+                print(f"{sum(1 for _ in f)} rejected workouts in {args.journal}.rejected")
+        return 0
+
+    backend.initialize_database()
+    if args.command == "prune":
+        print(f"Forgot {backend.prune_idempotency_keys(args.days)} idempotency keys")
+        return 0
+
+    queue = IngestQueue(args.journal, write=backend.write_workout_batch, fsync=backend.INGEST_CONFIG["fsync"])
+    try:
+        queue.start()
+    except RuntimeError as e:
+        print(f"Cannot drain: {e}")
+        return 1
+    queue.stop(timeout=None)
+    stats = queue.stats()
+    print(f"Wrote {stats['written']} workouts in {stats['batches']} batches "
+          f"({stats['already_written']} already written, {stats['rejected']} rejected)")
+    left = len(read_journal(args.journal)[0])
+    if left:
+        print(f"{left} workouts are still queued: {stats['last_error']}")
+    return 1 if left else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
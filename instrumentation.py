@@ -0,0 +1,359 @@
+# instrumentation.py
+
+import functools
+import hashlib
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2
+from psycopg2.extensions import cursor as _cursor
+
+import queries
+
+# Timing for backend functions and the SQL statements they run.
+#
+# When enabled, every backend function decorated with @timed records its wall
+# time and whether it failed, every statement run through a TimedCursor
+# records its wall time, row count and errors (attributed to the backend
+# function that ran it), and backend.transaction() records how long it waited
+# for a pooled connection. Statements slower than `slow_query_ms` go to a
+# bounded slow-query log, with their EXPLAIN plan. Everything can be read as a
+# snapshot (the frontend's Query Performance page) or as Prometheus text.
+#
+# When disabled (the default), @timed costs one attribute check per call and
+# backend.transaction() hands out plain cursors, so nothing is measured at all.
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+class _Series:
+    """Count, sum, max and histogram of one timed thing."""
+
+    __slots__ = ("calls", "errors", "rows", "seconds", "max_seconds", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds, error=False, rows=0):
+        self.calls += 1
+        self.errors += error
+        self.rows += rows
+        self.seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the max for the last bucket)."""
+        if not self.calls:
+            return 0.0
+        rank, seen = q * self.calls, 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(BUCKETS[i], self.max_seconds) if i < len(BUCKETS) else self.max_seconds
+        return self.max_seconds
+
+    def summary(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": round(self.seconds * 1000, 3),
+            "mean_ms": round(self.seconds * 1000 / self.calls, 3) if self.calls else 0.0,
+            "p95_ms": round(self.quantile(0.95) * 1000, 3),
+            "max_ms": round(self.max_seconds * 1000, 3),
+        }
+
+def _normalize(text):
+    return " ".join(text.split())
+
+_statement_names = None
+
+def statement_name(text):
+    """Names a statement after its queries.py constant, or a short hash of its text."""
+    global _statement_names
+    if _statement_names is None:
+        _statement_names = {
+            _normalize(value): name for name, value in vars(queries).items()
+            if name.isupper() and isinstance(value, str)
+        }
+    text = _normalize(text)
+    return _statement_names.get(text) or "sql_" + hashlib.md5(text.encode()).hexdigest()[:10]
+
+class Recorder:
+    """Thread-safe aggregation of function, statement and connection timings."""
+
+    def __init__(self, slow_query_ms=100, slow_log_size=50, explain_slow_queries=True):
+        self.enabled = False
+        self.slow_query_ms = slow_query_ms
+        self.explain_slow_queries = explain_slow_queries
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._slow = deque(maxlen=slow_log_size)
+        self.reset()
+
+    def configure(self, enabled=None, slow_query_ms=None, slow_log_size=None, explain_slow_queries=None):
+        with self._lock:
+            if slow_query_ms is not None:
+                self.slow_query_ms = slow_query_ms
+            if explain_slow_queries is not None:
+                self.explain_slow_queries = explain_slow_queries
+            if slow_log_size is not None and slow_log_size != self._slow.maxlen:
+                self._slow = deque(self._slow, maxlen=slow_log_size)
+            if enabled is not None:
+                self.enabled = enabled
+
+    def reset(self):
+        """Forgets everything recorded so far."""
+        with self._lock:
+            self._functions = {}    # function -> _Series
+            self._acquire = {}      # function -> _Series of connection waits
+            self._statements = {}   # statement name -> [_Series, sql text, set of functions]
+            self._slow_total = 0
+            self._slow.clear()
+
+    # --- recording ---
+    def current_function(self):
+        return getattr(self._local, "function", None)
+
+    def call(self, name, func, args, kwargs):
+        """Runs func(*args, **kwargs) as backend function `name`, timing it."""
+        local = self._local
+        outer = getattr(local, "function", None), getattr(local, "failed", False)
+        local.function, local.failed = name, False
+        started = time.perf_counter()
+        error = True
+        try:
+            result = func(*args, **kwargs)
+            error = local.failed
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            local.function, local.failed = outer
+            with self._lock:
+                self._functions.setdefault(name, _Series()).add(elapsed, error)
+
+    def record_acquire(self, seconds):
+        function = self.current_function() or "-"
+        with self._lock:
+            self._acquire.setdefault(function, _Series()).add(seconds)
+
+    def record_statement(self, cur, query, params, seconds, error):
+        text = query if isinstance(query, str) else (
+            query.decode() if isinstance(query, bytes) else query.as_string(cur.connection)
+        )
+        name = statement_name(text)
+        function = self.current_function() or "-"
+        rows = max(cur.rowcount, 0) if not error else 0
+        if error:
+            self._local.failed = True
+        with self._lock:
+            entry = self._statements.get(name)
+            if entry is None:
+                entry = self._statements[name] = [_Series(), _normalize(text), set()]
+            entry[0].add(seconds, error, rows)
+            entry[2].add(function)
+        if not error and seconds * 1000 >= self.slow_query_ms:
+            self._log_slow(cur, name, text, params, function, seconds, rows)
+
+    def _log_slow(self, cur, name, text, params, function, seconds, rows):
+        plan = None
+        if self.explain_slow_queries and text.lstrip().lower().startswith(_EXPLAINABLE):
+            plan = cur.explain_plan(text, params)
+        entry = {
+            "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "statement": name,
+            "function": function,
+            "sql": _normalize(text),
+            "params": repr(params)[:300] if params is not None else None,
+            "duration_ms": round(seconds * 1000, 3),
+            "rows": rows,
+            "plan": plan,
+        }
+        with self._lock:
+            self._slow_total += 1
+            self._slow.append(entry)
+
+    # --- reading ---
+    def snapshot(self):
+        """Returns {"functions", "statements", "slow_queries", "slow_total"}, hottest first."""
+        with self._lock:
+            functions = []
+            for name, series in self._functions.items():
+                row = dict(series.summary(), function=name)
+                acquire = self._acquire.get(name)
+                row["acquire_mean_ms"] = acquire.summary()["mean_ms"] if acquire else 0.0
+                del row["rows"]
+                functions.append(row)
+            statements = [
+                dict(series.summary(), statement=name, sql=text, functions=sorted(functions_seen))
+                for name, (series, text, functions_seen) in self._statements.items()
+            ]
+            slow = list(reversed(self._slow))
+            slow_total = self._slow_total
+        functions.sort(key=lambda r: r["total_ms"], reverse=True)
+        statements.sort(key=lambda r: r["total_ms"], reverse=True)
+        return {"functions": functions, "statements": statements, "slow_queries": slow, "slow_total": slow_total}
+
+    def prometheus_text(self):
+        """Renders all counters and histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            _histogram(lines, "fitness_backend_function_duration_seconds", "Wall time of backend functions.",
+                       "function", self._functions)
+            _counter(lines, "fitness_backend_function_errors_total", "Backend function calls that failed.",
+                     "function", {k: s.errors for k, s in self._functions.items()})
+            _histogram(lines, "fitness_db_connection_acquire_seconds", "Time spent waiting for a pooled connection.",
+                       "function", self._acquire)
+            statements = {name: entry[0] for name, entry in self._statements.items()}
+            _histogram(lines, "fitness_db_statement_duration_seconds", "Wall time of SQL statements.",
+                       "statement", statements)
+            _counter(lines, "fitness_db_statement_rows_total", "Rows returned or affected by SQL statements.",
+                     "statement", {k: s.rows for k, s in statements.items()})
+            _counter(lines, "fitness_db_statement_errors_total", "SQL statements that raised an error.",
+                     "statement", {k: s.errors for k, s in statements.items()})
+            lines.append("# HELP fitness_db_slow_statements_total Statements slower than the slow-query threshold.")
+            lines.append("# TYPE fitness_db_slow_statements_total counter")
+            lines.append(f"fitness_db_slow_statements_total {self._slow_total}")
+        return "\n".join(lines) + "\n"
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _counter(lines, metric, help_text, label, values):
+    lines.append(f"# HELP {metric} {help_text}")
+    lines.append(f"# TYPE {metric} counter")
+    for key in sorted(values):
+        lines.append(f'{metric}{{{label}="{_label(key)}"}} {values[key]}')
+
+def _histogram(lines, metric, help_text, label, series_by_key):
+    lines.append(f"# HELP {metric} {help_text}")
+    lines.append(f"# TYPE {metric} histogram")
+    for key in sorted(series_by_key):
+        series, cumulative = series_by_key[key], 0
+        for bound, count in zip(BUCKETS + ("+Inf",), series.buckets):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{label}="{_label(key)}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{{label}="{_label(key)}"}} {series.seconds:.6f}')
+        lines.append(f'{metric}_count{{{label}="{_label(key)}"}} {series.calls}')
+
+def _explain(conn, text, params):
+    """EXPLAINs a statement inside the caller's transaction without disturbing it."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SAVEPOINT instrumentation_explain")
+            try:
+                cur.execute("EXPLAIN " + text, params)
+                plan = "\n".join(row[0] for row in cur.fetchall())
+            except psycopg2.Error as e:
+                cur.execute("ROLLBACK TO SAVEPOINT instrumentation_explain")
+                plan = f"(EXPLAIN failed: {e})"
+            cur.execute("RELEASE SAVEPOINT instrumentation_explain")
+        return plan
+    except psycopg2.Error as e:
+        return f"(EXPLAIN failed: {e})"
+
+# Process-wide recorder used by the backend.
+default_recorder = Recorder()
+
+class TimedCursor(_cursor):
+    """psycopg2 cursor that reports every statement to the default recorder."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except Exception:
+            default_recorder.record_statement(self, query, vars, time.perf_counter() - started, True)
+            raise
+        default_recorder.record_statement(self, query, vars, time.perf_counter() - started, False)
+        return result
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            result = super().executemany(query, vars_list)
+        except Exception:
+            default_recorder.record_statement(self, query, None, time.perf_counter() - started, True)
+            raise
+        default_recorder.record_statement(self, query, None, time.perf_counter() - started, False)
+        return result
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            result = super().copy_expert(sql, file, size)
+        except Exception:
+            default_recorder.record_statement(self, sql, None, time.perf_counter() - started, True)
+            raise
+        default_recorder.record_statement(self, sql, None, time.perf_counter() - started, False)
+        return result
+
+    def explain_plan(self, query, params):
+        """The query plan of a statement, for the slow-query log."""
+        return _explain(self.connection, query, params)
+
+def timed(func):
+    """Decorator that records a backend function's wall time and errors while enabled."""
+    name = func.__name__
+    recorder = default_recorder
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not recorder.enabled:
+            return func(*args, **kwargs)
+        return recorder.call(name, func, args, kwargs)
+
+    return wrapper
+
+def enabled():
+    return default_recorder.enabled
+
+def configure(**settings):
+    """Changes enabled, slow_query_ms, slow_log_size or explain_slow_queries at runtime."""
+    default_recorder.configure(**settings)
+
+def reset():
+    default_recorder.reset()
+
+def snapshot():
+    return default_recorder.snapshot()
+
+def prometheus_text():
+    return default_recorder.prometheus_text()
+
+def serve_metrics(port, render=prometheus_text, host="0.0.0.0"):
+    """Serves render() at http://host:port/metrics from a daemon thread; returns the server."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,92 @@
+# loader.py
+
+import re
+import threading
+
+import psycopg2.extensions
+
+# Runs several read statements from queries.py as a single SELECT, so a page
+# that needs N reads pays for one round trip instead of N. Each statement
+# becomes a subquery whose rows come back as one text[][] column, numbered as
+# they come out of the statement so its ORDER BY survives the aggregation:
+#
+#   SELECT (SELECT coalesce(array_agg(ARRAY[c0::text, c1::text] ORDER BY n), '{}')
+#           FROM (SELECT *, row_number() OVER () FROM (<statement 0>) AS s) AS q(c0, c1, n)),
+#          ...
+#
+# and are turned back into the values psycopg2 would have returned for the
+# statement on its own (dates, Decimals, ...), using the column types found by
+# describing each statement the first time this process runs it. That costs
+# one extra round trip per statement text, once per process: the texts are
+# queries.py's constants (and their keyset variants), so it is a fixed, small
+# warm-up rather than a per-request cost. Placeholders
+# are renamed per statement rather than filled in, so the combined text only
+# depends on which statements are combined and instrumentation groups it well.
+#
+#   profile_rows, board_rows = loader.fetch_many(cur, [(queries.USER_PROFILE, (1,)),
+#                                                     (queries.LEADERBOARD, None)])
+
+_PLACEHOLDER = re.compile(r"%(?:\((\w+)\))?s|%%")
+
+# statement text -> type OIDs of its result columns
+_column_types = {}
+_column_types_lock = threading.Lock()
+
+def _rename_placeholders(statement, params, prefix):
+    """Returns (statement, params dict) with every placeholder renamed to %(<prefix>_<name>)s."""
+    positions = iter(range(len(params))) if isinstance(params, (list, tuple)) else None
+    renamed = {}
+
+    def rename(match):
+        if match.group(0) == "%%":
+            return "%%"
+        if positions is not None:
+            i = next(positions)
+            renamed[f"{prefix}_{i}"] = params[i]
+            return f"%({prefix}_{i})s"
+        name = match.group(1)
+        renamed[f"{prefix}_{name}"] = params[name]
+        return f"%({prefix}_{name})s"
+
+    return _PLACEHOLDER.sub(rename, statement), renamed
+
+def column_types(cur, statement, params):
+    """Type OIDs of `statement`'s result columns, described on first use and then remembered.
+
+    The first use runs `statement` with LIMIT 0: one extra round trip per
+    statement text and process.
+    """
+    types = _column_types.get(statement)
+    if types is None:
+        cur.execute(f"SELECT * FROM ({statement}) AS q LIMIT 0", params)
+        types = [column.type_code for column in cur.description]
+        with _column_types_lock:
+            _column_types[statement] = types
+    return types
+
+def combine(cur, statements):
+    """Returns (query, params) selecting each of [(statement, params), ...] as a text[][] column."""
+    columns, combined_params = [], {}
+    for n, (statement, params) in enumerate(statements):
+        names = [f"c{i}" for i in range(len(column_types(cur, statement, params)))]
+        statement, renamed = _rename_placeholders(statement, params or (), f"s{n}")
+        combined_params.update(renamed)
+        # row_number() OVER () numbers the rows in the order the statement returns them.
+        columns.append(
+            "(SELECT coalesce(array_agg(ARRAY[{}] ORDER BY n), '{{}}') "
+            "FROM (SELECT *, row_number() OVER () FROM ({}) AS s) AS q({}, n))".format(
+                ", ".join(f"{name}::text" for name in names), statement, ", ".join(names)))
+    return "SELECT " + ",\n       ".join(columns), combined_params
+
+def _cast(value, caster, cur):
+    return value if value is None or caster is None else caster(value, cur)
+
+def fetch_many(cur, statements):
+    """Runs [(statement, params), ...] in one query; returns each statement's rows as tuples."""
+    query, params = combine(cur, statements)
+    cur.execute(query, params)
+    results = []
+    for (statement, _), rows in zip(statements, cur.fetchone()):
+        casters = [psycopg2.extensions.string_types.get(oid) for oid in _column_types[statement]]
+        results.append([tuple(_cast(value, caster, cur) for value, caster in zip(row, casters)) for row in rows])
+    return results
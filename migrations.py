@@ -0,0 +1,102 @@
+# migrations.py
+
+import os
+import re
+import sys
+
+# The numbered .sql files in migrations/ are the single source of truth for the
+# schema. The runner below applies them in order from Python, and
+# "fitness db.sql" pulls the very same files in with psql's \ir. Every file
+# records itself in schema_version, so both paths leave the same bookkeeping.
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# The embedded SQLite engine's schema (see sqlite_storage.py), numbered the same way.
+SQLITE_MIGRATIONS_DIR = os.path.join(MIGRATIONS_DIR, "sqlite")
+SQL_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fitness db.sql")
+
+# Arbitrary constant used with pg_advisory_xact_lock so that two processes
+# starting at the same time do not apply the same migration twice.
+MIGRATION_LOCK_KEY = 4761016
+
+_FILENAME_RE = re.compile(r"^(\d{4})_([a-z0-9_]+)\.sql$")
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Returns [(version, name, sql_text), ...] for every migration file in a directory, in order."""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME_RE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            migrations.append((int(match.group(1)), match.group(2), f.read()))
+
+    versions = [version for version, _, _ in migrations]
+    if versions != list(range(1, len(versions) + 1)):
+        raise RuntimeError(f"Migration versions must be contiguous from 0001, found {versions}")
+    return migrations
+
+def latest_version():
+    """Returns the version the schema reaches once every migration is applied."""
+    migrations = load_migrations()
+    return migrations[-1][0] if migrations else 0
+
+def applied_versions(cur):
+    """Returns the set of migration versions already recorded in the database."""
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return set()
+    cur.execute("SELECT version FROM schema_version")
+    return {row[0] for row in cur.fetchall()}
+
+def migrate(cur):
+    """Applies all pending migrations on the given cursor's transaction.
+
+    Returns the list of (version, name) pairs that were applied. The caller owns
+    the transaction, so either every pending migration lands or none does.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+    done = applied_versions(cur)
+    applied = []
+    for version, name, sql_text in load_migrations():
+        if version in done:
+            continue
+        cur.execute(sql_text)
+        cur.execute(
+            "INSERT INTO schema_version (version, name) VALUES (%s, %s) ON CONFLICT (version) DO NOTHING",
+            (version, name)
+        )
+        applied.append((version, name))
+    return applied
+
+def check_sql_script(path=SQL_SCRIPT):
+    """Returns a list of problems if the SQL setup script does not include every migration."""
+    with open(path, encoding="utf-8") as f:
+        included = re.findall(r"^\\ir\s+migrations/(\S+\.sql)\s*$", f.read(), re.MULTILINE)
+    expected = [f"{version:04d}_{name}.sql" for version, name, _ in load_migrations()]
+    if included == expected:
+        return []
+    return [f"{os.path.basename(path)} includes {included}, expected {expected}"]
+
+def main(argv):
+    import backend
+
+    if "--check" in argv:
+        problems = check_sql_script()
+        for problem in problems:
+            print(problem)
+        return 1 if problems else 0
+
+    with backend.transaction() as cur:
+        if "--status" in argv:
+            done = applied_versions(cur)
+            for version, name, _ in load_migrations():
+                print(f"{version:04d} {name:<40} {'applied' if version in done else 'pending'}")
+            return 0
+        applied = migrate(cur)
+    for version, name in applied:
+        print(f"Applied {version:04d}_{name}")
+    if not applied:
+        print(f"Schema is up to date (version {latest_version()}).")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
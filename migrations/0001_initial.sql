@@ -0,0 +1,53 @@
+-- 0001_initial: baseline schema, as originally created by backend.initialize_database().
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Table to store user profile information
+CREATE TABLE IF NOT EXISTS users (
+    user_id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    email VARCHAR(255) UNIQUE NOT NULL,
+    weight_kg NUMERIC(5, 2)
+);
+
+-- Table to manage friendships (many-to-many relationship between users)
+CREATE TABLE IF NOT EXISTS friends (
+    user_id INTEGER REFERENCES users(user_id),
+    friend_id INTEGER REFERENCES users(user_id),
+    PRIMARY KEY (user_id, friend_id)
+);
+
+-- Table to store workout session logs
+CREATE TABLE IF NOT EXISTS workouts (
+    workout_id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(user_id),
+    workout_date DATE NOT NULL,
+    duration_minutes INTEGER
+);
+
+-- Table to store details of exercises performed in a workout
+CREATE TABLE IF NOT EXISTS exercises (
+    exercise_id SERIAL PRIMARY KEY,
+    workout_id INTEGER NOT NULL REFERENCES workouts(workout_id) ON DELETE CASCADE,
+    exercise_name VARCHAR(255) NOT NULL,
+    sets INTEGER,
+    reps INTEGER,
+    weight_kg NUMERIC(6, 2)
+);
+
+-- Table to store personal fitness goals
+CREATE TABLE IF NOT EXISTS goals (
+    goal_id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(user_id),
+    goal_description TEXT,
+    target_value INTEGER,
+    start_date DATE DEFAULT CURRENT_DATE,
+    end_date DATE,
+    is_active BOOLEAN DEFAULT TRUE
+);
+
+INSERT INTO schema_version (version, name) VALUES (1, 'initial') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,18 @@
+-- 0002_cascade_user_deletes: deleting a user removes their friendships, workouts and goals.
+-- Databases created by older versions of backend.py were missing ON DELETE CASCADE here.
+
+ALTER TABLE friends
+    DROP CONSTRAINT IF EXISTS friends_user_id_fkey,
+    ADD CONSTRAINT friends_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    DROP CONSTRAINT IF EXISTS friends_friend_id_fkey,
+    ADD CONSTRAINT friends_friend_id_fkey FOREIGN KEY (friend_id) REFERENCES users(user_id) ON DELETE CASCADE;
+
+ALTER TABLE workouts
+    DROP CONSTRAINT IF EXISTS workouts_user_id_fkey,
+    ADD CONSTRAINT workouts_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE;
+
+ALTER TABLE goals
+    DROP CONSTRAINT IF EXISTS goals_user_id_fkey,
+    ADD CONSTRAINT goals_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE;
+
+INSERT INTO schema_version (version, name) VALUES (2, 'cascade_user_deletes') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,31 @@
+-- 0003_hot_path_indexes: indexes for the backend's hot query paths.
+-- queries.py holds the statements these serve; `python explain_check.py` shows each one using an index.
+
+-- get_user_workouts, get_workout_statistics: filter by user, newest first.
+CREATE INDEX IF NOT EXISTS workouts_user_id_workout_date_idx ON workouts (user_id, workout_date DESC);
+
+-- get_leaderboard: current-week range over all users.
+CREATE INDEX IF NOT EXISTS workouts_workout_date_idx ON workouts (workout_date);
+
+-- get_workout_details, and the ON DELETE CASCADE from workouts.
+CREATE INDEX IF NOT EXISTS exercises_workout_id_idx ON exercises (workout_id);
+
+-- Per-exercise lookups by name, such as the personal-records recomputation in
+-- 0005_personal_records. 0010_exercise_catalog drops it: those go by type there.
+CREATE INDEX IF NOT EXISTS exercises_exercise_name_workout_id_idx ON exercises (exercise_name, workout_id);
+
+-- Reverse friendship lookup, and the ON DELETE CASCADE from users.
+CREATE INDEX IF NOT EXISTS friends_friend_id_idx ON friends (friend_id);
+
+-- get_active_goal. At most one active goal per user; keep only the newest if
+-- older data has several.
+UPDATE goals g
+SET is_active = FALSE
+WHERE g.is_active
+  AND EXISTS (
+      SELECT 1 FROM goals newer
+      WHERE newer.user_id = g.user_id AND newer.is_active AND newer.goal_id > g.goal_id
+  );
+CREATE UNIQUE INDEX IF NOT EXISTS goals_one_active_per_user_idx ON goals (user_id) WHERE is_active;
+
+INSERT INTO schema_version (version, name) VALUES (3, 'hot_path_indexes') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,88 @@
+-- 0004_weekly_activity_rollup: per-user, per-week workout totals behind get_leaderboard().
+-- Kept current by statement-level triggers on workouts, so log_workout, bulk
+-- imports (COPY) and deletes, including ON DELETE CASCADE from users, all
+-- maintain it. `python rollups.py rebuild` / `check` rebuild and verify it.
+
+CREATE TABLE IF NOT EXISTS weekly_activity (
+    user_id INTEGER NOT NULL,
+    week_start DATE NOT NULL,
+    workout_count INTEGER NOT NULL,
+    total_minutes BIGINT NOT NULL,
+    PRIMARY KEY (user_id, week_start)
+);
+
+-- Leaderboard: one week, ranked by minutes.
+CREATE INDEX IF NOT EXISTS weekly_activity_week_start_total_minutes_idx
+    ON weekly_activity (week_start, total_minutes DESC);
+
+CREATE OR REPLACE FUNCTION workouts_maintain_weekly_activity() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE weekly_activity wa
+        SET workout_count = wa.workout_count - delta.workouts,
+            total_minutes = wa.total_minutes - delta.minutes
+        FROM (
+            SELECT user_id, date_trunc('week', workout_date)::date AS week_start,
+                   count(*) AS workouts, COALESCE(sum(duration_minutes), 0) AS minutes
+            FROM old_rows
+            GROUP BY 1, 2
+        ) delta
+        WHERE wa.user_id = delta.user_id AND wa.week_start = delta.week_start;
+
+        DELETE FROM weekly_activity wa
+        USING (SELECT DISTINCT user_id, date_trunc('week', workout_date)::date AS week_start FROM old_rows) k
+        WHERE wa.user_id = k.user_id AND wa.week_start = k.week_start
+          AND wa.workout_count <= 0;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO weekly_activity (user_id, week_start, workout_count, total_minutes)
+        SELECT user_id, date_trunc('week', workout_date)::date,
+               count(*), COALESCE(sum(duration_minutes), 0)
+        FROM new_rows
+        GROUP BY 1, 2
+        ON CONFLICT (user_id, week_start) DO UPDATE
+        SET workout_count = weekly_activity.workout_count + EXCLUDED.workout_count,
+            total_minutes = weekly_activity.total_minutes + EXCLUDED.total_minutes;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS workouts_weekly_activity_insert ON workouts;
+CREATE TRIGGER workouts_weekly_activity_insert
+    AFTER INSERT ON workouts REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION workouts_maintain_weekly_activity();
+
+DROP TRIGGER IF EXISTS workouts_weekly_activity_update ON workouts;
+CREATE TRIGGER workouts_weekly_activity_update
+    AFTER UPDATE ON workouts REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION workouts_maintain_weekly_activity();
+
+DROP TRIGGER IF EXISTS workouts_weekly_activity_delete ON workouts;
+CREATE TRIGGER workouts_weekly_activity_delete
+    AFTER DELETE ON workouts REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION workouts_maintain_weekly_activity();
+
+-- TRUNCATE fires no row or DELETE triggers; clear the rollup with it. (DELETE
+-- rather than TRUNCATE, which fails if weekly_activity is in the same command.)
+CREATE OR REPLACE FUNCTION workouts_truncate_weekly_activity() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM weekly_activity;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS workouts_weekly_activity_truncate ON workouts;
+CREATE TRIGGER workouts_weekly_activity_truncate
+    AFTER TRUNCATE ON workouts
+    FOR EACH STATEMENT EXECUTE FUNCTION workouts_truncate_weekly_activity();
+
+-- Backfill from existing workouts.
+DELETE FROM weekly_activity;
+INSERT INTO weekly_activity (user_id, week_start, workout_count, total_minutes)
+SELECT user_id, date_trunc('week', workout_date)::date, count(*), COALESCE(sum(duration_minutes), 0)
+FROM workouts
+GROUP BY 1, 2;
+
+INSERT INTO schema_version (version, name) VALUES (4, 'weekly_activity_rollup') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,128 @@
+-- 0005_personal_records: best weight, best volume (sets x reps x weight) and best
+-- estimated 1RM per user per exercise, each with the workout it was set in.
+-- Kept current by statement-level triggers on exercises, so log_workout and
+-- bulk imports update records incrementally in the same transaction.
+
+-- Epley estimate of the one-rep max. A single rep is the lift itself.
+CREATE OR REPLACE FUNCTION estimated_1rm(weight_kg NUMERIC, reps INTEGER) RETURNS NUMERIC AS $$
+    SELECT CASE
+        WHEN weight_kg IS NULL OR reps IS NULL OR reps < 1 THEN 0
+        WHEN reps = 1 THEN weight_kg
+        ELSE round(weight_kg * (1 + reps / 30.0), 2)
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS personal_records (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    exercise_name VARCHAR(255) NOT NULL,
+    best_weight_kg NUMERIC(6, 2) NOT NULL,
+    best_weight_workout_id INTEGER NOT NULL,
+    best_volume_kg NUMERIC(14, 2) NOT NULL,
+    best_volume_workout_id INTEGER NOT NULL,
+    best_e1rm_kg NUMERIC(8, 2) NOT NULL,
+    best_e1rm_workout_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, exercise_name)
+);
+
+-- Per-exercise-row metrics that records are built from.
+CREATE OR REPLACE VIEW exercise_metrics AS
+SELECT w.user_id, e.exercise_name, e.workout_id,
+       COALESCE(e.weight_kg, 0) AS weight_kg,
+       COALESCE(e.sets * e.reps * e.weight_kg, 0) AS volume_kg,
+       estimated_1rm(e.weight_kg, e.reps) AS e1rm_kg
+FROM exercises e
+JOIN workouts w ON w.workout_id = e.workout_id;
+
+-- What personal_records should contain, computed from scratch. Used to recompute
+-- records after deletes, by `python rollups.py rebuild` and by the consistency check.
+CREATE OR REPLACE VIEW personal_records_expected AS
+SELECT user_id, exercise_name,
+       max(weight_kg) AS best_weight_kg, (array_agg(workout_id ORDER BY weight_kg DESC))[1] AS best_weight_workout_id,
+       max(volume_kg) AS best_volume_kg, (array_agg(workout_id ORDER BY volume_kg DESC))[1] AS best_volume_workout_id,
+       max(e1rm_kg) AS best_e1rm_kg, (array_agg(workout_id ORDER BY e1rm_kg DESC))[1] AS best_e1rm_workout_id
+FROM exercise_metrics
+GROUP BY user_id, exercise_name;
+
+CREATE OR REPLACE FUNCTION exercises_maintain_personal_records() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        -- Only records whose source row went away need recomputing: drop those
+        -- with nothing left to hold a record, recompute the rest.
+        DELETE FROM personal_records pr
+        USING old_rows o
+        WHERE o.exercise_name = pr.exercise_name
+          AND o.workout_id IN (pr.best_weight_workout_id, pr.best_volume_workout_id, pr.best_e1rm_workout_id)
+          AND NOT EXISTS (
+              SELECT 1 FROM exercise_metrics m
+              WHERE m.user_id = pr.user_id AND m.exercise_name = pr.exercise_name
+          );
+
+        INSERT INTO personal_records AS pr
+        SELECT x.*
+        FROM personal_records_expected x
+        JOIN (
+            SELECT DISTINCT p.user_id, p.exercise_name
+            FROM personal_records p
+            JOIN old_rows o
+              ON o.exercise_name = p.exercise_name
+             AND o.workout_id IN (p.best_weight_workout_id, p.best_volume_workout_id, p.best_e1rm_workout_id)
+        ) affected ON affected.user_id = x.user_id AND affected.exercise_name = x.exercise_name
+        ON CONFLICT (user_id, exercise_name) DO UPDATE SET
+            best_weight_kg = EXCLUDED.best_weight_kg,
+            best_weight_workout_id = EXCLUDED.best_weight_workout_id,
+            best_volume_kg = EXCLUDED.best_volume_kg,
+            best_volume_workout_id = EXCLUDED.best_volume_workout_id,
+            best_e1rm_kg = EXCLUDED.best_e1rm_kg,
+            best_e1rm_workout_id = EXCLUDED.best_e1rm_workout_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO personal_records AS pr
+        SELECT m.user_id, m.exercise_name,
+               max(m.weight_kg), (array_agg(m.workout_id ORDER BY m.weight_kg DESC))[1],
+               max(m.volume_kg), (array_agg(m.workout_id ORDER BY m.volume_kg DESC))[1],
+               max(m.e1rm_kg), (array_agg(m.workout_id ORDER BY m.e1rm_kg DESC))[1]
+        FROM (
+            SELECT w.user_id, n.exercise_name, n.workout_id,
+                   COALESCE(n.weight_kg, 0) AS weight_kg,
+                   COALESCE(n.sets * n.reps * n.weight_kg, 0) AS volume_kg,
+                   estimated_1rm(n.weight_kg, n.reps) AS e1rm_kg
+            FROM new_rows n
+            JOIN workouts w ON w.workout_id = n.workout_id
+        ) m
+        GROUP BY m.user_id, m.exercise_name
+        ON CONFLICT (user_id, exercise_name) DO UPDATE SET
+            best_weight_workout_id = CASE WHEN EXCLUDED.best_weight_kg > pr.best_weight_kg
+                                          THEN EXCLUDED.best_weight_workout_id ELSE pr.best_weight_workout_id END,
+            best_weight_kg = GREATEST(pr.best_weight_kg, EXCLUDED.best_weight_kg),
+            best_volume_workout_id = CASE WHEN EXCLUDED.best_volume_kg > pr.best_volume_kg
+                                          THEN EXCLUDED.best_volume_workout_id ELSE pr.best_volume_workout_id END,
+            best_volume_kg = GREATEST(pr.best_volume_kg, EXCLUDED.best_volume_kg),
+            best_e1rm_workout_id = CASE WHEN EXCLUDED.best_e1rm_kg > pr.best_e1rm_kg
+                                        THEN EXCLUDED.best_e1rm_workout_id ELSE pr.best_e1rm_workout_id END,
+            best_e1rm_kg = GREATEST(pr.best_e1rm_kg, EXCLUDED.best_e1rm_kg);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS exercises_personal_records_insert ON exercises;
+CREATE TRIGGER exercises_personal_records_insert
+    AFTER INSERT ON exercises REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION exercises_maintain_personal_records();
+
+DROP TRIGGER IF EXISTS exercises_personal_records_update ON exercises;
+CREATE TRIGGER exercises_personal_records_update
+    AFTER UPDATE ON exercises REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION exercises_maintain_personal_records();
+
+DROP TRIGGER IF EXISTS exercises_personal_records_delete ON exercises;
+CREATE TRIGGER exercises_personal_records_delete
+    AFTER DELETE ON exercises REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION exercises_maintain_personal_records();
+
+-- Backfill from existing exercises.
+DELETE FROM personal_records;
+INSERT INTO personal_records SELECT * FROM personal_records_expected;
+
+INSERT INTO schema_version (version, name) VALUES (5, 'personal_records') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,8 @@
+-- 0006_workout_history_keyset: index for keyset pagination of a user's history on
+-- (workout_date, workout_id), newest first. Replaces the (user_id, workout_date DESC)
+-- index from 0003, which is a prefix of this one.
+
+CREATE INDEX IF NOT EXISTS workouts_user_id_date_id_idx ON workouts (user_id, workout_date DESC, workout_id DESC);
+DROP INDEX IF EXISTS workouts_user_id_workout_date_idx;
+
+INSERT INTO schema_version (version, name) VALUES (6, 'workout_history_keyset') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,23 @@
+-- 0007_exercise_workout_date: exercises carry their workout's date, so that workouts and
+-- exercises can both be range-partitioned on it with every exercise in the same date range
+-- as its workout (see partitioning.py). The composite foreign key keeps the copy in step,
+-- including when a workout's date is changed.
+
+ALTER TABLE exercises ADD COLUMN IF NOT EXISTS workout_date DATE;
+
+UPDATE exercises e
+SET workout_date = w.workout_date
+FROM workouts w
+WHERE w.workout_id = e.workout_id AND e.workout_date IS NULL;
+
+ALTER TABLE exercises ALTER COLUMN workout_date SET NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS workouts_workout_id_workout_date_key ON workouts (workout_id, workout_date);
+
+ALTER TABLE exercises
+    DROP CONSTRAINT IF EXISTS exercises_workout_id_fkey,
+    DROP CONSTRAINT IF EXISTS exercises_workout_id_workout_date_fkey,
+    ADD CONSTRAINT exercises_workout_id_workout_date_fkey FOREIGN KEY (workout_id, workout_date)
+        REFERENCES workouts (workout_id, workout_date) ON DELETE CASCADE ON UPDATE CASCADE;
+
+INSERT INTO schema_version (version, name) VALUES (7, 'exercise_workout_date') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,48 @@
+-- 0008_partition_maintenance: creates the monthly partitions of workouts and exercises
+-- once `python partitioning.py convert` has turned them into tables partitioned by
+-- workout_date. Does nothing while they are plain tables. backend.initialize_database()
+-- calls it to keep PARTITION_MONTHS_AHEAD months ahead of today; it can also run from cron:
+--
+--   SELECT * FROM create_monthly_partitions(CURRENT_DATE, (CURRENT_DATE + interval '3 months')::date);
+--
+-- A month whose rows already went to workouts_default is skipped (and reported): creating
+-- its partition would have to move them first.
+
+CREATE OR REPLACE FUNCTION create_monthly_partitions(first_month DATE, last_month DATE)
+RETURNS TABLE (month DATE, action TEXT) AS $$
+DECLARE
+    nsp TEXT;
+    parent TEXT;
+    month_end DATE;
+BEGIN
+    SELECT n.nspname INTO nsp
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = to_regclass('workouts') AND c.relkind = 'p';
+    IF nsp IS NULL THEN
+        RETURN;
+    END IF;
+
+    month := date_trunc('month', first_month)::date;
+    WHILE month <= last_month LOOP
+        month_end := (month + interval '1 month')::date;
+        IF to_regclass(format('%I.%I', nsp, 'workouts_p' || to_char(month, 'YYYYMM'))) IS NOT NULL THEN
+            action := 'exists';
+        ELSIF EXISTS (SELECT 1 FROM workouts_default WHERE workout_date >= month AND workout_date < month_end) THEN
+            action := 'skipped: rows in workouts_default';
+        ELSE
+            FOREACH parent IN ARRAY ARRAY['workouts', 'exercises'] LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I.%I PARTITION OF %I.%I FOR VALUES FROM (%L) TO (%L)',
+                    nsp, parent || '_p' || to_char(month, 'YYYYMM'), nsp, parent, month, month_end
+                );
+            END LOOP;
+            action := 'created';
+        END IF;
+        RETURN NEXT;
+        month := month_end;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+INSERT INTO schema_version (version, name) VALUES (8, 'partition_maintenance') ON CONFLICT (version) DO NOTHING;
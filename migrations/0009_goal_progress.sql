@@ -0,0 +1,22 @@
+-- 0009_goal_progress: weekly goal progress of every user with an active goal, as of
+-- the last batch evaluation (`python goals.py evaluate`, see goals.py). One row per
+-- user, replaced on each run; streaks count consecutive weeks that met the target
+-- since the goal was set.
+
+CREATE TABLE IF NOT EXISTS goal_progress (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    goal_id INTEGER NOT NULL,
+    week_start DATE NOT NULL,
+    target_value INTEGER NOT NULL,
+    workouts INTEGER NOT NULL,
+    minutes BIGINT NOT NULL,
+    met BOOLEAN NOT NULL,
+    prior_streak_weeks INTEGER NOT NULL,
+    streak_weeks INTEGER NOT NULL,
+    evaluated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Notifications: who is behind (or on target) in a given week.
+CREATE INDEX IF NOT EXISTS goal_progress_week_start_met_idx ON goal_progress (week_start, met);
+
+INSERT INTO schema_version (version, name) VALUES (9, 'goal_progress') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,243 @@
+-- 0010_exercise_catalog: a catalog of exercise types with canonical names and aliases.
+-- Exercise rows reference it by an integer exercise_type_id, so "Bench Press", "bench
+-- press " and "Bench press" are one exercise, and per-exercise stats and personal records
+-- group on a small indexed integer instead of free text. exercise_name keeps the name as
+-- entered.
+--
+-- On small tables existing rows are backfilled right here. On large ones this only adds
+-- the (nullable) column, and `python catalog.py backfill` fills it online in short batches
+-- and builds the index concurrently; rows without a type are left out of personal records
+-- until then.
+
+-- Names are compared case-insensitively with whitespace collapsed.
+CREATE OR REPLACE FUNCTION normalize_exercise_name(name TEXT) RETURNS TEXT AS $$
+    SELECT lower(btrim(regexp_replace(name, '\s+', ' ', 'g')))
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS exercise_catalog (
+    exercise_type_id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS exercise_catalog_normalized_name_key ON exercise_catalog (normalize_exercise_name(name));
+
+-- Every name an exercise type is known by, normalized, including its canonical name.
+CREATE TABLE IF NOT EXISTS exercise_aliases (
+    alias VARCHAR(255) PRIMARY KEY CHECK (alias = normalize_exercise_name(alias)),
+    exercise_type_id INTEGER NOT NULL REFERENCES exercise_catalog(exercise_type_id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS exercise_aliases_exercise_type_id_idx ON exercise_aliases (exercise_type_id);
+
+INSERT INTO exercise_catalog (name)
+VALUES ('Bench Press'), ('Squat'), ('Deadlift'), ('Overhead Press'), ('Rows'), ('Lat Pulldown'),
+       ('Leg Press'), ('Hip Thrust'), ('Bicep Curls'), ('Lunges'), ('Calf Raises'), ('Pull-ups'),
+       ('Tricep Dips'), ('Plank'), ('Running'), ('Cycling'), ('Rowing'), ('Yoga'), ('Yoga Flow')
+ON CONFLICT ((normalize_exercise_name(name))) DO NOTHING;
+
+INSERT INTO exercise_aliases (alias, exercise_type_id)
+SELECT normalize_exercise_name(name), exercise_type_id FROM exercise_catalog
+ON CONFLICT (alias) DO NOTHING;
+
+INSERT INTO exercise_aliases (alias, exercise_type_id)
+SELECT a.alias, c.exercise_type_id
+FROM (VALUES
+    ('bench', 'Bench Press'), ('bench press (barbell)', 'Bench Press'), ('barbell bench press', 'Bench Press'),
+    ('squats', 'Squat'), ('back squat', 'Squat'), ('deadlifts', 'Deadlift'),
+    ('ohp', 'Overhead Press'), ('shoulder press', 'Overhead Press'), ('military press', 'Overhead Press'),
+    ('row', 'Rows'), ('barbell row', 'Rows'), ('bent over row', 'Rows'), ('lat pull-down', 'Lat Pulldown'),
+    ('hip thrusts', 'Hip Thrust'), ('bicep curl', 'Bicep Curls'), ('biceps curls', 'Bicep Curls'),
+    ('curls', 'Bicep Curls'), ('lunge', 'Lunges'), ('calf raise', 'Calf Raises'),
+    ('pullups', 'Pull-ups'), ('pull ups', 'Pull-ups'), ('pull-up', 'Pull-ups'), ('pullup', 'Pull-ups'),
+    ('dips', 'Tricep Dips'), ('tricep dip', 'Tricep Dips'), ('run', 'Running'), ('jogging', 'Running'),
+    ('cycle', 'Cycling'), ('bike', 'Cycling'), ('rower', 'Rowing')
+) AS a (alias, name)
+JOIN exercise_catalog c ON normalize_exercise_name(c.name) = normalize_exercise_name(a.name)
+ON CONFLICT (alias) DO NOTHING;
+
+-- The exercise type a name resolves to, adding it to the catalog if it is new.
+CREATE OR REPLACE FUNCTION resolve_exercise_type(raw_name TEXT) RETURNS INTEGER AS $$
+DECLARE
+    key TEXT := normalize_exercise_name(raw_name);
+    type_id INTEGER;
+BEGIN
+    IF key IS NULL OR key = '' THEN
+        RETURN NULL;
+    END IF;
+    SELECT a.exercise_type_id INTO type_id FROM exercise_aliases a WHERE a.alias = key;
+    IF FOUND THEN
+        RETURN type_id;
+    END IF;
+    -- Concurrent callers adding the same name end up with the same entry.
+    INSERT INTO exercise_catalog (name) VALUES (btrim(regexp_replace(raw_name, '\s+', ' ', 'g')))
+    ON CONFLICT ((normalize_exercise_name(name))) DO NOTHING
+    RETURNING exercise_type_id INTO type_id;
+    IF type_id IS NULL THEN
+        SELECT c.exercise_type_id INTO type_id FROM exercise_catalog c WHERE normalize_exercise_name(c.name) = key;
+    END IF;
+    INSERT INTO exercise_aliases (alias, exercise_type_id) VALUES (key, type_id) ON CONFLICT (alias) DO NOTHING;
+    SELECT a.exercise_type_id INTO type_id FROM exercise_aliases a WHERE a.alias = key;
+    RETURN type_id;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE exercises ADD COLUMN IF NOT EXISTS exercise_type_id INTEGER REFERENCES exercise_catalog(exercise_type_id);
+
+-- Writers may pass exercise_type_id (bulk loads resolve names once per batch) or leave it
+-- to this trigger. Renaming an exercise re-resolves its type.
+CREATE OR REPLACE FUNCTION exercises_resolve_type() RETURNS trigger AS $$
+BEGIN
+    IF NEW.exercise_type_id IS NULL
+       OR (TG_OP = 'UPDATE' AND NEW.exercise_name IS DISTINCT FROM OLD.exercise_name
+           AND NEW.exercise_type_id IS NOT DISTINCT FROM OLD.exercise_type_id) THEN
+        NEW.exercise_type_id := resolve_exercise_type(NEW.exercise_name);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS exercises_resolve_type ON exercises;
+CREATE TRIGGER exercises_resolve_type
+    BEFORE INSERT OR UPDATE OF exercise_name, exercise_type_id ON exercises
+    FOR EACH ROW EXECUTE FUNCTION exercises_resolve_type();
+
+-- Fills exercise_type_id for rows with exercise_id in (after_id, after_id + batch_size
+-- rows]; returns the last exercise_id looked at, or NULL once past the end.
+CREATE OR REPLACE FUNCTION backfill_exercise_types(after_id INTEGER, batch_size INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    last_id INTEGER;
+BEGIN
+    SELECT max(b.exercise_id) INTO last_id
+    FROM (SELECT exercise_id FROM exercises WHERE exercise_id > after_id ORDER BY exercise_id LIMIT batch_size) b;
+    IF last_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+    UPDATE exercises e
+    SET exercise_type_id = r.exercise_type_id
+    FROM (
+        SELECT n.exercise_name, resolve_exercise_type(n.exercise_name) AS exercise_type_id
+        FROM (
+            SELECT DISTINCT exercise_name FROM exercises
+            WHERE exercise_id > after_id AND exercise_id <= last_id AND exercise_type_id IS NULL
+        ) n
+    ) r
+    WHERE e.exercise_id > after_id AND e.exercise_id <= last_id
+      AND e.exercise_type_id IS NULL AND e.exercise_name = r.exercise_name;
+    RETURN last_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Personal records move from names to exercise types.
+DROP VIEW IF EXISTS personal_records_expected;
+DROP VIEW IF EXISTS exercise_metrics;
+DROP TABLE IF EXISTS personal_records;
+
+CREATE TABLE personal_records (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    exercise_type_id INTEGER NOT NULL REFERENCES exercise_catalog(exercise_type_id),
+    best_weight_kg NUMERIC(6, 2) NOT NULL,
+    best_weight_workout_id INTEGER NOT NULL,
+    best_volume_kg NUMERIC(14, 2) NOT NULL,
+    best_volume_workout_id INTEGER NOT NULL,
+    best_e1rm_kg NUMERIC(8, 2) NOT NULL,
+    best_e1rm_workout_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, exercise_type_id)
+);
+
+CREATE VIEW exercise_metrics AS
+SELECT w.user_id, e.exercise_type_id, e.workout_id,
+       COALESCE(e.weight_kg, 0) AS weight_kg,
+       COALESCE(e.sets * e.reps * e.weight_kg, 0) AS volume_kg,
+       estimated_1rm(e.weight_kg, e.reps) AS e1rm_kg
+FROM exercises e
+JOIN workouts w ON w.workout_id = e.workout_id AND w.workout_date = e.workout_date
+WHERE e.exercise_type_id IS NOT NULL;
+
+CREATE VIEW personal_records_expected AS
+SELECT user_id, exercise_type_id,
+       max(weight_kg) AS best_weight_kg, (array_agg(workout_id ORDER BY weight_kg DESC))[1] AS best_weight_workout_id,
+       max(volume_kg) AS best_volume_kg, (array_agg(workout_id ORDER BY volume_kg DESC))[1] AS best_volume_workout_id,
+       max(e1rm_kg) AS best_e1rm_kg, (array_agg(workout_id ORDER BY e1rm_kg DESC))[1] AS best_e1rm_workout_id
+FROM exercise_metrics
+GROUP BY user_id, exercise_type_id;
+
+CREATE OR REPLACE FUNCTION exercises_maintain_personal_records() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        -- Only records whose source row went away need recomputing: drop those
+        -- with nothing left to hold a record, recompute the rest.
+        DELETE FROM personal_records pr
+        USING old_rows o
+        WHERE o.exercise_type_id = pr.exercise_type_id
+          AND o.workout_id IN (pr.best_weight_workout_id, pr.best_volume_workout_id, pr.best_e1rm_workout_id)
+          AND NOT EXISTS (
+              SELECT 1 FROM exercise_metrics m
+              WHERE m.user_id = pr.user_id AND m.exercise_type_id = pr.exercise_type_id
+          );
+
+        INSERT INTO personal_records AS pr
+        SELECT x.*
+        FROM personal_records_expected x
+        JOIN (
+            SELECT DISTINCT p.user_id, p.exercise_type_id
+            FROM personal_records p
+            JOIN old_rows o
+              ON o.exercise_type_id = p.exercise_type_id
+             AND o.workout_id IN (p.best_weight_workout_id, p.best_volume_workout_id, p.best_e1rm_workout_id)
+        ) affected ON affected.user_id = x.user_id AND affected.exercise_type_id = x.exercise_type_id
+        ON CONFLICT (user_id, exercise_type_id) DO UPDATE SET
+            best_weight_kg = EXCLUDED.best_weight_kg,
+            best_weight_workout_id = EXCLUDED.best_weight_workout_id,
+            best_volume_kg = EXCLUDED.best_volume_kg,
+            best_volume_workout_id = EXCLUDED.best_volume_workout_id,
+            best_e1rm_kg = EXCLUDED.best_e1rm_kg,
+            best_e1rm_workout_id = EXCLUDED.best_e1rm_workout_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO personal_records AS pr
+        SELECT m.user_id, m.exercise_type_id,
+               max(m.weight_kg), (array_agg(m.workout_id ORDER BY m.weight_kg DESC))[1],
+               max(m.volume_kg), (array_agg(m.workout_id ORDER BY m.volume_kg DESC))[1],
+               max(m.e1rm_kg), (array_agg(m.workout_id ORDER BY m.e1rm_kg DESC))[1]
+        FROM (
+            SELECT w.user_id, n.exercise_type_id, n.workout_id,
+                   COALESCE(n.weight_kg, 0) AS weight_kg,
+                   COALESCE(n.sets * n.reps * n.weight_kg, 0) AS volume_kg,
+                   estimated_1rm(n.weight_kg, n.reps) AS e1rm_kg
+            FROM new_rows n
+            JOIN workouts w ON w.workout_id = n.workout_id AND w.workout_date = n.workout_date
+            WHERE n.exercise_type_id IS NOT NULL
+        ) m
+        GROUP BY m.user_id, m.exercise_type_id
+        ON CONFLICT (user_id, exercise_type_id) DO UPDATE SET
+            best_weight_workout_id = CASE WHEN EXCLUDED.best_weight_kg > pr.best_weight_kg
+                                          THEN EXCLUDED.best_weight_workout_id ELSE pr.best_weight_workout_id END,
+            best_weight_kg = GREATEST(pr.best_weight_kg, EXCLUDED.best_weight_kg),
+            best_volume_workout_id = CASE WHEN EXCLUDED.best_volume_kg > pr.best_volume_kg
+                                          THEN EXCLUDED.best_volume_workout_id ELSE pr.best_volume_workout_id END,
+            best_volume_kg = GREATEST(pr.best_volume_kg, EXCLUDED.best_volume_kg),
+            best_e1rm_workout_id = CASE WHEN EXCLUDED.best_e1rm_kg > pr.best_e1rm_kg
+                                        THEN EXCLUDED.best_e1rm_workout_id ELSE pr.best_e1rm_workout_id END,
+            best_e1rm_kg = GREATEST(pr.best_e1rm_kg, EXCLUDED.best_e1rm_kg);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Per-exercise lookups go by type now.
+DROP INDEX IF EXISTS exercises_exercise_name_workout_id_idx;
+
+DO $$
+BEGIN
+    IF (SELECT count(*) FROM (SELECT 1 FROM exercises LIMIT 200001) s) <= 200000 THEN
+        PERFORM backfill_exercise_types(0, 200001);
+        CREATE INDEX IF NOT EXISTS exercises_exercise_type_id_workout_id_idx ON exercises (exercise_type_id, workout_id);
+    ELSE
+        RAISE NOTICE 'exercises is large: run `python catalog.py backfill` to fill exercise_type_id online';
+    END IF;
+END;
+$$;
+
+DELETE FROM personal_records;
+INSERT INTO personal_records SELECT * FROM personal_records_expected;
+
+INSERT INTO schema_version (version, name) VALUES (10, 'exercise_catalog') ON CONFLICT (version) DO NOTHING;
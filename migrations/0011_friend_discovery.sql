@@ -0,0 +1,39 @@
+-- 0011_friend_discovery: indexes for finding friends among many users (backend.search_users,
+-- backend.get_friend_suggestions) and for the friends leaderboard.
+
+-- search_users, short queries: name prefix, paged in (lower(name), user_id)
+-- order. The "C" collation makes LIKE 'prefix%' and the keyset comparison
+-- usable on one index whatever the database collation is.
+CREATE INDEX IF NOT EXISTS users_lower_name_user_id_idx ON users ((lower(name) COLLATE "C"), user_id);
+
+-- search_users, longer queries: names containing the query anywhere, on the
+-- same expression. Needs the pg_trgm extension; without it those searches scan
+-- users instead.
+DO $$
+DECLARE
+    trgm_schema TEXT;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        RAISE NOTICE 'pg_trgm is not available: user searches by substring will scan users';
+        RETURN;
+    END IF;
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    EXCEPTION WHEN insufficient_privilege THEN
+        RAISE NOTICE 'cannot create extension pg_trgm: user searches by substring will scan users';
+        RETURN;
+    END;
+    SELECT n.nspname INTO trgm_schema
+    FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+    WHERE e.extname = 'pg_trgm';
+    EXECUTE format(
+        'CREATE INDEX IF NOT EXISTS users_lower_name_trgm_idx ON users USING gin ((lower(name) COLLATE "C") %I.gin_trgm_ops)',
+        trgm_schema
+    );
+END
+$$;
+
+-- The friends leaderboard and friend-of-friend suggestions walk friends by
+-- user_id, which the primary key (user_id, friend_id) already serves.
+
+INSERT INTO schema_version (version, name) VALUES (11, 'friend_discovery') ON CONFLICT (version) DO NOTHING;
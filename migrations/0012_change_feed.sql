@@ -0,0 +1,92 @@
+-- 0012_change_feed: NOTIFY on the fitness_changes channel whenever workouts, friends,
+-- goals or users change, so that app processes listening there (change_feed.py)
+-- can evict exactly the cached reads other processes' writes made stale.
+--
+-- Payloads are JSON: {"schema": ..., "table": ..., "keys": [...]}, where keys
+-- identify what changed (user ids, or [user_id, workout_date] pairs for
+-- workouts), at most 100 per notification. Statements changing more than 1000
+-- rows, and TRUNCATE, send {"schema": ..., "table": ..., "all": true} instead.
+-- Notifications are delivered when the transaction commits, once per distinct
+-- payload, and never for rolled back transactions.
+
+CREATE OR REPLACE FUNCTION notify_changes() RETURNS trigger AS $$
+-- TG_ARGV[0]: the expression over the table's columns that identifies a change.
+DECLARE
+    max_rows CONSTANT INTEGER := 1000;
+    per_notification CONSTANT INTEGER := 100;
+    rows_table TEXT;
+    row_count INTEGER;
+    changed JSONB := '[]';
+    found_keys JSONB;
+    chunk JSONB;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('fitness_changes',
+            jsonb_build_object('schema', TG_TABLE_SCHEMA, 'table', TG_TABLE_NAME, 'all', true)::text);
+        RETURN NULL;
+    END IF;
+    FOREACH rows_table IN ARRAY CASE TG_OP
+        WHEN 'INSERT' THEN ARRAY['new_rows'] WHEN 'DELETE' THEN ARRAY['old_rows'] ELSE ARRAY['old_rows', 'new_rows'] END
+    LOOP
+        -- Counting stops early, so bulk loads do not pay for collecting keys.
+        EXECUTE format('SELECT count(*) FROM (SELECT 1 FROM %I LIMIT %s) s', rows_table, max_rows + 1) INTO row_count;
+        IF row_count > max_rows THEN
+            PERFORM pg_notify('fitness_changes',
+                jsonb_build_object('schema', TG_TABLE_SCHEMA, 'table', TG_TABLE_NAME, 'all', true)::text);
+            RETURN NULL;
+        END IF;
+        EXECUTE format('SELECT COALESCE(jsonb_agg(DISTINCT %s), ''[]'') FROM %I', TG_ARGV[0], rows_table) INTO found_keys;
+        changed := changed || found_keys;
+    END LOOP;
+
+    FOR chunk IN
+        SELECT jsonb_agg(k)
+        FROM (
+            SELECT k, (row_number() OVER () - 1) / per_notification AS n
+            FROM (SELECT DISTINCT k FROM jsonb_array_elements(changed) AS k) d
+        ) numbered
+        GROUP BY n
+    LOOP
+        PERFORM pg_notify('fitness_changes',
+            jsonb_build_object('schema', TG_TABLE_SCHEMA, 'table', TG_TABLE_NAME, 'keys', chunk)::text);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t RECORD;
+BEGIN
+    FOR t IN
+        SELECT * FROM (VALUES
+            ('workouts', 'jsonb_build_array(user_id, workout_date)'),
+            ('friends', 'user_id'),
+            ('goals', 'user_id'),
+            ('users', 'user_id')
+        ) AS v(table_name, key_expression)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t.table_name || '_notify_insert', t.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_changes(%L)',
+            t.table_name || '_notify_insert', t.table_name, t.key_expression);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t.table_name || '_notify_update', t.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_changes(%L)',
+            t.table_name || '_notify_update', t.table_name, t.key_expression);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t.table_name || '_notify_delete', t.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_changes(%L)',
+            t.table_name || '_notify_delete', t.table_name, t.key_expression);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t.table_name || '_notify_truncate', t.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER TRUNCATE ON %I FOR EACH STATEMENT EXECUTE FUNCTION notify_changes(%L)',
+            t.table_name || '_notify_truncate', t.table_name, t.key_expression);
+    END LOOP;
+END
+$$;
+
+INSERT INTO schema_version (version, name) VALUES (12, 'change_feed') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,16 @@
+-- 0013_ingest_keys: idempotency keys of workouts logged through the write-behind
+-- queue (ingest.py). A key is claimed in the same transaction that inserts its
+-- workout, so a workout replayed after a crash, or submitted twice, is written
+-- once.
+
+CREATE TABLE IF NOT EXISTS ingested_workouts (
+    idempotency_key TEXT PRIMARY KEY,
+    -- No foreign key: once workouts is partitioned its key includes workout_date
+    workout_id INTEGER NOT NULL,
+    ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Keys older than the retention period are pruned by ingest.py.
+CREATE INDEX IF NOT EXISTS ingested_workouts_ingested_at_idx ON ingested_workouts (ingested_at);
+
+INSERT INTO schema_version (version, name) VALUES (13, 'ingest_keys') ON CONFLICT (version) DO NOTHING;
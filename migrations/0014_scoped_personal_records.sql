@@ -0,0 +1,87 @@
+-- 0014_scoped_personal_records: updating or deleting exercises recomputes only
+-- the records that lost their source row. The 0005/0010 trigger joined those
+-- records to personal_records_expected, which aggregates every exercise in the
+-- table, so one delete took seconds on a large database and catalog backfills
+-- and merges paid that for every batch.
+
+CREATE OR REPLACE FUNCTION exercises_maintain_personal_records() RETURNS trigger AS $$
+DECLARE
+    affected_users INTEGER[];
+    affected_types INTEGER[];
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        -- The (user, exercise type) records whose source row went away.
+        SELECT array_agg(k.user_id), array_agg(k.exercise_type_id)
+        INTO affected_users, affected_types
+        FROM (
+            SELECT DISTINCT p.user_id, p.exercise_type_id
+            FROM personal_records p
+            JOIN old_rows o
+              ON o.exercise_type_id = p.exercise_type_id
+             AND o.workout_id IN (p.best_weight_workout_id, p.best_volume_workout_id, p.best_e1rm_workout_id)
+        ) k;
+
+        IF affected_users IS NOT NULL THEN
+            -- Recompute each of them from that user's exercises of that type
+            -- alone; drop those with nothing left to hold a record.
+            WITH recomputed AS (
+                SELECT a.user_id, a.exercise_type_id, best.*
+                FROM unnest(affected_users, affected_types) AS a(user_id, exercise_type_id)
+                CROSS JOIN LATERAL (
+                    SELECT max(m.weight_kg) AS best_weight_kg, (array_agg(m.workout_id ORDER BY m.weight_kg DESC))[1] AS best_weight_workout_id,
+                           max(m.volume_kg) AS best_volume_kg, (array_agg(m.workout_id ORDER BY m.volume_kg DESC))[1] AS best_volume_workout_id,
+                           max(m.e1rm_kg) AS best_e1rm_kg, (array_agg(m.workout_id ORDER BY m.e1rm_kg DESC))[1] AS best_e1rm_workout_id
+                    FROM exercise_metrics m
+                    WHERE m.user_id = a.user_id AND m.exercise_type_id = a.exercise_type_id
+                ) best
+            ), dropped AS (
+                DELETE FROM personal_records pr
+                USING recomputed r
+                WHERE pr.user_id = r.user_id AND pr.exercise_type_id = r.exercise_type_id
+                  AND r.best_weight_kg IS NULL
+            )
+            INSERT INTO personal_records AS pr
+            SELECT * FROM recomputed r
+            WHERE r.best_weight_kg IS NOT NULL
+            ON CONFLICT (user_id, exercise_type_id) DO UPDATE SET
+                best_weight_kg = EXCLUDED.best_weight_kg,
+                best_weight_workout_id = EXCLUDED.best_weight_workout_id,
+                best_volume_kg = EXCLUDED.best_volume_kg,
+                best_volume_workout_id = EXCLUDED.best_volume_workout_id,
+                best_e1rm_kg = EXCLUDED.best_e1rm_kg,
+                best_e1rm_workout_id = EXCLUDED.best_e1rm_workout_id;
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO personal_records AS pr
+        SELECT m.user_id, m.exercise_type_id,
+               max(m.weight_kg), (array_agg(m.workout_id ORDER BY m.weight_kg DESC))[1],
+               max(m.volume_kg), (array_agg(m.workout_id ORDER BY m.volume_kg DESC))[1],
+               max(m.e1rm_kg), (array_agg(m.workout_id ORDER BY m.e1rm_kg DESC))[1]
+        FROM (
+            SELECT w.user_id, n.exercise_type_id, n.workout_id,
+                   COALESCE(n.weight_kg, 0) AS weight_kg,
+                   COALESCE(n.sets * n.reps * n.weight_kg, 0) AS volume_kg,
+                   estimated_1rm(n.weight_kg, n.reps) AS e1rm_kg
+            FROM new_rows n
+            JOIN workouts w ON w.workout_id = n.workout_id AND w.workout_date = n.workout_date
+            WHERE n.exercise_type_id IS NOT NULL
+        ) m
+        GROUP BY m.user_id, m.exercise_type_id
+        ON CONFLICT (user_id, exercise_type_id) DO UPDATE SET
+            best_weight_workout_id = CASE WHEN EXCLUDED.best_weight_kg > pr.best_weight_kg
+                                          THEN EXCLUDED.best_weight_workout_id ELSE pr.best_weight_workout_id END,
+            best_weight_kg = GREATEST(pr.best_weight_kg, EXCLUDED.best_weight_kg),
+            best_volume_workout_id = CASE WHEN EXCLUDED.best_volume_kg > pr.best_volume_kg
+                                          THEN EXCLUDED.best_volume_workout_id ELSE pr.best_volume_workout_id END,
+            best_volume_kg = GREATEST(pr.best_volume_kg, EXCLUDED.best_volume_kg),
+            best_e1rm_workout_id = CASE WHEN EXCLUDED.best_e1rm_kg > pr.best_e1rm_kg
+                                        THEN EXCLUDED.best_e1rm_workout_id ELSE pr.best_e1rm_workout_id END,
+            best_e1rm_kg = GREATEST(pr.best_e1rm_kg, EXCLUDED.best_e1rm_kg);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+INSERT INTO schema_version (version, name) VALUES (14, 'scoped_personal_records') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,91 @@
+-- 0015_split_default_partitions: rows that landed in workouts_default / exercises_default
+-- (dated before the partitions were created, or too far ahead) are moved into monthly
+-- partitions of their own. 0008 skipped a month for good once it had a row in the
+-- default partition, and `partitioning.py archive` never saw those rows.
+--
+-- A month is split out by creating its partitions as plain tables, moving its rows
+-- into them and attaching them. Rows are moved with DELETE ... RETURNING on the
+-- partitions themselves, so the statement triggers of workouts and exercises do not
+-- fire and the rollups, which already count these rows, stay as they are.
+
+CREATE OR REPLACE FUNCTION split_default_partition(month DATE) RETURNS BIGINT AS $$
+DECLARE
+    nsp TEXT;
+    parent TEXT;
+    month_start DATE := date_trunc('month', month)::date;
+    month_end DATE := (date_trunc('month', month) + interval '1 month')::date;
+    moved BIGINT;
+    total BIGINT := 0;
+BEGIN
+    SELECT n.nspname INTO nsp
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = to_regclass('workouts') AND c.relkind = 'p';
+    IF nsp IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    -- Exercises first: their foreign key would cascade a delete of their workouts.
+    FOREACH parent IN ARRAY ARRAY['exercises', 'workouts'] LOOP
+        EXECUTE format(
+            'CREATE TABLE %I.%I (LIKE %I.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)',
+            nsp, parent || '_p' || to_char(month_start, 'YYYYMM'), nsp, parent
+        );
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM %I.%I WHERE workout_date >= %L AND workout_date < %L RETURNING *) '
+            'INSERT INTO %I.%I SELECT * FROM moved',
+            nsp, parent || '_default', month_start, month_end, nsp, parent || '_p' || to_char(month_start, 'YYYYMM')
+        );
+        GET DIAGNOSTICS moved = ROW_COUNT;
+        total := total + moved;
+    END LOOP;
+    -- Workouts first, so the exercises' foreign key finds them once attached.
+    FOREACH parent IN ARRAY ARRAY['workouts', 'exercises'] LOOP
+        EXECUTE format(
+            'ALTER TABLE %I.%I ATTACH PARTITION %I.%I FOR VALUES FROM (%L) TO (%L)',
+            nsp, parent, nsp, parent || '_p' || to_char(month_start, 'YYYYMM'), month_start, month_end
+        );
+    END LOOP;
+    RETURN total;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION create_monthly_partitions(first_month DATE, last_month DATE)
+RETURNS TABLE (month DATE, action TEXT) AS $$
+DECLARE
+    nsp TEXT;
+    parent TEXT;
+    month_end DATE;
+BEGIN
+    SELECT n.nspname INTO nsp
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = to_regclass('workouts') AND c.relkind = 'p';
+    IF nsp IS NULL THEN
+        RETURN;
+    END IF;
+
+    month := date_trunc('month', first_month)::date;
+    WHILE month <= last_month LOOP
+        month_end := (month + interval '1 month')::date;
+        IF to_regclass(format('%I.%I', nsp, 'workouts_p' || to_char(month, 'YYYYMM'))) IS NOT NULL THEN
+            action := 'exists';
+        ELSIF EXISTS (SELECT 1 FROM workouts_default WHERE workout_date >= month AND workout_date < month_end)
+           OR EXISTS (SELECT 1 FROM exercises_default WHERE workout_date >= month AND workout_date < month_end) THEN
+            action := format('created, moved %s rows out of the default partitions', split_default_partition(month));
+        ELSE
+            FOREACH parent IN ARRAY ARRAY['workouts', 'exercises'] LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I.%I PARTITION OF %I.%I FOR VALUES FROM (%L) TO (%L)',
+                    nsp, parent || '_p' || to_char(month, 'YYYYMM'), nsp, parent, month, month_end
+                );
+            END LOOP;
+            action := 'created';
+        END IF;
+        RETURN NEXT;
+        month := month_end;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+INSERT INTO schema_version (version, name) VALUES (15, 'split_default_partitions') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,370 @@
+-- 0001_initial: the schema of PostgreSQL migrations 0001-0013, for the embedded SQLite
+-- engine (sqlite_storage.py): the same tables, columns, keys and indexes, with SQLite
+-- types. The rollups (weekly_activity, personal_records) and exercise type resolution
+-- are kept current by row-level triggers instead of statement-level ones.
+-- normalize_exercise_name(), squeeze_whitespace() and estimated_1rm() are defined in
+-- Python on every connection. Partitioning and the change feed are PostgreSQL only.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- INTEGER PRIMARY KEY columns are SQLite's row ids and number new rows like SERIAL.
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    weight_kg NUMERIC(5, 2)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS users_email_key ON users (email);
+CREATE INDEX IF NOT EXISTS users_lower_name_user_id_idx ON users (lower(name), user_id);
+
+CREATE TABLE IF NOT EXISTS friends (
+    user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+    friend_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+    PRIMARY KEY (user_id, friend_id)
+);
+CREATE INDEX IF NOT EXISTS friends_friend_id_idx ON friends (friend_id);
+
+-- Dates are stored as ISO 8601 text ('2025-08-21'), which sorts and compares like a date.
+CREATE TABLE IF NOT EXISTS workouts (
+    workout_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    workout_date DATE NOT NULL,
+    duration_minutes INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS workouts_workout_id_workout_date_key ON workouts (workout_id, workout_date);
+CREATE INDEX IF NOT EXISTS workouts_user_id_date_id_idx ON workouts (user_id, workout_date DESC, workout_id DESC);
+CREATE INDEX IF NOT EXISTS workouts_workout_date_idx ON workouts (workout_date);
+
+CREATE TABLE IF NOT EXISTS exercise_catalog (
+    exercise_type_id INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS exercise_catalog_normalized_name_key ON exercise_catalog (normalize_exercise_name(name));
+
+CREATE TABLE IF NOT EXISTS exercise_aliases (
+    alias VARCHAR(255) PRIMARY KEY CHECK (alias = normalize_exercise_name(alias)),
+    exercise_type_id INTEGER NOT NULL REFERENCES exercise_catalog(exercise_type_id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS exercise_aliases_exercise_type_id_idx ON exercise_aliases (exercise_type_id);
+
+CREATE TABLE IF NOT EXISTS exercises (
+    exercise_id INTEGER PRIMARY KEY,
+    workout_id INTEGER NOT NULL,
+    exercise_name VARCHAR(255) NOT NULL,
+    sets INTEGER,
+    reps INTEGER,
+    weight_kg NUMERIC(6, 2),
+    workout_date DATE NOT NULL,
+    exercise_type_id INTEGER REFERENCES exercise_catalog(exercise_type_id),
+    FOREIGN KEY (workout_id, workout_date) REFERENCES workouts (workout_id, workout_date)
+        ON DELETE CASCADE ON UPDATE CASCADE
+);
+CREATE INDEX IF NOT EXISTS exercises_workout_id_idx ON exercises (workout_id);
+CREATE INDEX IF NOT EXISTS exercises_exercise_type_id_workout_id_idx ON exercises (exercise_type_id, workout_id);
+
+CREATE TABLE IF NOT EXISTS goals (
+    goal_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    goal_description TEXT,
+    target_value INTEGER,
+    start_date DATE DEFAULT (date('now', 'localtime')),
+    end_date DATE,
+    is_active BOOLEAN DEFAULT TRUE
+);
+CREATE UNIQUE INDEX IF NOT EXISTS goals_one_active_per_user_idx ON goals (user_id) WHERE is_active;
+
+CREATE TABLE IF NOT EXISTS weekly_activity (
+    user_id INTEGER NOT NULL,
+    week_start DATE NOT NULL,
+    workout_count INTEGER NOT NULL,
+    total_minutes BIGINT NOT NULL,
+    PRIMARY KEY (user_id, week_start)
+);
+CREATE INDEX IF NOT EXISTS weekly_activity_week_start_total_minutes_idx
+    ON weekly_activity (week_start, total_minutes DESC);
+
+CREATE TABLE IF NOT EXISTS personal_records (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    exercise_type_id INTEGER NOT NULL REFERENCES exercise_catalog(exercise_type_id),
+    best_weight_kg NUMERIC(6, 2) NOT NULL,
+    best_weight_workout_id INTEGER NOT NULL,
+    best_volume_kg NUMERIC(14, 2) NOT NULL,
+    best_volume_workout_id INTEGER NOT NULL,
+    best_e1rm_kg NUMERIC(8, 2) NOT NULL,
+    best_e1rm_workout_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, exercise_type_id)
+);
+
+-- Written by the batch goal evaluation (goals.py), which needs PostgreSQL; here
+-- goal streaks stay unknown.
+CREATE TABLE IF NOT EXISTS goal_progress (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    goal_id INTEGER NOT NULL,
+    week_start DATE NOT NULL,
+    target_value INTEGER NOT NULL,
+    workouts INTEGER NOT NULL,
+    minutes BIGINT NOT NULL,
+    met BOOLEAN NOT NULL,
+    prior_streak_weeks INTEGER NOT NULL,
+    streak_weeks INTEGER NOT NULL,
+    evaluated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS goal_progress_week_start_met_idx ON goal_progress (week_start, met);
+
+CREATE TABLE IF NOT EXISTS ingested_workouts (
+    idempotency_key TEXT PRIMARY KEY,
+    workout_id INTEGER NOT NULL,
+    -- Milliseconds, like now(): CURRENT_TIMESTAMP has whole seconds only
+    ingested_at TIMESTAMPTZ NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+CREATE INDEX IF NOT EXISTS ingested_workouts_ingested_at_idx ON ingested_workouts (ingested_at);
+
+-- --- Exercise catalog (PostgreSQL migration 0010) ---
+INSERT INTO exercise_catalog (name)
+VALUES ('Bench Press'), ('Squat'), ('Deadlift'), ('Overhead Press'), ('Rows'), ('Lat Pulldown'),
+       ('Leg Press'), ('Hip Thrust'), ('Bicep Curls'), ('Lunges'), ('Calf Raises'), ('Pull-ups'),
+       ('Tricep Dips'), ('Plank'), ('Running'), ('Cycling'), ('Rowing'), ('Yoga'), ('Yoga Flow')
+ON CONFLICT DO NOTHING;
+
+INSERT INTO exercise_aliases (alias, exercise_type_id)
+SELECT normalize_exercise_name(name), exercise_type_id FROM exercise_catalog WHERE true
+ON CONFLICT (alias) DO NOTHING;
+
+INSERT INTO exercise_aliases (alias, exercise_type_id)
+WITH a (alias, name) AS (VALUES
+    ('bench', 'Bench Press'), ('bench press (barbell)', 'Bench Press'), ('barbell bench press', 'Bench Press'),
+    ('squats', 'Squat'), ('back squat', 'Squat'), ('deadlifts', 'Deadlift'),
+    ('ohp', 'Overhead Press'), ('shoulder press', 'Overhead Press'), ('military press', 'Overhead Press'),
+    ('row', 'Rows'), ('barbell row', 'Rows'), ('bent over row', 'Rows'), ('lat pull-down', 'Lat Pulldown'),
+    ('hip thrusts', 'Hip Thrust'), ('bicep curl', 'Bicep Curls'), ('biceps curls', 'Bicep Curls'),
+    ('curls', 'Bicep Curls'), ('lunge', 'Lunges'), ('calf raise', 'Calf Raises'),
+    ('pullups', 'Pull-ups'), ('pull ups', 'Pull-ups'), ('pull-up', 'Pull-ups'), ('pullup', 'Pull-ups'),
+    ('dips', 'Tricep Dips'), ('tricep dip', 'Tricep Dips'), ('run', 'Running'), ('jogging', 'Running'),
+    ('cycle', 'Cycling'), ('bike', 'Cycling'), ('rower', 'Rowing')
+)
+SELECT a.alias, c.exercise_type_id
+FROM a
+JOIN exercise_catalog c ON normalize_exercise_name(c.name) = normalize_exercise_name(a.name)
+WHERE true
+ON CONFLICT (alias) DO NOTHING;
+
+-- The exercise type of a new or renamed exercise, adding its name to the catalog if
+-- it is new (resolve_exercise_type() in PostgreSQL). SQLite triggers cannot change
+-- NEW, so the type is set by an UPDATE right after the row is written.
+CREATE TRIGGER IF NOT EXISTS exercises_resolve_type
+    AFTER INSERT ON exercises
+    WHEN NEW.exercise_type_id IS NULL AND normalize_exercise_name(NEW.exercise_name) <> ''
+BEGIN
+    INSERT INTO exercise_catalog (name)
+    SELECT squeeze_whitespace(NEW.exercise_name)
+    WHERE NOT EXISTS (SELECT 1 FROM exercise_aliases WHERE alias = normalize_exercise_name(NEW.exercise_name))
+    ON CONFLICT DO NOTHING;
+    INSERT INTO exercise_aliases (alias, exercise_type_id)
+    SELECT normalize_exercise_name(name), exercise_type_id FROM exercise_catalog
+    WHERE normalize_exercise_name(name) = normalize_exercise_name(NEW.exercise_name)
+    ON CONFLICT (alias) DO NOTHING;
+    UPDATE exercises
+    SET exercise_type_id = (SELECT exercise_type_id FROM exercise_aliases WHERE alias = normalize_exercise_name(NEW.exercise_name))
+    WHERE exercise_id = NEW.exercise_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS exercises_resolve_type_update
+    AFTER UPDATE OF exercise_name, exercise_type_id ON exercises
+    WHEN normalize_exercise_name(NEW.exercise_name) <> ''
+     AND (NEW.exercise_type_id IS NULL
+          OR (NEW.exercise_name IS NOT OLD.exercise_name AND NEW.exercise_type_id IS OLD.exercise_type_id))
+BEGIN
+    INSERT INTO exercise_catalog (name)
+    SELECT squeeze_whitespace(NEW.exercise_name)
+    WHERE NOT EXISTS (SELECT 1 FROM exercise_aliases WHERE alias = normalize_exercise_name(NEW.exercise_name))
+    ON CONFLICT DO NOTHING;
+    INSERT INTO exercise_aliases (alias, exercise_type_id)
+    SELECT normalize_exercise_name(name), exercise_type_id FROM exercise_catalog
+    WHERE normalize_exercise_name(name) = normalize_exercise_name(NEW.exercise_name)
+    ON CONFLICT (alias) DO NOTHING;
+    UPDATE exercises
+    SET exercise_type_id = (SELECT exercise_type_id FROM exercise_aliases WHERE alias = normalize_exercise_name(NEW.exercise_name))
+    WHERE exercise_id = NEW.exercise_id;
+END;
+
+-- --- weekly_activity (PostgreSQL migration 0004) ---
+CREATE TRIGGER IF NOT EXISTS workouts_weekly_activity_insert
+    AFTER INSERT ON workouts
+BEGIN
+    INSERT INTO weekly_activity (user_id, week_start, workout_count, total_minutes)
+    VALUES (NEW.user_id, date(NEW.workout_date, 'weekday 0', '-6 days'), 1, COALESCE(NEW.duration_minutes, 0))
+    ON CONFLICT (user_id, week_start) DO UPDATE
+    SET workout_count = workout_count + 1,
+        total_minutes = total_minutes + excluded.total_minutes;
+END;
+
+CREATE TRIGGER IF NOT EXISTS workouts_weekly_activity_update
+    AFTER UPDATE OF user_id, workout_date, duration_minutes ON workouts
+BEGIN
+    UPDATE weekly_activity
+    SET workout_count = workout_count - 1,
+        total_minutes = total_minutes - COALESCE(OLD.duration_minutes, 0)
+    WHERE user_id = OLD.user_id AND week_start = date(OLD.workout_date, 'weekday 0', '-6 days');
+    DELETE FROM weekly_activity
+    WHERE user_id = OLD.user_id AND week_start = date(OLD.workout_date, 'weekday 0', '-6 days')
+      AND workout_count <= 0;
+    INSERT INTO weekly_activity (user_id, week_start, workout_count, total_minutes)
+    VALUES (NEW.user_id, date(NEW.workout_date, 'weekday 0', '-6 days'), 1, COALESCE(NEW.duration_minutes, 0))
+    ON CONFLICT (user_id, week_start) DO UPDATE
+    SET workout_count = workout_count + 1,
+        total_minutes = total_minutes + excluded.total_minutes;
+END;
+
+CREATE TRIGGER IF NOT EXISTS workouts_weekly_activity_delete
+    AFTER DELETE ON workouts
+BEGIN
+    UPDATE weekly_activity
+    SET workout_count = workout_count - 1,
+        total_minutes = total_minutes - COALESCE(OLD.duration_minutes, 0)
+    WHERE user_id = OLD.user_id AND week_start = date(OLD.workout_date, 'weekday 0', '-6 days');
+    DELETE FROM weekly_activity
+    WHERE user_id = OLD.user_id AND week_start = date(OLD.workout_date, 'weekday 0', '-6 days')
+      AND workout_count <= 0;
+END;
+
+-- --- personal_records (PostgreSQL migrations 0005, 0010) ---
+CREATE VIEW IF NOT EXISTS exercise_metrics AS
+SELECT w.user_id, e.exercise_type_id, e.workout_id,
+       COALESCE(e.weight_kg, 0) AS weight_kg,
+       COALESCE(e.sets * e.reps * e.weight_kg, 0) AS volume_kg,
+       estimated_1rm(e.weight_kg, e.reps) AS e1rm_kg
+FROM exercises e
+JOIN workouts w ON w.workout_id = e.workout_id AND w.workout_date = e.workout_date
+WHERE e.exercise_type_id IS NOT NULL;
+
+-- No array_agg: each best comes with the workout of the first row in its order.
+CREATE VIEW IF NOT EXISTS personal_records_expected AS
+SELECT DISTINCT user_id, exercise_type_id,
+       first_value(weight_kg) OVER by_weight AS best_weight_kg,
+       first_value(workout_id) OVER by_weight AS best_weight_workout_id,
+       first_value(volume_kg) OVER by_volume AS best_volume_kg,
+       first_value(workout_id) OVER by_volume AS best_volume_workout_id,
+       first_value(e1rm_kg) OVER by_e1rm AS best_e1rm_kg,
+       first_value(workout_id) OVER by_e1rm AS best_e1rm_workout_id
+FROM exercise_metrics
+WINDOW by_weight AS (PARTITION BY user_id, exercise_type_id ORDER BY weight_kg DESC),
+       by_volume AS (PARTITION BY user_id, exercise_type_id ORDER BY volume_kg DESC),
+       by_e1rm AS (PARTITION BY user_id, exercise_type_id ORDER BY e1rm_kg DESC);
+
+-- A new row can only raise records. A row that changes or goes away may have held
+-- one of its user's records of that type: those are recomputed from the user's
+-- remaining rows of the type, or dropped if there are none. An exercise inserted
+-- without a type gets its records when exercises_resolve_type sets it.
+CREATE TRIGGER IF NOT EXISTS exercises_personal_records_insert
+    AFTER INSERT ON exercises
+    WHEN NEW.exercise_type_id IS NOT NULL
+BEGIN
+    INSERT INTO personal_records
+    SELECT w.user_id, NEW.exercise_type_id,
+           COALESCE(NEW.weight_kg, 0), NEW.workout_id,
+           COALESCE(NEW.sets * NEW.reps * NEW.weight_kg, 0), NEW.workout_id,
+           estimated_1rm(NEW.weight_kg, NEW.reps), NEW.workout_id
+    FROM workouts w
+    WHERE w.workout_id = NEW.workout_id AND w.workout_date = NEW.workout_date
+    ON CONFLICT (user_id, exercise_type_id) DO UPDATE SET
+        best_weight_workout_id = CASE WHEN excluded.best_weight_kg > best_weight_kg
+                                      THEN excluded.best_weight_workout_id ELSE best_weight_workout_id END,
+        best_weight_kg = max(best_weight_kg, excluded.best_weight_kg),
+        best_volume_workout_id = CASE WHEN excluded.best_volume_kg > best_volume_kg
+                                      THEN excluded.best_volume_workout_id ELSE best_volume_workout_id END,
+        best_volume_kg = max(best_volume_kg, excluded.best_volume_kg),
+        best_e1rm_workout_id = CASE WHEN excluded.best_e1rm_kg > best_e1rm_kg
+                                    THEN excluded.best_e1rm_workout_id ELSE best_e1rm_workout_id END,
+        best_e1rm_kg = max(best_e1rm_kg, excluded.best_e1rm_kg);
+END;
+
+CREATE TRIGGER IF NOT EXISTS exercises_personal_records_update_old
+    AFTER UPDATE ON exercises
+    WHEN OLD.exercise_type_id IS NOT NULL
+BEGIN
+    DELETE FROM personal_records
+    WHERE exercise_type_id = OLD.exercise_type_id
+      AND OLD.workout_id IN (best_weight_workout_id, best_volume_workout_id, best_e1rm_workout_id)
+      AND NOT EXISTS (
+          SELECT 1 FROM exercise_metrics m
+          WHERE m.user_id = personal_records.user_id AND m.exercise_type_id = personal_records.exercise_type_id
+      );
+    UPDATE personal_records
+    SET (best_weight_kg, best_weight_workout_id) = (
+            SELECT weight_kg, workout_id FROM exercise_metrics m
+            WHERE m.user_id = personal_records.user_id AND m.exercise_type_id = personal_records.exercise_type_id
+            ORDER BY weight_kg DESC LIMIT 1
+        ),
+        (best_volume_kg, best_volume_workout_id) = (
+            SELECT volume_kg, workout_id FROM exercise_metrics m
+            WHERE m.user_id = personal_records.user_id AND m.exercise_type_id = personal_records.exercise_type_id
+            ORDER BY volume_kg DESC LIMIT 1
+        ),
+        (best_e1rm_kg, best_e1rm_workout_id) = (
+            SELECT e1rm_kg, workout_id FROM exercise_metrics m
+            WHERE m.user_id = personal_records.user_id AND m.exercise_type_id = personal_records.exercise_type_id
+            ORDER BY e1rm_kg DESC LIMIT 1
+        )
+    WHERE exercise_type_id = OLD.exercise_type_id
+      AND OLD.workout_id IN (best_weight_workout_id, best_volume_workout_id, best_e1rm_workout_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS exercises_personal_records_update_new
+    AFTER UPDATE ON exercises
+    WHEN NEW.exercise_type_id IS NOT NULL
+BEGIN
+    INSERT INTO personal_records
+    SELECT w.user_id, NEW.exercise_type_id,
+           COALESCE(NEW.weight_kg, 0), NEW.workout_id,
+           COALESCE(NEW.sets * NEW.reps * NEW.weight_kg, 0), NEW.workout_id,
+           estimated_1rm(NEW.weight_kg, NEW.reps), NEW.workout_id
+    FROM workouts w
+    WHERE w.workout_id = NEW.workout_id AND w.workout_date = NEW.workout_date
+    ON CONFLICT (user_id, exercise_type_id) DO UPDATE SET
+        best_weight_workout_id = CASE WHEN excluded.best_weight_kg > best_weight_kg
+                                      THEN excluded.best_weight_workout_id ELSE best_weight_workout_id END,
+        best_weight_kg = max(best_weight_kg, excluded.best_weight_kg),
+        best_volume_workout_id = CASE WHEN excluded.best_volume_kg > best_volume_kg
+                                      THEN excluded.best_volume_workout_id ELSE best_volume_workout_id END,
+        best_volume_kg = max(best_volume_kg, excluded.best_volume_kg),
+        best_e1rm_workout_id = CASE WHEN excluded.best_e1rm_kg > best_e1rm_kg
+                                    THEN excluded.best_e1rm_workout_id ELSE best_e1rm_workout_id END,
+        best_e1rm_kg = max(best_e1rm_kg, excluded.best_e1rm_kg);
+END;
+
+CREATE TRIGGER IF NOT EXISTS exercises_personal_records_delete
+    AFTER DELETE ON exercises
+    WHEN OLD.exercise_type_id IS NOT NULL
+BEGIN
+    DELETE FROM personal_records
+    WHERE exercise_type_id = OLD.exercise_type_id
+      AND OLD.workout_id IN (best_weight_workout_id, best_volume_workout_id, best_e1rm_workout_id)
+      AND NOT EXISTS (
+          SELECT 1 FROM exercise_metrics m
+          WHERE m.user_id = personal_records.user_id AND m.exercise_type_id = personal_records.exercise_type_id
+      );
+    UPDATE personal_records
+    SET (best_weight_kg, best_weight_workout_id) = (
+            SELECT weight_kg, workout_id FROM exercise_metrics m
+            WHERE m.user_id = personal_records.user_id AND m.exercise_type_id = personal_records.exercise_type_id
+            ORDER BY weight_kg DESC LIMIT 1
+        ),
+        (best_volume_kg, best_volume_workout_id) = (
+            SELECT volume_kg, workout_id FROM exercise_metrics m
+            WHERE m.user_id = personal_records.user_id AND m.exercise_type_id = personal_records.exercise_type_id
+            ORDER BY volume_kg DESC LIMIT 1
+        ),
+        (best_e1rm_kg, best_e1rm_workout_id) = (
+            SELECT e1rm_kg, workout_id FROM exercise_metrics m
+            WHERE m.user_id = personal_records.user_id AND m.exercise_type_id = personal_records.exercise_type_id
+            ORDER BY e1rm_kg DESC LIMIT 1
+        )
+    WHERE exercise_type_id = OLD.exercise_type_id
+      AND OLD.workout_id IN (best_weight_workout_id, best_volume_workout_id, best_e1rm_workout_id);
+END;
+
+INSERT INTO schema_version (version, name) VALUES (1, 'initial') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,371 @@
+# partitioning.py
+
+import argparse
+import datetime
+import re
+import sys
+
+import psycopg2
+from psycopg2 import sql
+
+import backend
+import queries
+import query_cache
+
+# Declarative range partitioning of workouts and exercises by workout_date, one
+# partition per month. Exercises carry their workout's date (migration 0007),
+# so every exercise sits in the same month as its workout, and queries over a
+# date range (the current week, a year of history) only touch the matching
+# partitions.
+#
+#   python partitioning.py convert            # one-off, from the plain tables
+#   python partitioning.py ensure             # future months; also done by initialize_database()
+#   python partitioning.py split              # rows in the default partitions into their months
+#   python partitioning.py archive --older-than 24 --mode detach
+#   python partitioning.py status
+#
+# Conversion is opt-in and rewrites both tables under an exclusive lock in one
+# transaction, so run it in a maintenance window. Rows outside every monthly
+# partition land in workouts_default / exercises_default; creating a month's
+# partitions moves its rows out of them (migration 0015), and `split` does that
+# for every month found there.
+#
+# Archival policy for partitions older than N months:
+#   detach   moves them out of the live tables into an archive schema, where they
+#            stay queryable; weekly_activity and personal_records are recomputed
+#            for what is left.
+#   compact  keeps them attached, rewrites them in index order (CLUSTER) and
+#            freezes them (VACUUM FREEZE), so they never need vacuuming again.
+# Old rows still in the default partitions are split out into monthly
+# partitions first, so the policy applies to them too.
+TABLES = ("workouts", "exercises")
+
+DEFAULT_MONTHS_AHEAD = backend.PARTITION_MONTHS_AHEAD
+
+ARCHIVE_MODES = ("detach", "compact")
+
+# Index each table's old partitions are clustered on when compacted.
+CLUSTER_INDEXES = {
+    "workouts": "workouts_user_id_date_id_idx",
+    "exercises": "exercises_workout_id_idx",
+}
+
+_BOUNDS_RE = re.compile(r"FROM \('([0-9-]+)'\) TO \('([0-9-]+)'\)")
+
+def _month(d):
+    return d.replace(day=1)
+
+def _add_months(d, months):
+    month = d.month - 1 + months
+    return d.replace(year=d.year + month // 12, month=month % 12 + 1, day=1)
+
+def is_partitioned(cur):
+    cur.execute(queries.IS_PARTITIONED)
+    return cur.fetchone()[0]
+
+def ensure_partitions(cur, months_ahead=DEFAULT_MONTHS_AHEAD, first_month=None):
+    """Creates missing monthly partitions up to `months_ahead` months from now.
+
+    Returns [(month, action), ...] for every month that was not already there
+    ('created', noting the rows moved out of the default partitions, if any).
+    """
+    cur.execute(queries.CREATE_MONTHLY_PARTITIONS, {
+        "first_month": first_month or datetime.date.today(),
+        "months_ahead": months_ahead,
+    })
+    return [(month, action) for month, action in cur.fetchall() if action != "exists"]
+
+def split_default(cur, before=None):
+    """Moves the rows in the default partitions into monthly partitions of their own.
+
+    Only months before `before` (default all of them). Runs on the caller's
+    transaction; returns [(month, action), ...] as ensure_partitions() does.
+    """
+    if not is_partitioned(cur):
+        return []
+    cur.execute(queries.DEFAULT_PARTITION_MONTHS, {"before": before})
+    done = []
+    for (month,) in cur.fetchall():
+        done.extend(ensure_partitions(cur, 0, month))
+    return done
+
+def _capture(cur, table):
+    """Returns the indexes, constraints, triggers and owned sequences of `table`."""
+    cur.execute(queries.TABLE_INDEXES, (table,))
+    indexes = cur.fetchall()
+    cur.execute(queries.TABLE_CONSTRAINTS, (table,))
+    constraints = cur.fetchall()
+    cur.execute(queries.TABLE_TRIGGERS, (table,))
+    triggers = [row[0] for row in cur.fetchall()]
+    cur.execute(queries.OWNED_SEQUENCES, (table,))
+    sequences = cur.fetchall()
+    return {"indexes": indexes, "constraints": constraints, "triggers": triggers, "sequences": sequences}
+
+def convert_tables(cur, months_ahead=DEFAULT_MONTHS_AHEAD):
+    """Turns the plain workouts and exercises tables into monthly partitioned ones, in place.
+
+    Runs on the caller's transaction. Primary keys gain workout_date (a
+    partitioned table's unique keys must include the partition key); every
+    other index, constraint, trigger and dependent view is recreated as it was.
+    Returns the list of partitions created, or None if already partitioned.
+    """
+    if is_partitioned(cur):
+        return None
+    cur.execute("LOCK TABLE workouts, exercises IN ACCESS EXCLUSIVE MODE")
+    today = datetime.date.today()
+    cur.execute("SELECT min(workout_date), max(workout_date) FROM workouts")
+    oldest, newest = cur.fetchone()
+    oldest, newest = oldest or today, max(newest or today, today)
+
+    # Views reference the tables themselves, not their names, so they are
+    # dropped here and recreated on the new tables at the end.
+    cur.execute(queries.DEPENDENT_VIEWS, (list(TABLES),))
+    views = cur.fetchall()
+    for name, kind, _, _ in views:
+        if kind != "v":
+            raise RuntimeError(f"Cannot convert: {name} depends on the tables and is not a plain view")
+    for name, _, _, _ in reversed(views):
+        cur.execute(sql.SQL("DROP VIEW {}").format(sql.SQL(name)))
+
+    captured = {table: _capture(cur, table) for table in TABLES}
+    for table in TABLES:
+        legacy = table + "_legacy"
+        cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(table), sql.Identifier(legacy)))
+        cur.execute(sql.SQL(
+            "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE) "
+            "PARTITION BY RANGE (workout_date)"
+        ).format(sql.Identifier(table), sql.Identifier(legacy)))
+        cur.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} DEFAULT").format(
+            sql.Identifier(table + "_default"), sql.Identifier(table)
+        ))
+    span = (newest.year - oldest.year) * 12 + newest.month - oldest.month
+    created = ensure_partitions(cur, span + months_ahead, oldest)
+
+    # Copy without any index or trigger in place: the rollups already hold
+    # these rows, and building indexes once is faster than maintaining them.
+    for table in TABLES:
+        legacy = table + "_legacy"
+        cur.execute(sql.SQL("INSERT INTO {} SELECT * FROM {}").format(sql.Identifier(table), sql.Identifier(legacy)))
+        for sequence, column in captured[table]["sequences"]:
+            cur.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.{}").format(
+                sql.SQL(sequence), sql.Identifier(table), sql.Identifier(column)
+            ))
+    cur.execute("DROP TABLE exercises_legacy, workouts_legacy")
+
+    # Keys first (the exercises foreign key needs the new workouts key), then
+    # the remaining indexes, leaving out unique indexes the new keys duplicate.
+    keys = {}
+    for table in TABLES:
+        for name, kind, definition, columns in captured[table]["constraints"]:
+            if kind == "p":
+                keys[table] = columns if "workout_date" in columns else columns + ["workout_date"]
+                cur.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY ({})").format(
+                    sql.Identifier(table), sql.Identifier(name), sql.SQL(", ").join(map(sql.Identifier, keys[table]))
+                ))
+            elif kind in ("u", "x") and "workout_date" not in columns:
+                raise RuntimeError(f"Cannot convert: constraint {name} on {table} does not include workout_date")
+    for table in TABLES:
+        for name, kind, definition, _ in captured[table]["constraints"]:
+            if kind != "p":
+                cur.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} {}").format(
+                    sql.Identifier(table), sql.Identifier(name), sql.SQL(definition)
+                ))
+        for definition, unique, columns in captured[table]["indexes"]:
+            if unique and table in keys and set(columns) == set(keys[table]):
+                continue
+            cur.execute(definition)
+
+    for name, _, definition, _ in views:
+        cur.execute(sql.SQL("CREATE VIEW {} AS {}").format(sql.SQL(name), sql.SQL(definition)))
+    for table in TABLES:
+        for definition in captured[table]["triggers"]:
+            cur.execute(definition)
+        cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table)))
+    return created
+
+def convert(months_ahead=DEFAULT_MONTHS_AHEAD):
+    """convert_tables() in its own transaction; clears the query cache afterwards."""
+    with backend.transaction() as cur:
+        created = convert_tables(cur, months_ahead)
+    query_cache.clear()
+    return created
+
+def partitions(cur, table):
+    """Returns one dict per partition of `table`: name, bounds (None for the default), rows, bytes."""
+    cur.execute(queries.PARTITIONS, (table,))
+    result = []
+    for name, bounds, rows, size, last_vacuum, last_autovacuum, modified in cur.fetchall():
+        match = _BOUNDS_RE.search(bounds)
+        result.append({
+            "name": name,
+            "start": datetime.date.fromisoformat(match.group(1)) if match else None,
+            "end": datetime.date.fromisoformat(match.group(2)) if match else None,
+            "rows": rows,
+            "bytes": size,
+            "vacuumed": last_vacuum or last_autovacuum,
+            "modified_since_analyze": modified,
+        })
+    return result
+
+def _old_partitions(cur, table, cutoff):
+    return [p for p in partitions(cur, table) if p["end"] is not None and p["end"] <= cutoff]
+
+def _archive_schema(cur):
+    cur.execute("SELECT current_schema()")
+    schema = cur.fetchone()[0]
+    return "archive" if schema == "public" else schema + "_archive"
+
+def _unlink(cur, table):
+    """Drops a detached partition's foreign keys and sequence defaults.
+
+    Archived rows then stand alone: deleting a user no longer reaches them,
+    and the live tables' sequences can be dropped or reset independently.
+    """
+    cur.execute(queries.FOREIGN_KEYS, (table.string,))
+    for (name,) in cur.fetchall():
+        cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(table, sql.Identifier(name)))
+    cur.execute(queries.SEQUENCE_DEFAULTS, (table.string,))
+    for (column,) in cur.fetchall():
+        cur.execute(sql.SQL("ALTER TABLE {} ALTER COLUMN {} DROP DEFAULT").format(table, sql.Identifier(column)))
+
+def archive(older_than_months=24, mode="detach", archive_schema=None):
+    """Applies the archival policy to partitions entirely older than `older_than_months`.
+
+    Old rows in the default partitions are first moved into monthly partitions,
+    which the policy then covers. Returns a list of (partition, action) pairs,
+    including those it split out or skipped. Detached partitions move to
+    `archive_schema` (default "archive", or "<schema>_archive" off public).
+    """
+    if mode not in ARCHIVE_MODES:
+        raise ValueError(f"mode must be one of {list(ARCHIVE_MODES)}")
+    cutoff = _add_months(_month(datetime.date.today()), -older_than_months)
+    with backend.transaction() as cur:
+        if not is_partitioned(cur):
+            raise RuntimeError("workouts is not partitioned; run `python partitioning.py convert` first")
+        done = [(f"workouts_p{month:%Y%m}", action) for month, action in split_default(cur, cutoff)]
+    if mode == "compact":
+        return done + _compact(cutoff)
+
+    with backend.transaction() as cur:
+        schema = sql.Identifier(archive_schema or _archive_schema(cur))
+        cur.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(schema))
+        for partition in _old_partitions(cur, "workouts", cutoff):
+            workouts = sql.Identifier(partition["name"])
+            exercises = sql.Identifier("exercises" + partition["name"][len("workouts"):])
+            # Exercises first: the detached copy keeps its foreign key to
+            # workouts, which would block detaching the workouts partition.
+            cur.execute(sql.SQL("ALTER TABLE exercises DETACH PARTITION {}").format(exercises))
+            _unlink(cur, exercises)
+            cur.execute(sql.SQL("ALTER TABLE workouts DETACH PARTITION {}").format(workouts))
+            _unlink(cur, workouts)
+
+            # DETACH fires no triggers; bring the rollups in line by hand.
+            for statement in (queries.ARCHIVE_WEEKS_DELETE, queries.ARCHIVE_WEEKS_INSERT,
+                              queries.ARCHIVE_RECORDS_UPDATE, queries.ARCHIVE_RECORDS_DELETE):
+                cur.execute(sql.SQL(statement).format(workouts=workouts, exercises=exercises))
+            for table in (workouts, exercises):
+                cur.execute(sql.SQL("ALTER TABLE {} SET SCHEMA {}").format(table, schema))
+            done.append((partition["name"], f"detached to {schema.string}"))
+    if done:
+        query_cache.clear()
+    return done
+
+def _compact(cutoff):
+    """CLUSTERs and freezes old partitions, skipping those not modified since they were last vacuumed."""
+    with backend.transaction() as cur:
+        todo, skipped = [], []
+        for table in TABLES:
+            for partition in _old_partitions(cur, table, cutoff):
+                if partition["vacuumed"] and not partition["modified_since_analyze"]:
+                    skipped.append((partition["name"], "skipped: not modified since it was last vacuumed"))
+                    continue
+                cur.execute(queries.PARTITION_INDEX, (partition["name"], CLUSTER_INDEXES[table]))
+                row = cur.fetchone()
+                todo.append((partition["name"], row[0] if row else None))
+
+    # VACUUM cannot run inside a transaction block.
+    done = []
+    conn = psycopg2.connect(**backend.DB_CONFIG)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for name, index in todo:
+                if index:
+                    cur.execute(sql.SQL("CLUSTER {} USING {}").format(sql.Identifier(name), sql.SQL(index)))
+                cur.execute(sql.SQL("VACUUM (FREEZE, ANALYZE) {}").format(sql.Identifier(name)))
+                done.append((name, "clustered and frozen" if index else "frozen"))
+    finally:
+        conn.close()
+    return skipped + done
+
+def status(cur):
+    """Returns {table: partitions(table)} (empty lists while the tables are not partitioned)."""
+    if not is_partitioned(cur):
+        return {table: [] for table in TABLES}
+    return {table: partitions(cur, table) for table in TABLES}
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Monthly partitions of workouts and exercises.")
+    parser.add_argument("command", choices=("convert", "ensure", "split", "archive", "status"))
+    parser.add_argument("--months-ahead", type=int, default=DEFAULT_MONTHS_AHEAD,
+                        help="future months to create partitions for")
+    parser.add_argument("--older-than", type=int, default=24, help="archive partitions older than this many months")
+    parser.add_argument("--mode", choices=ARCHIVE_MODES, default="detach")
+    parser.add_argument("--archive-schema", help="where detached partitions go")
+    args = parser.parse_args(argv)
+
+    backend.initialize_database()
+    if args.command == "convert":
+        created = convert(args.months_ahead)
+        if created is None:
+            print("workouts and exercises are already partitioned.")
+        else:
+            print(f"Converted workouts and exercises to {len(created)} monthly partitions each.")
+        return 0
+    if args.command == "ensure":
+        with backend.transaction() as cur:
+            if not is_partitioned(cur):
+                print("workouts is not partitioned; run `python partitioning.py convert` first.")
+                return 1
+            changes = ensure_partitions(cur, args.months_ahead)
+        for month, action in changes:
+            print(f"{month:%Y-%m}: {action}")
+        if not changes:
+            print(f"Partitions already exist through {args.months_ahead} months ahead.")
+        return 1 if any(not action.startswith("created") for _, action in changes) else 0
+    if args.command == "split":
+        with backend.transaction() as cur:
+            if not is_partitioned(cur):
+                print("workouts is not partitioned; run `python partitioning.py convert` first.")
+                return 1
+            changes = split_default(cur)
+        for month, action in changes:
+            print(f"{month:%Y-%m}: {action}")
+        if not changes:
+            print("The default partitions are empty.")
+        else:
+            query_cache.clear()
+        return 0
+    if args.command == "archive":
+        done = archive(args.older_than, args.mode, args.archive_schema)
+        for name, action in done:
+            print(f"{name}: {action}")
+        if not done:
+            cutoff = _add_months(_month(datetime.date.today()), -args.older_than)
+            print(f"Nothing older than {cutoff:%Y-%m} to archive.")
+        return 0
+
+    with backend.transaction() as cur:
+        tables = status(cur)
+    if not tables["workouts"]:
+        print("workouts and exercises are not partitioned.")
+        return 0
+    for table, parts in tables.items():
+        print(f"{table}: {len(parts)} partitions")
+        for p in parts:
+            bounds = "default" if p["start"] is None else f"{p['start']} .. {p['end']}"
+            print(f"  {p['name']:<24} {bounds:<26} {p['rows']:>10} rows {p['bytes'] // 1024:>10} kB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
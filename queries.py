@@ -0,0 +1,694 @@
+# queries.py
+
+# SQL text for the backend, kept in one place so that everything running these
+# statements (backend.py, the EXPLAIN index check, ...) runs exactly the same SQL.
+# Parameters use the %s placeholder style of psycopg2.
+
+# --- USER PROFILE ---
+USER_PROFILE = "SELECT name, email, weight_kg FROM users WHERE user_id = %s"
+
+UPDATE_USER_PROFILE = "UPDATE users SET name = %s, email = %s, weight_kg = %s WHERE user_id = %s"
+
+ALL_USERS = "SELECT user_id, name FROM users WHERE user_id != %s"
+
+# --- WORKOUTS ---
+# Joins from workouts to exercises also match workout_date: with partitioned
+# tables (partitioning.py) each workout's exercises are then looked up in the
+# one partition holding its month.
+INSERT_WORKOUT = """
+    INSERT INTO workouts (user_id, workout_date, duration_minutes)
+    VALUES (%s, %s, %s)
+    RETURNING workout_id
+"""
+
+# All exercises of one workout in a single statement, passed as parallel arrays
+# so that the same SQL works with psycopg2 and with psycopg 3 (backend_async.py).
+# Exercises repeat their workout's date (migration 0007); exercise_type_id is
+# filled in from the name by a trigger (migration 0010).
+INSERT_WORKOUT_EXERCISES = """
+    INSERT INTO exercises (workout_id, workout_date, exercise_name, sets, reps, weight_kg)
+    SELECT %(workout_id)s, %(workout_date)s, *
+    FROM unnest(%(names)s::text[], %(sets)s::int[], %(reps)s::int[], %(weights)s::numeric[])
+"""
+
+USER_WORKOUTS = """
+    SELECT workout_id, workout_date, duration_minutes
+    FROM workouts
+    WHERE user_id = %s
+    ORDER BY workout_date DESC
+"""
+
+# One page of history, newest first, with each workout's exercises joined in.
+# Keyset pagination: the next page starts strictly after the last
+# (workout_date, workout_id) seen, so every page is an index range scan no
+# matter how deep into the history it is. The FIRST variant has no cursor.
+_WORKOUT_HISTORY_PAGE = """
+    WITH page AS (
+        SELECT workout_id, workout_date, duration_minutes
+        FROM workouts
+        WHERE user_id = %(user_id)s {cursor_condition}
+        ORDER BY workout_date DESC, workout_id DESC
+        LIMIT %(limit)s
+    )
+    SELECT p.workout_id, p.workout_date, p.duration_minutes, COALESCE(c.name, e.exercise_name),
+           e.sets, e.reps, e.weight_kg
+    FROM page p
+    LEFT JOIN exercises e ON e.workout_id = p.workout_id AND e.workout_date = p.workout_date
+    LEFT JOIN exercise_catalog c ON c.exercise_type_id = e.exercise_type_id
+    ORDER BY p.workout_date DESC, p.workout_id DESC, e.exercise_id
+"""
+
+WORKOUT_HISTORY_FIRST_PAGE = _WORKOUT_HISTORY_PAGE.format(cursor_condition="")
+
+WORKOUT_HISTORY_NEXT_PAGE = _WORKOUT_HISTORY_PAGE.format(
+    cursor_condition="AND (workout_date, workout_id) < (%(before_date)s, %(before_id)s)"
+)
+
+# Minutes per period for charting, from the weekly rollup, merged into at most
+# %(max_points)s consecutive buckets however long the history is.
+DURATION_SERIES = """
+    WITH weeks AS (
+        SELECT week_start, total_minutes,
+               row_number() OVER (ORDER BY week_start) - 1 AS i,
+               count(*) OVER () AS n
+        FROM weekly_activity
+        WHERE user_id = %(user_id)s
+    )
+    SELECT min(week_start), sum(total_minutes)::bigint
+    FROM weeks
+    GROUP BY i * %(max_points)s / n
+    ORDER BY 1
+"""
+
+# Exercises show their catalog name; rows not yet backfilled (catalog.py) show
+# the name as entered.
+WORKOUT_DETAILS = """
+    SELECT COALESCE(c.name, e.exercise_name), e.sets, e.reps, e.weight_kg
+    FROM exercises e
+    LEFT JOIN exercise_catalog c ON c.exercise_type_id = e.exercise_type_id
+    WHERE e.workout_id = %s
+"""
+
+# --- FRIENDS ---
+FRIENDS = """
+    SELECT u.user_id, u.name
+    FROM users u
+    JOIN friends f ON u.user_id = f.friend_id
+    WHERE f.user_id = %s
+"""
+
+# Reverse lookup ("who has this user as a friend"). The backend does not run it
+# directly, but PostgreSQL does on every ON DELETE CASCADE from users.
+FRIENDED_BY = "SELECT user_id FROM friends WHERE friend_id = %s"
+
+ADD_FRIEND = "INSERT INTO friends (user_id, friend_id) VALUES (%s, %s)"
+
+REMOVE_FRIEND = "DELETE FROM friends WHERE user_id = %s AND friend_id = %s"
+
+# Users whose name matches the search and who are not yet the user's friends,
+# in (lower(name), user_id) keyset order (indexes from migration 0011). One
+# extra row is fetched to detect the end.
+_SEARCH_USERS = """
+    SELECT u.user_id, u.name, lower(u.name)
+    FROM users u
+    WHERE lower(u.name) COLLATE "C" LIKE {pattern}
+      AND u.user_id <> %(user_id)s
+      AND NOT EXISTS (SELECT 1 FROM friends f WHERE f.user_id = %(user_id)s AND f.friend_id = u.user_id)
+      {cursor_condition}
+    ORDER BY lower(u.name) COLLATE "C", u.user_id
+    LIMIT %(limit)s
+"""
+
+_NAME_PREFIX = "lower(%(query)s) || '%%'"
+
+_NAME_SUBSTRING = "'%%' || lower(%(query)s) || '%%'"
+
+_AFTER_NAME = 'AND (lower(u.name) COLLATE "C", u.user_id) > (%(after_name)s, %(after_id)s)'
+
+SEARCH_USERS_BY_PREFIX = _SEARCH_USERS.format(pattern=_NAME_PREFIX, cursor_condition="")
+
+SEARCH_USERS_BY_PREFIX_NEXT = _SEARCH_USERS.format(pattern=_NAME_PREFIX, cursor_condition=_AFTER_NAME)
+
+SEARCH_USERS_BY_SUBSTRING = _SEARCH_USERS.format(pattern=_NAME_SUBSTRING, cursor_condition="")
+
+SEARCH_USERS_BY_SUBSTRING_NEXT = _SEARCH_USERS.format(pattern=_NAME_SUBSTRING, cursor_condition=_AFTER_NAME)
+
+# Friends of the user's friends, most mutual friends first. Bounded: at most
+# max_friends of the user's friends are followed, and at most max_per_friend of
+# each one's friends, so the work does not grow with the size of the graph.
+FRIEND_SUGGESTIONS = """
+    WITH my_friends AS (
+        SELECT friend_id FROM friends WHERE user_id = %(user_id)s
+        ORDER BY friend_id
+        LIMIT %(max_friends)s
+    ), candidates AS (
+        SELECT c.friend_id AS user_id
+        FROM my_friends m
+        CROSS JOIN LATERAL (
+            SELECT friend_id FROM friends WHERE user_id = m.friend_id
+            ORDER BY friend_id
+            LIMIT %(max_per_friend)s
+        ) c
+    )
+    SELECT u.user_id, u.name, count(*) AS mutual_friends
+    FROM candidates c
+    JOIN users u ON u.user_id = c.user_id
+    WHERE c.user_id <> %(user_id)s
+      AND NOT EXISTS (SELECT 1 FROM friends f WHERE f.user_id = %(user_id)s AND f.friend_id = c.user_id)
+    GROUP BY u.user_id, u.name
+    ORDER BY mutual_friends DESC, u.name, u.user_id
+    LIMIT %(limit)s
+"""
+
+# --- GOALS ---
+# Only the active goal is touched, through the partial unique index on
+# goals (user_id) WHERE is_active.
+DEACTIVATE_GOALS = "UPDATE goals SET is_active = FALSE, end_date = CURRENT_DATE WHERE user_id = %s AND is_active"
+
+INSERT_GOAL = "INSERT INTO goals (user_id, goal_description, target_value) VALUES (%s, %s, %s)"
+
+ACTIVE_GOAL = "SELECT goal_description, target_value FROM goals WHERE user_id = %s AND is_active = TRUE"
+
+# This week's workouts and minutes against the active goal: one lookup each in
+# goals (partial index), weekly_activity and goal_progress (primary keys). The
+# streak comes from the last batch evaluation (goals.py) if it covered this
+# week; the current week counts once it meets the target.
+GOAL_PROGRESS = """
+    SELECT g.goal_description, g.target_value,
+           COALESCE(wa.workout_count, 0), COALESCE(wa.total_minutes, 0),
+           gp.prior_streak_weeks + (COALESCE(wa.workout_count, 0) >= g.target_value)::int
+    FROM goals g
+    LEFT JOIN weekly_activity wa
+      ON wa.user_id = g.user_id AND wa.week_start = date_trunc('week', CURRENT_DATE)::date
+    LEFT JOIN goal_progress gp
+      ON gp.user_id = g.user_id AND gp.goal_id = g.goal_id AND gp.week_start = date_trunc('week', CURRENT_DATE)::date
+    WHERE g.user_id = %s AND g.is_active
+"""
+
+# Batch evaluation of every active goal for the week starting %(week_start)s,
+# in one set-based statement. Streaks are the runs of consecutive weeks meeting
+# the target since the goal's first week (gaps and islands over weekly_activity):
+# the island whose last week is the one before %(week_start)s is the streak.
+EVALUATE_GOALS = """
+    WITH active AS (
+        SELECT goal_id, user_id, target_value,
+               date_trunc('week', COALESCE(start_date, CURRENT_DATE))::date AS first_week
+        FROM goals
+        WHERE is_active AND target_value IS NOT NULL
+    ),
+    met_weeks AS (
+        SELECT a.user_id, wa.week_start,
+               wa.week_start - 7 * row_number() OVER (PARTITION BY a.user_id ORDER BY wa.week_start)::int AS island
+        FROM active a
+        JOIN weekly_activity wa ON wa.user_id = a.user_id
+        WHERE wa.week_start >= a.first_week AND wa.week_start < %(week_start)s
+          AND wa.workout_count >= a.target_value
+    ),
+    streaks AS (
+        SELECT user_id, count(*) AS weeks
+        FROM met_weeks
+        GROUP BY user_id, island
+        HAVING max(week_start) = %(week_start)s::date - 7
+    )
+    INSERT INTO goal_progress AS gp (user_id, goal_id, week_start, target_value, workouts, minutes,
+                                     met, prior_streak_weeks, streak_weeks, evaluated_at)
+    SELECT a.user_id, a.goal_id, %(week_start)s, a.target_value,
+           COALESCE(wa.workout_count, 0), COALESCE(wa.total_minutes, 0),
+           COALESCE(wa.workout_count, 0) >= a.target_value,
+           COALESCE(s.weeks, 0),
+           COALESCE(s.weeks, 0) + (COALESCE(wa.workout_count, 0) >= a.target_value)::int,
+           now()
+    FROM active a
+    LEFT JOIN weekly_activity wa ON wa.user_id = a.user_id AND wa.week_start = %(week_start)s
+    LEFT JOIN streaks s ON s.user_id = a.user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        goal_id = EXCLUDED.goal_id,
+        week_start = EXCLUDED.week_start,
+        target_value = EXCLUDED.target_value,
+        workouts = EXCLUDED.workouts,
+        minutes = EXCLUDED.minutes,
+        met = EXCLUDED.met,
+        prior_streak_weeks = EXCLUDED.prior_streak_weeks,
+        streak_weeks = EXCLUDED.streak_weeks,
+        evaluated_at = EXCLUDED.evaluated_at
+"""
+
+# Progress rows of goals that are no longer active.
+DELETE_STALE_GOAL_PROGRESS = """
+    DELETE FROM goal_progress gp
+    WHERE NOT EXISTS (SELECT 1 FROM goals g WHERE g.goal_id = gp.goal_id AND g.is_active)
+"""
+
+# Stored results of one week, e.g. for reminders to users still short of their target.
+GOAL_PROGRESS_FOR_WEEK = """
+    SELECT gp.user_id, u.name, gp.target_value, gp.workouts, gp.minutes, gp.met, gp.streak_weeks
+    FROM goal_progress gp
+    JOIN users u ON u.user_id = gp.user_id
+    WHERE gp.week_start = %(week_start)s AND (%(met)s::boolean IS NULL OR gp.met = %(met)s)
+    ORDER BY gp.user_id
+"""
+
+# --- EXERCISE CATALOG (migration 0010, catalog.py) ---
+EXERCISE_CATALOG = "SELECT exercise_type_id, name FROM exercise_catalog ORDER BY name"
+
+EXERCISE_ALIASES = """
+    SELECT a.alias, c.name
+    FROM exercise_aliases a
+    JOIN exercise_catalog c ON c.exercise_type_id = a.exercise_type_id
+"""
+
+# The exercise type of each name, adding new names to the catalog.
+RESOLVE_EXERCISE_TYPES = "SELECT n, resolve_exercise_type(n) FROM unnest(%s::text[]) AS n"
+
+EXERCISE_TYPE_BY_NAME = """
+    SELECT c.exercise_type_id, c.name
+    FROM exercise_aliases a
+    JOIN exercise_catalog c ON c.exercise_type_id = a.exercise_type_id
+    WHERE a.alias = normalize_exercise_name(%s)
+"""
+
+ADD_EXERCISE_ALIAS = """
+    INSERT INTO exercise_aliases (alias, exercise_type_id)
+    VALUES (normalize_exercise_name(%s), %s)
+    ON CONFLICT (alias) DO NOTHING
+"""
+
+# One batch of the online backfill; returns the last exercise_id covered, NULL at the end.
+BACKFILL_EXERCISE_TYPES = "SELECT backfill_exercise_types(%s, %s)"
+
+UNTYPED_EXERCISES = "SELECT count(*) FROM exercises WHERE exercise_type_id IS NULL"
+
+EXERCISE_TYPE_INDEX_VALID = """
+    SELECT COALESCE((
+        SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass('exercises_exercise_type_id_workout_id_idx')
+    ), FALSE)
+"""
+
+# Merging one exercise type into another: the exercises trigger moves personal
+# records along with the rows.
+MERGE_EXERCISE_ALIASES = "UPDATE exercise_aliases SET exercise_type_id = %(into)s WHERE exercise_type_id = %(from)s"
+
+MERGE_EXERCISES = "UPDATE exercises SET exercise_type_id = %(into)s WHERE exercise_type_id = %(from)s"
+
+DELETE_EXERCISE_TYPE = "DELETE FROM exercise_catalog WHERE exercise_type_id = %s"
+
+# --- BUSINESS INSIGHTS & LEADERBOARD ---
+# Served from the weekly_activity rollup (migration 0004), so the cost depends
+# on how many users were active this week, not on the size of the history.
+# Keyed by user_id so that users who share a name are ranked separately.
+LEADERBOARD = """
+    SELECT wa.user_id, u.name, wa.total_minutes
+    FROM weekly_activity wa
+    JOIN users u ON u.user_id = wa.user_id
+    WHERE wa.week_start = date_trunc('week', CURRENT_DATE)::date
+    ORDER BY wa.total_minutes DESC, u.name
+"""
+
+# The user and their friends ranked by minutes this week (0 for those who have
+# not trained), keeping the first `top` positions and `neighbours` positions
+# either side of the user. Reads only the user's friends and their rollup rows.
+FRIENDS_LEADERBOARD = """
+    WITH members AS (
+        SELECT %(user_id)s AS user_id
+        UNION
+        SELECT friend_id FROM friends WHERE user_id = %(user_id)s
+    ), board AS (
+        SELECT u.user_id, u.name, COALESCE(wa.total_minutes, 0) AS total_minutes,
+               RANK() OVER (ORDER BY COALESCE(wa.total_minutes, 0) DESC) AS rank,
+               ROW_NUMBER() OVER (ORDER BY COALESCE(wa.total_minutes, 0) DESC, u.name, u.user_id) AS position,
+               COUNT(*) OVER () AS members
+        FROM members m
+        JOIN users u ON u.user_id = m.user_id
+        LEFT JOIN weekly_activity wa
+            ON wa.user_id = m.user_id AND wa.week_start = date_trunc('week', CURRENT_DATE)::date
+    )
+    SELECT b.position, b.rank, b.user_id, b.name, b.total_minutes, b.members
+    FROM board b
+    JOIN board me ON me.user_id = %(user_id)s
+    WHERE b.position <= %(top)s
+       OR b.position BETWEEN me.position - %(neighbours)s AND me.position + %(neighbours)s
+    ORDER BY b.position
+"""
+
+# COUNT, SUM and AVG in one pass over the user's workouts.
+WORKOUT_STATISTICS = """
+    SELECT COUNT(*), COALESCE(SUM(duration_minutes), 0), ROUND(AVG(duration_minutes), 2)
+    FROM workouts
+    WHERE user_id = %s
+"""
+
+# Maintained by triggers on exercises (migration 0005): one row per exercise
+# type (migration 0010), however many workouts the user has logged.
+PERSONAL_RECORDS = """
+    SELECT c.name, pr.best_weight_kg, pr.best_volume_kg, pr.best_e1rm_kg
+    FROM personal_records pr
+    JOIN exercise_catalog c ON c.exercise_type_id = pr.exercise_type_id
+    WHERE pr.user_id = %s
+    ORDER BY c.name
+"""
+
+# --- ANALYTICS (analytics.py) ---
+# Both statements aggregate one user's workouts per %(granularity)s ('week' or
+# 'month'). Without %(periods)s they cover the whole history; with a list of
+# period starts they recompute just those periods (the date bounds keep that
+# an index range scan).
+_ANALYTICS_RANGE = """
+    w.user_id = %(user_id)s
+    AND (%(periods)s::date[] IS NULL OR (
+        w.workout_date >= %(first_period)s AND w.workout_date < %(end_date)s
+        AND date_trunc(%(granularity)s, w.workout_date)::date = ANY(%(periods)s::date[])
+    ))
+"""
+
+# Workouts, minutes and volume (sets x reps x weight) per period.
+TRAINING_PERIODS = """
+    WITH per_workout AS (
+        SELECT date_trunc(%(granularity)s, w.workout_date)::date AS period_start,
+               w.duration_minutes,
+               COALESCE(sum(e.sets * e.reps * e.weight_kg), 0) AS volume_kg
+        FROM workouts w
+        LEFT JOIN exercises e ON e.workout_id = w.workout_id AND e.workout_date = w.workout_date
+        WHERE {range}
+        GROUP BY w.workout_id, w.workout_date
+    )
+    SELECT period_start, count(*), COALESCE(sum(duration_minutes), 0), sum(volume_kg)
+    FROM per_workout
+    GROUP BY period_start
+""".format(range=_ANALYTICS_RANGE)
+
+# The top set (best estimated 1RM, Epley) of every exercise in every period.
+TOP_SETS = """
+    SELECT ranked.period_start, c.name, ranked.weight_kg, ranked.reps, ranked.e1rm_kg
+    FROM (
+        SELECT date_trunc(%(granularity)s, w.workout_date)::date AS period_start,
+               e.exercise_type_id, e.weight_kg, e.reps,
+               estimated_1rm(e.weight_kg, e.reps) AS e1rm_kg,
+               row_number() OVER (
+                   PARTITION BY date_trunc(%(granularity)s, w.workout_date), e.exercise_type_id
+                   ORDER BY estimated_1rm(e.weight_kg, e.reps) DESC, e.weight_kg DESC
+               ) AS rank
+        FROM workouts w
+        JOIN exercises e ON e.workout_id = w.workout_id AND e.workout_date = w.workout_date
+        WHERE {range} AND e.weight_kg > 0 AND e.reps > 0 AND e.exercise_type_id IS NOT NULL
+    ) ranked
+    JOIN exercise_catalog c ON c.exercise_type_id = ranked.exercise_type_id
+    WHERE ranked.rank = 1
+""".format(range=_ANALYTICS_RANGE)
+
+# --- BULK IMPORT ---
+# Workout ids are reserved from the sequence up front so that exercises can be
+# written in the same batch as their workout, with no RETURNING round trip.
+# Exercise types are resolved once per distinct name (catalog.py) rather than
+# by the per-row trigger.
+RESERVE_WORKOUT_IDS = """
+    SELECT nextval(pg_get_serial_sequence('workouts', 'workout_id'))
+    FROM generate_series(1, %s)
+"""
+
+COPY_WORKOUTS = "COPY workouts (workout_id, user_id, workout_date, duration_minutes) FROM STDIN WITH (FORMAT csv)"
+
+COPY_EXERCISES = """
+    COPY exercises (workout_id, workout_date, exercise_name, exercise_type_id, sets, reps, weight_kg)
+    FROM STDIN WITH (FORMAT csv)
+"""
+
+# Multi-row inserts: the single %s is expanded by psycopg2.extras.execute_values.
+INSERT_WORKOUTS_WITH_IDS = "INSERT INTO workouts (workout_id, user_id, workout_date, duration_minutes) VALUES %s"
+
+INSERT_EXERCISES = """
+    INSERT INTO exercises (workout_id, workout_date, exercise_name, exercise_type_id, sets, reps, weight_kg) VALUES %s
+"""
+
+# --- WRITE-BEHIND INGESTION (ingest.py, migration 0013) ---
+# Claims the keys of a batch of queued workouts and reserves a workout id for
+# each. Keys another transaction already claimed are left out (after waiting
+# for it to commit), so their workouts are not written twice.
+CLAIM_IDEMPOTENCY_KEYS = """
+    INSERT INTO ingested_workouts (idempotency_key, workout_id)
+    SELECT key, nextval(pg_get_serial_sequence('workouts', 'workout_id'))
+    FROM unnest(%s::text[]) AS key
+    ON CONFLICT (idempotency_key) DO NOTHING
+    RETURNING idempotency_key, workout_id
+"""
+
+# Many workouts, and then all of their exercises, each in one statement, as
+# parallel arrays (see INSERT_WORKOUT_EXERCISES).
+INSERT_WORKOUT_BATCH = """
+    INSERT INTO workouts (workout_id, user_id, workout_date, duration_minutes)
+    SELECT * FROM unnest(%(workout_ids)s::int[], %(user_ids)s::int[], %(dates)s::date[], %(durations)s::int[])
+"""
+
+INSERT_EXERCISE_BATCH = """
+    INSERT INTO exercises (workout_id, workout_date, exercise_name, sets, reps, weight_kg)
+    SELECT * FROM unnest(%(workout_ids)s::int[], %(dates)s::date[], %(names)s::text[],
+                         %(sets)s::int[], %(reps)s::int[], %(weights)s::numeric[])
+"""
+
+PRUNE_IDEMPOTENCY_KEYS = "DELETE FROM ingested_workouts WHERE ingested_at < now() - %s * interval '1 day'"
+
+# --- EXPORT ---
+# Every exercise of the selected workouts, one row each, in the importer's
+# column layout. Rows of one workout are adjacent. A NULL user or date bound
+# means "no filter"; psycopg2 inlines the values, so the planner folds those
+# conditions away and uses the (user_id, workout_date, workout_id) index.
+EXPORT_HISTORY = """
+    SELECT w.user_id, w.workout_id, w.workout_date, w.duration_minutes,
+           e.exercise_name, e.sets, e.reps, e.weight_kg
+    FROM workouts w
+    LEFT JOIN exercises e ON e.workout_id = w.workout_id AND e.workout_date = w.workout_date
+    WHERE (%(user_id)s::int IS NULL OR w.user_id = %(user_id)s)
+      AND (%(start_date)s::date IS NULL OR w.workout_date >= %(start_date)s)
+      AND (%(end_date)s::date IS NULL OR w.workout_date <= %(end_date)s)
+    ORDER BY w.user_id, w.workout_date, w.workout_id, e.exercise_id
+"""
+
+# --- SYNTHETIC DATA (datagen.py) ---
+RESERVE_USER_IDS = """
+    SELECT nextval(pg_get_serial_sequence('users', 'user_id'))
+    FROM generate_series(1, %s)
+"""
+
+COPY_USERS = "COPY users (user_id, name, email, weight_kg) FROM STDIN WITH (FORMAT csv)"
+
+COPY_GOALS = """
+    COPY goals (user_id, goal_description, target_value, start_date, end_date, is_active)
+    FROM STDIN WITH (FORMAT csv)
+"""
+
+# Generated friend edges may repeat, so they go through a staging table and
+# duplicates are dropped on the way into friends.
+CREATE_FRIENDS_STAGING = "CREATE TEMP TABLE friends_staging (user_id INTEGER, friend_id INTEGER) ON COMMIT DROP"
+
+COPY_FRIENDS_STAGING = "COPY friends_staging (user_id, friend_id) FROM STDIN WITH (FORMAT csv)"
+
+INSERT_FRIENDS_FROM_STAGING = """
+    INSERT INTO friends (user_id, friend_id)
+    SELECT DISTINCT user_id, friend_id FROM friends_staging
+    ON CONFLICT DO NOTHING
+"""
+
+# --- PARTITIONING (partitioning.py) ---
+# Monthly partitions from the month of first_month through months_ahead months
+# later; a no-op while workouts is not partitioned (migration 0008).
+CREATE_MONTHLY_PARTITIONS = """
+    SELECT month, action
+    FROM create_monthly_partitions(
+        %(first_month)s,
+        (date_trunc('month', %(first_month)s::date) + make_interval(months => %(months_ahead)s))::date
+    )
+"""
+
+IS_PARTITIONED = "SELECT COALESCE((SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('workouts')), FALSE)"
+
+# Definitions recreated on the partitioned tables. Indexes that back one of the
+# table's own constraints come back with the constraint.
+TABLE_INDEXES = """
+    SELECT pg_get_indexdef(i.indexrelid), i.indisunique,
+           ARRAY(SELECT a.attname::text FROM pg_attribute a WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey))
+    FROM pg_index i
+    WHERE i.indrelid = %s::regclass
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid AND c.conrelid = i.indrelid)
+    ORDER BY i.indexrelid
+"""
+
+TABLE_CONSTRAINTS = """
+    SELECT c.conname, c.contype, pg_get_constraintdef(c.oid),
+           ARRAY(SELECT a.attname::text FROM unnest(c.conkey) WITH ORDINALITY k(attnum, n)
+                 JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum ORDER BY k.n)
+    FROM pg_constraint c
+    WHERE c.conrelid = %s::regclass AND c.contype IN ('p', 'u', 'f', 'x')
+    ORDER BY c.oid
+"""
+
+TABLE_TRIGGERS = "SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal ORDER BY oid"
+
+# Sequences owned by the table's columns (SERIAL), which would be dropped with it.
+OWNED_SEQUENCES = """
+    SELECT d.objid::regclass::text, a.attname
+    FROM pg_depend d
+    JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+    JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+    WHERE d.classid = 'pg_class'::regclass AND d.refobjid = %s::regclass AND d.deptype = 'a'
+"""
+
+# Views reading the tables, directly or through other views, innermost first.
+DEPENDENT_VIEWS = """
+    WITH RECURSIVE views AS (
+        SELECT r.ev_class AS oid, 1 AS depth
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        WHERE d.classid = 'pg_rewrite'::regclass
+          AND d.refobjid = ANY(%s::regclass[]) AND r.ev_class <> d.refobjid
+        UNION ALL
+        SELECT r.ev_class, v.depth + 1
+        FROM views v
+        JOIN pg_depend d ON d.refobjid = v.oid AND d.classid = 'pg_rewrite'::regclass
+        JOIN pg_rewrite r ON r.oid = d.objid
+        WHERE r.ev_class <> v.oid
+    )
+    SELECT v.oid::regclass::text, c.relkind, pg_get_viewdef(v.oid), max(v.depth)
+    FROM views v
+    JOIN pg_class c ON c.oid = v.oid
+    GROUP BY v.oid, c.relkind
+    ORDER BY max(v.depth), 1
+"""
+
+# One row per partition of a table, with its bounds as written in the catalog
+# ("FOR VALUES FROM ('2025-01-01') TO ('2025-02-01')" or "DEFAULT").
+PARTITIONS = """
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), COALESCE(s.n_live_tup, 0),
+           pg_total_relation_size(c.oid), s.last_vacuum, s.last_autovacuum, COALESCE(s.n_mod_since_analyze, 0)
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE i.inhparent = %s::regclass
+    ORDER BY c.relname
+"""
+
+# Months with rows in the default partitions, oldest first, before a date
+# (NULL for all of them).
+DEFAULT_PARTITION_MONTHS = """
+    SELECT DISTINCT date_trunc('month', workout_date)::date AS month
+    FROM (
+        SELECT workout_date FROM workouts_default
+        UNION ALL
+        SELECT workout_date FROM exercises_default
+    ) d
+    WHERE %(before)s::date IS NULL OR workout_date < %(before)s::date
+    ORDER BY month
+"""
+
+# The partition's own index attached to the named index of its parent.
+PARTITION_INDEX = """
+    SELECT i.indexrelid::regclass::text
+    FROM pg_index i
+    JOIN pg_inherits h ON h.inhrelid = i.indexrelid
+    WHERE i.indrelid = %s::regclass AND h.inhparent = to_regclass(%s)
+"""
+
+FOREIGN_KEYS = "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'"
+
+# Columns whose default draws from a sequence (SERIAL).
+SEQUENCE_DEFAULTS = """
+    SELECT a.attname
+    FROM pg_attrdef d
+    JOIN pg_attribute a ON a.attrelid = d.adrelid AND a.attnum = d.adnum
+    WHERE d.adrelid = %s::regclass AND pg_get_expr(d.adbin, d.adrelid) LIKE 'nextval(%%'
+"""
+
+# After archiving the workouts partition {workouts} (with exercises {exercises}):
+# recompute the weeks it touched from the workouts still attached. A week that
+# straddles the cutoff keeps the part that stays.
+ARCHIVE_WEEKS_DELETE = """
+    DELETE FROM weekly_activity wa
+    USING (SELECT DISTINCT user_id, date_trunc('week', workout_date)::date AS week_start FROM {workouts}) a
+    WHERE wa.user_id = a.user_id AND wa.week_start = a.week_start
+"""
+
+ARCHIVE_WEEKS_INSERT = """
+    INSERT INTO weekly_activity (user_id, week_start, workout_count, total_minutes)
+    SELECT w.user_id, a.week_start, count(*), COALESCE(sum(w.duration_minutes), 0)
+    FROM (SELECT DISTINCT user_id, date_trunc('week', workout_date)::date AS week_start FROM {workouts}) a
+    JOIN workouts w ON w.user_id = a.user_id AND w.workout_date >= a.week_start AND w.workout_date < a.week_start + 7
+    GROUP BY 1, 2
+"""
+
+# Records set in an archived workout are recomputed from what is left; records
+# with nothing left are dropped.
+ARCHIVE_RECORDS_UPDATE = """
+    INSERT INTO personal_records AS pr
+    SELECT x.*
+    FROM personal_records_expected x
+    JOIN (
+        SELECT DISTINCT p.user_id, p.exercise_type_id
+        FROM personal_records p
+        JOIN {workouts} w
+          ON w.workout_id IN (p.best_weight_workout_id, p.best_volume_workout_id, p.best_e1rm_workout_id)
+    ) affected ON affected.user_id = x.user_id AND affected.exercise_type_id = x.exercise_type_id
+    ON CONFLICT (user_id, exercise_type_id) DO UPDATE SET
+        best_weight_kg = EXCLUDED.best_weight_kg,
+        best_weight_workout_id = EXCLUDED.best_weight_workout_id,
+        best_volume_kg = EXCLUDED.best_volume_kg,
+        best_volume_workout_id = EXCLUDED.best_volume_workout_id,
+        best_e1rm_kg = EXCLUDED.best_e1rm_kg,
+        best_e1rm_workout_id = EXCLUDED.best_e1rm_workout_id
+"""
+
+ARCHIVE_RECORDS_DELETE = """
+    DELETE FROM personal_records p
+    USING {workouts} w
+    WHERE w.workout_id IN (p.best_weight_workout_id, p.best_volume_workout_id, p.best_e1rm_workout_id)
+"""
+
+# --- ROLLUPS ---
+REBUILD_WEEKLY_ACTIVITY = """
+    INSERT INTO weekly_activity (user_id, week_start, workout_count, total_minutes)
+    SELECT user_id, date_trunc('week', workout_date)::date, count(*), COALESCE(sum(duration_minutes), 0)
+    FROM workouts
+    GROUP BY 1, 2
+"""
+
+# Rows where the rollup disagrees with the raw workouts table.
+WEEKLY_ACTIVITY_MISMATCHES = """
+    WITH actual AS (
+        SELECT user_id, date_trunc('week', workout_date)::date AS week_start,
+               count(*) AS workout_count, COALESCE(sum(duration_minutes), 0) AS total_minutes
+        FROM workouts
+        GROUP BY 1, 2
+    )
+    SELECT COALESCE(a.user_id, wa.user_id), COALESCE(a.week_start, wa.week_start),
+           a.workout_count, wa.workout_count, a.total_minutes, wa.total_minutes
+    FROM actual a
+    FULL OUTER JOIN weekly_activity wa ON wa.user_id = a.user_id AND wa.week_start = a.week_start
+    WHERE a.workout_count IS DISTINCT FROM wa.workout_count
+       OR a.total_minutes IS DISTINCT FROM wa.total_minutes
+    ORDER BY 1, 2
+"""
+
+REBUILD_PERSONAL_RECORDS = "INSERT INTO personal_records SELECT * FROM personal_records_expected"
+
+# Records that disagree with a from-scratch recomputation over exercises.
+PERSONAL_RECORDS_MISMATCHES = """
+    SELECT COALESCE(x.user_id, pr.user_id), COALESCE(x.exercise_type_id, pr.exercise_type_id),
+           x.best_weight_kg, pr.best_weight_kg, x.best_volume_kg, pr.best_volume_kg,
+           x.best_e1rm_kg, pr.best_e1rm_kg
+    FROM personal_records_expected x
+    FULL OUTER JOIN personal_records pr ON pr.user_id = x.user_id AND pr.exercise_type_id = x.exercise_type_id
+    WHERE x.best_weight_kg IS DISTINCT FROM pr.best_weight_kg
+       OR x.best_volume_kg IS DISTINCT FROM pr.best_volume_kg
+       OR x.best_e1rm_kg IS DISTINCT FROM pr.best_e1rm_kg
+    ORDER BY 1, 2
+"""
+
+# --- ROUTING (routing.py) ---
+# Seconds a replica is behind its primary: 0 while it is streaming and has
+# replayed everything received, otherwise the age of the last replayed
+# transaction. A server that is not a replica is never behind. Run on the replica.
+REPLICA_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming')
+             AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 'Infinity')
+    END
+"""
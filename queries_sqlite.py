@@ -0,0 +1,283 @@
+# queries_sqlite.py
+
+# SQLite versions of the queries.py statements whose PostgreSQL text SQLite
+# cannot run (date_trunc, ::casts, arrays, LATERAL, COLLATE "C", ...), for the
+# embedded engine (sqlite_storage.py). Each constant has the name of the
+# statement it replaces and returns the same columns; every statement not
+# listed here is portable and runs as written. Parameters keep the psycopg2
+# placeholder style, lists are passed as JSON arrays. Parallel arrays (unnest()
+# in PostgreSQL) are each read into a MATERIALIZED CTE and joined on their
+# keys, which SQLite does through automatic indexes; joining json_each calls
+# directly would compare every pair of elements.
+#
+# Computed date and NUMERIC columns are tagged "name [date]" / "name [numeric]"
+# so that they come back as datetime.date and Decimal, like from psycopg2;
+# plain table columns get that from their declared types.
+
+# date_trunc('week', ...) (weeks start on Monday) and date_trunc('month', ...).
+_WEEK_OF = "date({0}, 'weekday 0', '-6 days')"
+
+_THIS_WEEK = _WEEK_OF.format("'now', 'localtime'")
+
+_PERIOD_OF = "CASE %(granularity)s WHEN 'month' THEN date({0}, 'start of month') ELSE " + _WEEK_OF + " END"
+
+# --- WORKOUTS ---
+INSERT_WORKOUT_EXERCISES = """
+    WITH n AS MATERIALIZED (SELECT key, value FROM json_each(%(names)s)),
+         s AS MATERIALIZED (SELECT key, value FROM json_each(%(sets)s)),
+         r AS MATERIALIZED (SELECT key, value FROM json_each(%(reps)s)),
+         w AS MATERIALIZED (SELECT key, value FROM json_each(%(weights)s))
+    INSERT INTO exercises (workout_id, workout_date, exercise_name, sets, reps, weight_kg)
+    SELECT %(workout_id)s, %(workout_date)s, n.value, s.value, r.value, w.value
+    FROM n
+    JOIN s ON s.key = n.key
+    JOIN r ON r.key = n.key
+    JOIN w ON w.key = n.key
+    ORDER BY n.key
+"""
+
+DURATION_SERIES = """
+    WITH weeks AS (
+        SELECT week_start, total_minutes,
+               row_number() OVER (ORDER BY week_start) - 1 AS i,
+               count(*) OVER () AS n
+        FROM weekly_activity
+        WHERE user_id = %(user_id)s
+    )
+    SELECT min(week_start) AS "week_start [date]", sum(total_minutes)
+    FROM weeks
+    GROUP BY i * %(max_points)s / n
+    ORDER BY 1
+"""
+
+# --- FRIENDS ---
+# SQLite compares text bytewise, like the "C" collation. It cannot use an index
+# for LIKE on lower(name), so searches scan users, which embedded deployments
+# keep small; the index still serves the keyset order.
+_SEARCH_USERS = """
+    SELECT u.user_id, u.name, lower(u.name)
+    FROM users u
+    WHERE lower(u.name) LIKE {pattern} ESCAPE '\\'
+      AND u.user_id <> %(user_id)s
+      AND NOT EXISTS (SELECT 1 FROM friends f WHERE f.user_id = %(user_id)s AND f.friend_id = u.user_id)
+      {cursor_condition}
+    ORDER BY lower(u.name), u.user_id
+    LIMIT %(limit)s
+"""
+
+_NAME_PREFIX = "lower(%(query)s) || '%%'"
+
+_NAME_SUBSTRING = "'%%' || lower(%(query)s) || '%%'"
+
+_AFTER_NAME = "AND (lower(u.name), u.user_id) > (%(after_name)s, %(after_id)s)"
+
+SEARCH_USERS_BY_PREFIX = _SEARCH_USERS.format(pattern=_NAME_PREFIX, cursor_condition="")
+
+SEARCH_USERS_BY_PREFIX_NEXT = _SEARCH_USERS.format(pattern=_NAME_PREFIX, cursor_condition=_AFTER_NAME)
+
+SEARCH_USERS_BY_SUBSTRING = _SEARCH_USERS.format(pattern=_NAME_SUBSTRING, cursor_condition="")
+
+SEARCH_USERS_BY_SUBSTRING_NEXT = _SEARCH_USERS.format(pattern=_NAME_SUBSTRING, cursor_condition=_AFTER_NAME)
+
+# No LATERAL: each friend's first max_per_friend friends are picked with row_number().
+FRIEND_SUGGESTIONS = """
+    WITH my_friends AS (
+        SELECT friend_id FROM friends WHERE user_id = %(user_id)s
+        ORDER BY friend_id
+        LIMIT %(max_friends)s
+    ), candidates AS (
+        SELECT user_id
+        FROM (
+            SELECT f.friend_id AS user_id,
+                   row_number() OVER (PARTITION BY f.user_id ORDER BY f.friend_id) AS n
+            FROM my_friends m
+            JOIN friends f ON f.user_id = m.friend_id
+        )
+        WHERE n <= %(max_per_friend)s
+    )
+    SELECT u.user_id, u.name, count(*) AS mutual_friends
+    FROM candidates c
+    JOIN users u ON u.user_id = c.user_id
+    WHERE c.user_id <> %(user_id)s
+      AND NOT EXISTS (SELECT 1 FROM friends f WHERE f.user_id = %(user_id)s AND f.friend_id = c.user_id)
+    GROUP BY u.user_id, u.name
+    ORDER BY mutual_friends DESC, u.name, u.user_id
+    LIMIT %(limit)s
+"""
+
+# --- GOALS ---
+DEACTIVATE_GOALS = """
+    UPDATE goals SET is_active = FALSE, end_date = date('now', 'localtime')
+    WHERE user_id = %s AND is_active
+"""
+
+GOAL_PROGRESS = """
+    SELECT g.goal_description, g.target_value,
+           COALESCE(wa.workout_count, 0), COALESCE(wa.total_minutes, 0),
+           gp.prior_streak_weeks + (COALESCE(wa.workout_count, 0) >= g.target_value)
+    FROM goals g
+    LEFT JOIN weekly_activity wa
+      ON wa.user_id = g.user_id AND wa.week_start = {this_week}
+    LEFT JOIN goal_progress gp
+      ON gp.user_id = g.user_id AND gp.goal_id = g.goal_id AND gp.week_start = {this_week}
+    WHERE g.user_id = %s AND g.is_active
+""".format(this_week=_THIS_WEEK)
+
+# --- BUSINESS INSIGHTS & LEADERBOARD ---
+LEADERBOARD = """
+    SELECT wa.user_id, u.name, wa.total_minutes
+    FROM weekly_activity wa
+    JOIN users u ON u.user_id = wa.user_id
+    WHERE wa.week_start = {this_week}
+    ORDER BY wa.total_minutes DESC, u.name
+""".format(this_week=_THIS_WEEK)
+
+FRIENDS_LEADERBOARD = """
+    WITH members AS (
+        SELECT %(user_id)s AS user_id
+        UNION
+        SELECT friend_id FROM friends WHERE user_id = %(user_id)s
+    ), board AS (
+        SELECT u.user_id, u.name, COALESCE(wa.total_minutes, 0) AS total_minutes,
+               RANK() OVER (ORDER BY COALESCE(wa.total_minutes, 0) DESC) AS rank,
+               ROW_NUMBER() OVER (ORDER BY COALESCE(wa.total_minutes, 0) DESC, u.name, u.user_id) AS position,
+               COUNT(*) OVER () AS members
+        FROM members m
+        JOIN users u ON u.user_id = m.user_id
+        LEFT JOIN weekly_activity wa
+            ON wa.user_id = m.user_id AND wa.week_start = {this_week}
+    )
+    SELECT b.position, b.rank, b.user_id, b.name, b.total_minutes, b.members
+    FROM board b
+    JOIN board me ON me.user_id = %(user_id)s
+    WHERE b.position <= %(top)s
+       OR b.position BETWEEN me.position - %(neighbours)s AND me.position + %(neighbours)s
+    ORDER BY b.position
+""".format(this_week=_THIS_WEEK)
+
+WORKOUT_STATISTICS = """
+    SELECT COUNT(*), COALESCE(SUM(duration_minutes), 0), ROUND(AVG(duration_minutes), 2) AS "avg [numeric]"
+    FROM workouts
+    WHERE user_id = %s
+"""
+
+# --- ANALYTICS (analytics.py) ---
+_ANALYTICS_RANGE = """
+    w.user_id = %(user_id)s
+    AND (%(periods)s IS NULL OR (
+        w.workout_date >= %(first_period)s AND w.workout_date < %(end_date)s
+        AND {period} IN (SELECT value FROM json_each(%(periods)s))
+    ))
+""".format(period=_PERIOD_OF.format("w.workout_date"))
+
+TRAINING_PERIODS = """
+    WITH per_workout AS (
+        SELECT {period} AS period_start,
+               w.duration_minutes,
+               COALESCE(sum(e.sets * e.reps * e.weight_kg), 0) AS volume_kg
+        FROM workouts w
+        LEFT JOIN exercises e ON e.workout_id = w.workout_id AND e.workout_date = w.workout_date
+        WHERE {range}
+        GROUP BY w.workout_id, w.workout_date
+    )
+    SELECT period_start AS "period_start [date]", count(*), COALESCE(sum(duration_minutes), 0),
+           sum(volume_kg) AS "volume_kg [numeric]"
+    FROM per_workout
+    GROUP BY period_start
+""".format(period=_PERIOD_OF.format("w.workout_date"), range=_ANALYTICS_RANGE)
+
+TOP_SETS = """
+    SELECT ranked.period_start AS "period_start [date]", c.name, ranked.weight_kg, ranked.reps,
+           ranked.e1rm_kg AS "e1rm_kg [numeric]"
+    FROM (
+        SELECT {period} AS period_start,
+               e.exercise_type_id, e.weight_kg, e.reps,
+               estimated_1rm(e.weight_kg, e.reps) AS e1rm_kg,
+               row_number() OVER (
+                   PARTITION BY {period}, e.exercise_type_id
+                   ORDER BY estimated_1rm(e.weight_kg, e.reps) DESC, e.weight_kg DESC
+               ) AS rank
+        FROM workouts w
+        JOIN exercises e ON e.workout_id = w.workout_id AND e.workout_date = w.workout_date
+        WHERE {range} AND e.weight_kg > 0 AND e.reps > 0 AND e.exercise_type_id IS NOT NULL
+    ) ranked
+    JOIN exercise_catalog c ON c.exercise_type_id = ranked.exercise_type_id
+    WHERE ranked.rank = 1
+""".format(period=_PERIOD_OF.format("w.workout_date"), range=_ANALYTICS_RANGE)
+
+# --- WRITE-BEHIND INGESTION (ingest.py) ---
+# No sequences: ids follow the highest workout_id, which holds because write
+# transactions run one at a time (BEGIN IMMEDIATE).
+CLAIM_IDEMPOTENCY_KEYS = """
+    INSERT INTO ingested_workouts (idempotency_key, workout_id)
+    SELECT k.value, (SELECT COALESCE(max(workout_id), 0) FROM workouts) + k.key + 1
+    FROM json_each(%s) k
+    WHERE true
+    ON CONFLICT (idempotency_key) DO NOTHING
+    RETURNING idempotency_key, workout_id
+"""
+
+INSERT_WORKOUT_BATCH = """
+    WITH i AS MATERIALIZED (SELECT key, value FROM json_each(%(workout_ids)s)),
+         u AS MATERIALIZED (SELECT key, value FROM json_each(%(user_ids)s)),
+         d AS MATERIALIZED (SELECT key, value FROM json_each(%(dates)s)),
+         m AS MATERIALIZED (SELECT key, value FROM json_each(%(durations)s))
+    INSERT INTO workouts (workout_id, user_id, workout_date, duration_minutes)
+    SELECT i.value, u.value, d.value, m.value
+    FROM i
+    JOIN u ON u.key = i.key
+    JOIN d ON d.key = i.key
+    JOIN m ON m.key = i.key
+"""
+
+INSERT_EXERCISE_BATCH = """
+    WITH i AS MATERIALIZED (SELECT key, value FROM json_each(%(workout_ids)s)),
+         d AS MATERIALIZED (SELECT key, value FROM json_each(%(dates)s)),
+         n AS MATERIALIZED (SELECT key, value FROM json_each(%(names)s)),
+         s AS MATERIALIZED (SELECT key, value FROM json_each(%(sets)s)),
+         r AS MATERIALIZED (SELECT key, value FROM json_each(%(reps)s)),
+         w AS MATERIALIZED (SELECT key, value FROM json_each(%(weights)s))
+    INSERT INTO exercises (workout_id, workout_date, exercise_name, sets, reps, weight_kg)
+    SELECT i.value, d.value, n.value, s.value, r.value, w.value
+    FROM i
+    JOIN d ON d.key = i.key
+    JOIN n ON n.key = i.key
+    JOIN s ON s.key = i.key
+    JOIN r ON r.key = i.key
+    JOIN w ON w.key = i.key
+    ORDER BY i.key
+"""
+
+PRUNE_IDEMPOTENCY_KEYS = """
+    DELETE FROM ingested_workouts
+    WHERE ingested_at < strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now', -%s || ' days')
+"""
+
+# --- ROLLUPS ---
+WEEKLY_ACTIVITY_MISMATCHES = """
+    WITH actual AS (
+        SELECT user_id, {week} AS week_start,
+               count(*) AS workout_count, COALESCE(sum(duration_minutes), 0) AS total_minutes
+        FROM workouts
+        GROUP BY 1, 2
+    )
+    SELECT COALESCE(a.user_id, wa.user_id), COALESCE(a.week_start, wa.week_start) AS "week_start [date]",
+           a.workout_count, wa.workout_count, a.total_minutes, wa.total_minutes
+    FROM actual a
+    FULL OUTER JOIN weekly_activity wa ON wa.user_id = a.user_id AND wa.week_start = a.week_start
+    WHERE a.workout_count IS NOT wa.workout_count
+       OR a.total_minutes IS NOT wa.total_minutes
+    ORDER BY 1, 2
+""".format(week=_WEEK_OF.format("workout_date"))
+
+PERSONAL_RECORDS_MISMATCHES = """
+    SELECT COALESCE(x.user_id, pr.user_id), COALESCE(x.exercise_type_id, pr.exercise_type_id),
+           x.best_weight_kg, pr.best_weight_kg, x.best_volume_kg, pr.best_volume_kg,
+           x.best_e1rm_kg, pr.best_e1rm_kg
+    FROM personal_records_expected x
+    FULL OUTER JOIN personal_records pr ON pr.user_id = x.user_id AND pr.exercise_type_id = x.exercise_type_id
+    WHERE x.best_weight_kg IS NOT pr.best_weight_kg
+       OR x.best_volume_kg IS NOT pr.best_volume_kg
+       OR x.best_e1rm_kg IS NOT pr.best_e1rm_kg
+    ORDER BY 1, 2
+"""
@@ -0,0 +1,275 @@
+# query_cache.py
+
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# A small in-process, read-through cache for backend read functions.
+#
+# Entries are keyed by function name and arguments, expire after a per-function
+# TTL and are evicted least-recently-used beyond `maxsize`. Every entry carries
+# a set of tags (e.g. "user:1", "leaderboard") derived from its arguments and
+# result; write functions call invalidate() with the tags they affect, which
+# evicts exactly the entries carrying any of them.
+#
+# The cache lives in module state, so it survives Streamlit reruns (modules are
+# imported once per process) and works the same when backend.py is used as a
+# plain library. Cached values are shared between callers and must be treated
+# as read-only.
+#
+# Inside request_scope() (one Streamlit rerun, say) every read result is also
+# remembered until the scope ends, so asking for the same thing twice costs
+# nothing even with the cache disabled or an entry expiring half-way through a
+# page. prefetch() loads several reads into the scope and cache at once, for
+# pages that know up front what they will read. Invalidations clear the scope.
+#
+# With read replicas a read can return data from before a write that already
+# invalidated its entry. The backend sets `settle_seconds` to how far behind a
+# replica may be, and results are not stored while one of their tags was
+# invalidated more recently than that. It also sets `bypass`, so that a session
+# reading its own writes from the primary does not get entries stored by others.
+
+class QueryCache:
+    """Thread-safe LRU cache with TTLs, tag-based invalidation and counters."""
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value, tags)
+        self._tagged = {}               # tag -> set of keys
+        # Invalidation clock: every invalidate() bumps it and stamps the tags it
+        # touched, so a read that started before the invalidation does not
+        # store the stale result it fetched.
+        self._clock = 0
+        self._tag_clock = {}
+        self._clock_floor = 0   # tags not in _tag_clock count as invalidated at this time
+        # Results are not stored within `settle_seconds` of an invalidation of
+        # one of their tags; lookups miss while `bypass()` returns True.
+        self.settle_seconds = 0.0
+        self.bypass = None
+        self._tag_time = {}     # tag -> monotonic time of its last invalidation
+        self._floor_time = float("-inf")
+        self._counters = {}
+
+    def _count(self, name, counter, n=1):
+        counters = self._counters.setdefault(
+            name, {"hits": 0, "misses": 0, "bypasses": 0, "evictions": 0, "invalidations": 0}
+        )
+        counters[counter] += n
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def lookup(self, key):
+        """Returns (True, value) on a fresh hit, (False, clock) on a miss."""
+        name = key[0]
+        bypass = self.bypass is not None and self.bypass()
+        with self._lock:
+            if bypass:
+                self._count(name, "bypasses")
+                return False, self._clock
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._count(name, "hits")
+                    return True, entry[1]
+                self._remove(key)
+            self._count(name, "misses")
+            return False, self._clock
+
+    def store(self, key, value, ttl, tags, started_at):
+        """Caches `value` unless one of its tags was invalidated since `started_at`, or too recently."""
+        tags = frozenset(tags) | {key[0]}
+        with self._lock:
+            if self._clock_floor > started_at:
+                return
+            if any(self._tag_clock.get(tag, 0) > started_at for tag in tags):
+                return
+            if self.settle_seconds:
+                settled = time.monotonic() - self.settle_seconds
+                if self._floor_time > settled or any(self._tag_time.get(tag, self._floor_time) > settled for tag in tags):
+                    return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._count(oldest[0], "evictions")
+
+    def invalidate(self, *tags):
+        """Evicts every entry carrying any of `tags`; returns how many were evicted."""
+        with self._lock:
+            self._clock += 1
+            if len(self._tag_clock) > 4 * self.maxsize:
+                # Keep the stamps bounded: forgetting them only means reads in
+                # flight right now will not store their results.
+                self._tag_clock.clear()
+                self._clock_floor = self._clock
+                self._tag_time.clear()
+                self._floor_time = time.monotonic()
+            evicted = 0
+            now = time.monotonic()
+            for tag in tags:
+                self._tag_clock[tag] = self._clock
+                self._tag_time[tag] = now
+                for key in list(self._tagged.get(tag, ())):
+                    self._remove(key)
+                    self._count(key[0], "invalidations")
+                    evicted += 1
+            return evicted
+
+    def clear(self):
+        """Drops every entry (counters are kept)."""
+        with self._lock:
+            self._clock += 1
+            self._tag_clock.clear()
+            self._clock_floor = self._clock
+            self._tag_time.clear()
+            self._floor_time = time.monotonic()
+            self._entries.clear()
+            self._tagged.clear()
+
+    def stats(self):
+        """Returns {function name: {hits, misses, bypasses, evictions, invalidations, size, hit_rate}}."""
+        with self._lock:
+            sizes = {}
+            for key in self._entries:
+                sizes[key[0]] = sizes.get(key[0], 0) + 1
+            result = {}
+            for name, counters in self._counters.items():
+                lookups = counters["hits"] + counters["misses"]
+                result[name] = dict(
+                    counters,
+                    size=sizes.get(name, 0),
+                    hit_rate=round(counters["hits"] / lookups, 3) if lookups else 0.0,
+                )
+            return result
+
+# Process-wide cache used by the backend.
+default_cache = QueryCache()
+
+# key -> result of every read made in the current request_scope(), or None outside one
+_scope = contextvars.ContextVar("query_cache_scope", default=None)
+
+@contextmanager
+def request_scope():
+    """Remembers every cached read's result until the block ends."""
+    token = _scope.set({})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+def cached(ttl, tags=None, cache=None):
+    """Decorator that caches a read function's result for `ttl` seconds.
+
+    `tags(args, result)` returns the tags the entry should carry, in addition
+    to the function name. The TTL can be changed later through the wrapper's
+    `ttl` attribute, and `wrapper.uncached` calls the function directly.
+    """
+    def decorator(func):
+        name = func.__name__
+        signature = inspect.signature(func)
+
+        def bind(*args, **kwargs):
+            # Key on the bound argument values, so f(1) and f(user_id=1) share an entry.
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return tuple(bound.arguments.values())
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            args = bind(*args, **kwargs)
+            key = (name,) + args
+            scope = _scope.get()
+            if scope is not None and key in scope:
+                return scope[key]
+            target = cache or default_cache
+            if not target.enabled:
+                result = func(*args)
+            else:
+                hit, value = target.lookup(key)
+                if hit:
+                    result = value
+                else:
+                    result = func(*args)
+                    target.store(key, result, wrapper.ttl, tags(args, result) if tags else (), value)
+            if scope is not None:
+                scope[key] = result
+            return result
+
+        wrapper.ttl = ttl
+        wrapper.uncached = func
+        wrapper.bind = bind
+        wrapper.tags = tags
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+def prefetch(calls, fetch):
+    """Loads several cached reads at once into the cache and the current request scope.
+
+    `calls` is a list of (cached function, *args). Those found in neither are
+    passed to fetch([(function, bound args), ...]), which must return their
+    results in the same order. Returns every call's result, in call order.
+    """
+    keys = [(func.__name__,) + func.bind(*args) for func, *args in calls]
+    scope = _scope.get()
+    results, missing = {}, {}
+    for (func, *_), key in zip(calls, keys):
+        if key in results or key in missing:
+            continue
+        if scope is not None and key in scope:
+            results[key] = scope[key]
+            continue
+        target = func.cache or default_cache
+        started_at = None
+        if target.enabled:
+            hit, value = target.lookup(key)
+            if hit:
+                results[key] = value
+                continue
+            started_at = value
+        missing[key] = (func, target, started_at)
+    if missing:
+        fetched = fetch([(func, key[1:]) for key, (func, _, _) in missing.items()])
+        for (key, (func, target, started_at)), result in zip(missing.items(), fetched):
+            if target.enabled:
+                args = key[1:]
+                target.store(key, result, func.ttl, func.tags(args, result) if func.tags else (), started_at)
+            results[key] = result
+    if scope is not None:
+        scope.update(results)
+    return [results[key] for key in keys]
+
+def _clear_scope():
+    scope = _scope.get()
+    if scope:
+        scope.clear()
+
+def invalidate(*tags):
+    """Evicts entries carrying any of `tags` from the process-wide cache (and the request scope)."""
+    _clear_scope()
+    return default_cache.invalidate(*tags)
+
+def clear():
+    _clear_scope()
+    default_cache.clear()
+
+def stats():
+    return default_cache.stats()
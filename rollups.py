@@ -0,0 +1,97 @@
+# rollups.py
+
+import sys
+
+import backend
+import queries
+import query_cache
+
+# weekly_activity and personal_records are maintained by triggers on workouts
+# and exercises (migrations 0004 and 0005). These helpers rebuild them from
+# scratch and verify them against the raw tables, e.g. after restoring a backup
+# or loading data with triggers disabled.
+
+def rebuild_weekly_activity():
+    """Recomputes weekly_activity from workouts; returns the number of rollup rows."""
+    with backend.transaction() as cur:
+        # Block concurrent writes to workouts so no delta is lost between the
+        # TRUNCATE and the re-aggregation; reads carry on as normal.
+        cur.execute("LOCK TABLE workouts IN SHARE MODE")
+        cur.execute("TRUNCATE weekly_activity")
+        cur.execute(queries.REBUILD_WEEKLY_ACTIVITY)
+        rows = cur.rowcount
+    query_cache.clear()
+    return rows
+
+def check_weekly_activity(limit=100):
+    """Compares weekly_activity with workouts.
+
+    Returns a list of at most `limit` mismatches as dicts; an empty list means
+    the rollup is consistent.
+    """
+    with backend.transaction() as cur:
+        cur.execute(queries.WEEKLY_ACTIVITY_MISMATCHES + " LIMIT %s", (limit,))
+        rows = cur.fetchall()
+    return [
+        {
+            "user_id": user_id,
+            "week_start": week_start,
+            "expected_workouts": expected_workouts or 0,
+            "rollup_workouts": rollup_workouts or 0,
+            "expected_minutes": expected_minutes or 0,
+            "rollup_minutes": rollup_minutes or 0,
+        }
+        for user_id, week_start, expected_workouts, rollup_workouts, expected_minutes, rollup_minutes in rows
+    ]
+
+def rebuild_personal_records():
+    """Recomputes personal_records from exercises; returns the number of records."""
+    with backend.transaction() as cur:
+        cur.execute("LOCK TABLE workouts, exercises IN SHARE MODE")
+        cur.execute("TRUNCATE personal_records")
+        cur.execute(queries.REBUILD_PERSONAL_RECORDS)
+        rows = cur.rowcount
+    query_cache.clear()
+    return rows
+
+def check_personal_records(limit=100):
+    """Compares personal_records with a recomputation; returns at most `limit` mismatches."""
+    with backend.transaction() as cur:
+        cur.execute(queries.PERSONAL_RECORDS_MISMATCHES + " LIMIT %s", (limit,))
+        rows = cur.fetchall()
+    return [
+        {
+            "user_id": user_id,
+            "exercise_type_id": exercise_type_id,
+            "expected": (expected_weight, expected_volume, expected_e1rm),
+            "stored": (stored_weight, stored_volume, stored_e1rm),
+        }
+        for (user_id, exercise_type_id, expected_weight, stored_weight,
+             expected_volume, stored_volume, expected_e1rm, stored_e1rm) in rows
+    ]
+
+def main(argv):
+    command = argv[0] if argv else "check"
+    if command == "rebuild":
+        print(f"Rebuilt weekly_activity: {rebuild_weekly_activity()} rows.")
+        print(f"Rebuilt personal_records: {rebuild_personal_records()} rows.")
+        return 0
+    if command == "check":
+        mismatches = check_weekly_activity()
+        for m in mismatches:
+            print(
+                f"user {m['user_id']} week {m['week_start']}: "
+                f"workouts {m['rollup_workouts']} (expected {m['expected_workouts']}), "
+                f"minutes {m['rollup_minutes']} (expected {m['expected_minutes']})"
+            )
+        record_mismatches = check_personal_records()
+        for m in record_mismatches:
+            print(f"user {m['user_id']} exercise type {m['exercise_type_id']}: records {m['stored']} (expected {m['expected']})")
+        mismatches += record_mismatches
+        print("Rollups are consistent." if not mismatches else f"{len(mismatches)} mismatches found.")
+        return 1 if mismatches else 0
+    print("usage: python rollups.py [check|rebuild]")
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,287 @@
+# routing.py
+
+import argparse
+import contextvars
+import functools
+import itertools
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.pool import PoolError
+
+import queries
+from db_pool import ConnectionPool, PoolTimeout
+
+# Read/write splitting. Writes and anything that must see the latest data use
+# the primary (backend.transaction()); read functions use
+# backend.read_transaction(), which a Router sends to a read replica when one is
+# configured, reachable and no further behind than `max_staleness` seconds, and
+# to the primary otherwise:
+#
+#   backend.REPLICAS = [{"host": "replica1"}, {"host": "replica2", "port": "5433"}]
+#   backend.configure_routing(max_staleness=5.0)
+#
+# Read-your-writes: a session's reads stay on the primary for `sticky_seconds`
+# after it writes. Keep that above max_staleness + lag_check_interval, the
+# furthest behind a replica can be while still being picked. Sessions are
+# per-context (set_session(), e.g. one per Streamlit browser session); code that
+# never sets one shares a single process-wide session. The backend's query
+# cache does not serve a sticky session either, and holds off caching results
+# until replicas can have caught up with the writes that invalidated them.
+#
+# A replica that cannot be reached is skipped for `retry_after` seconds, and a
+# read that fails on a replica part-way is run again on the primary.
+#
+#   python routing.py status --replica 127.0.0.1:5433
+#   python routing.py check --replica 127.0.0.1:5433
+
+_session = contextvars.ContextVar("routing_session", default=None)
+_force_primary = contextvars.ContextVar("routing_force_primary", default=False)
+
+# session -> monotonic time of its last write. Kept outside any Router so that
+# writes made before the router exists (or through backend_async) still count.
+_last_writes = {}
+_writes_lock = threading.Lock()
+_MAX_SESSIONS = 10000
+
+class ReplicaUnavailable(psycopg2.OperationalError):
+    """A read failed on a replica; replica_read() runs it again on the primary."""
+
+def set_session(key):
+    """Sets the session (any hashable) that reads and writes in this context belong to."""
+    _session.set(key)
+
+def current_session():
+    """The session reads and writes in this context belong to."""
+    return _session.get()
+
+def record_write(forget_after=3600.0):
+    """Notes that the current session just wrote."""
+    record_write_in(_session.get(), forget_after)
+
+def record_write_in(session_key, forget_after=3600.0):
+    """Notes that session `session_key` just wrote, e.g. when a queued write of its lands."""
+    now = time.monotonic()
+    with _writes_lock:
+        _last_writes[session_key] = now
+        if len(_last_writes) > _MAX_SESSIONS:
+            for key in [key for key, t in _last_writes.items() if now - t > forget_after]:
+                del _last_writes[key]
+
+def seconds_since_write():
+    """Seconds since the current session last wrote, None if it has not."""
+    last_write = _last_writes.get(_session.get())
+    return None if last_write is None else time.monotonic() - last_write
+
+@contextmanager
+def session(key):
+    token = _session.set(key)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+def replica_read(func):
+    """Runs `func` once more, on the primary, if its read on a replica failed."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except ReplicaUnavailable:
+            token = _force_primary.set(True)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _force_primary.reset(token)
+    return wrapper
+
+class Replica:
+    """One read replica: its pool, last measured lag and when it may be retried."""
+
+    def __init__(self, name, conn_kwargs, pool_config):
+        self.name = name
+        self.pool = ConnectionPool(conn_kwargs, **{**pool_config, "minconn": 0})
+        self.lag = None            # seconds behind the primary, None until measured
+        self.lag_checked_at = 0.0
+        self.down_until = 0.0
+        self.reads = 0
+        self.failures = 0
+
+    def measure_lag(self):
+        with self.pool.transaction() as cur:
+            cur.execute(queries.REPLICA_LAG)
+            self.lag = float(cur.fetchone()[0])
+        self.lag_checked_at = time.monotonic()
+        return self.lag
+
+    def mark_down(self, retry_after):
+        self.down_until = time.monotonic() + retry_after
+        self.lag = None
+        self.failures += 1
+
+class Router:
+    """Picks the pool each read runs on: a fresh enough replica, or the primary."""
+
+    def __init__(self, primary, replicas=(), max_staleness=5.0, sticky_seconds=10.0,
+                 lag_check_interval=1.0, retry_after=30.0):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_staleness = max_staleness
+        self.sticky_seconds = sticky_seconds
+        self.lag_check_interval = lag_check_interval
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._rotation = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        self._stats = {"primary_reads": 0, "sticky_reads": 0, "fallback_reads": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def sticky(self):
+        """True while the current session's reads stay on the primary after its last write."""
+        since = seconds_since_write()
+        return since is not None and since < self.sticky_seconds
+
+    def choose(self):
+        """Returns the replica the next read should use, or None for the primary."""
+        if not self.replicas or _force_primary.get():
+            self._count("fallback_reads" if self.replicas else "primary_reads")
+            return None
+        if self.sticky():
+            self._count("sticky_reads")
+            return None
+        with self._lock:
+            start = next(self._rotation)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            now = time.monotonic()
+            if now < replica.down_until:
+                continue
+            if replica.lag is None or now - replica.lag_checked_at >= self.lag_check_interval:
+                try:
+                    replica.measure_lag()
+                except PoolTimeout:
+                    continue
+                except (psycopg2.Error, PoolError):
+                    replica.mark_down(self.retry_after)
+                    continue
+            if replica.lag <= self.max_staleness:
+                return replica
+        self._count("fallback_reads")
+        return None
+
+    @contextmanager
+    def read_transaction(self, cursor_factory=None):
+        """Yields a cursor on a replica (or the primary) inside one read transaction.
+
+        Connection failures on a replica mark it down and raise ReplicaUnavailable,
+        as do reads cancelled by replication conflicts; see replica_read().
+        """
+        replica = self.choose()
+        if replica is None:
+            with self.primary.transaction(cursor_factory=cursor_factory) as cur:
+                yield cur
+            return
+        try:
+            with replica.pool.transaction(cursor_factory=cursor_factory) as cur:
+                yield cur
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # Errors from the server itself carry an SQLSTATE; those without one
+            # mean the connection is gone.
+            if getattr(e, "pgcode", None) is None:
+                replica.mark_down(self.retry_after)
+            raise ReplicaUnavailable(f"read on replica {replica.name} failed: {e}") from e
+        with self._lock:
+            replica.reads += 1
+
+    def stats(self):
+        """Read counts per target, and each replica's lag and state."""
+        with self._lock:
+            snapshot = dict(self._stats)
+        now = time.monotonic()
+        snapshot["replicas"] = [
+            {
+                "name": r.name,
+                "reads": r.reads,
+                "failures": r.failures,
+                "lag_seconds": r.lag,
+                "down": now < r.down_until,
+            }
+            for r in self.replicas
+        ]
+        return snapshot
+
+    def close(self):
+        for replica in self.replicas:
+            replica.pool.closeall()
+
+def _replica_arg(value):
+    host, _, port = value.rpartition(":")
+    return {"host": host, "port": port} if host else {"host": value}
+
+def main(argv):
+    import backend  # imports this module
+
+    parser = argparse.ArgumentParser(description="Check read/write routing against a primary and its replicas.")
+    parser.add_argument("command", choices=("status", "check"))
+    parser.add_argument("--replica", action="append", type=_replica_arg, default=[],
+                        help="HOST[:PORT] of a replica, overriding backend.REPLICAS (repeatable)")
+    parser.add_argument("--sticky-seconds", type=float, help="shorter stickiness so that `check` runs quickly")
+    args = parser.parse_args(argv)
+
+    if args.replica:
+        backend.REPLICAS[:] = args.replica
+    if args.sticky_seconds is not None:
+        backend.configure_routing(sticky_seconds=args.sticky_seconds)
+    if not backend.REPLICAS:
+        print("No replicas configured: every read goes to the primary.")
+        return 1
+    backend.initialize_database()
+    router = backend.get_router()
+
+    if args.command == "status":
+        router.choose()
+        for r in router.stats()["replicas"]:
+            state = "down" if r["down"] else f"lag {r['lag_seconds']:.3f}s"
+            print(f"{r['name']:<30} {state}")
+        return 0 if any(not r["down"] for r in router.stats()["replicas"]) else 1
+
+    # check: a write, a read of it in the same session, then reads after the
+    # session stops being sticky.
+    failures = []
+    with session("routing-check"):
+        profile = backend.get_user_profile(1)
+        if profile is None:
+            print("user 1 does not exist; run the app once to seed the database.")
+            return 1
+        name, email, weight = profile
+        backend.update_user_profile(1, name, email, float(weight) + 0.01)
+        before = router.stats()
+        if abs(float(backend.get_user_profile(1)[2]) - (float(weight) + 0.01)) > 0.001:
+            failures.append("read after write did not see the write")
+        after = router.stats()
+        if after["sticky_reads"] != before["sticky_reads"] + 1:
+            failures.append("read after write was not sent to the primary")
+        backend.update_user_profile(1, name, email, weight)
+        time.sleep(router.sticky_seconds)
+        before = sum(r["reads"] for r in router.stats()["replicas"])
+        for user_id in range(1, 21):
+            backend.get_workout_statistics(user_id)
+        replica_reads = sum(r["reads"] for r in router.stats()["replicas"]) - before
+        if not replica_reads:
+            failures.append("no read went to a replica once the session was no longer sticky")
+
+    for r in router.stats()["replicas"]:
+        state = "down" if r["down"] else f"lag {r['lag_seconds']:.3f}s"
+        print(f"{r['name']:<30} {state}, {r['reads']} reads, {r['failures']} failures")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("Routing works." if not failures else f"{len(failures)} checks failed.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,427 @@
+# sqlite_storage.py
+
+import datetime
+import decimal
+import functools
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import instrumentation
+import migrations
+import queries
+import queries_sqlite
+
+# The embedded storage engine: the whole database in one local SQLite file, for
+# single-user deployments that should start instantly without a database
+# server. With backend.STORAGE_CONFIG["engine"] = "sqlite", backend.transaction()
+# and read_transaction() hand out cursors from here instead of the PostgreSQL
+# pool, so every backend function runs unchanged on either engine:
+#
+#   storage = SQLiteStorage("fitness.db")
+#   storage.migrate()
+#   with storage.transaction() as cur:
+#       cur.execute(queries.USER_PROFILE, (1,))
+#
+# Statements are the queries.py constants. Those with a SQLite version in
+# queries_sqlite.py run that instead, the others run as written; psycopg2
+# placeholders become SQLite ones either way. Lists (PostgreSQL arrays) are
+# passed as JSON text, and dates and NUMERIC columns come back as
+# datetime.date and Decimal, as from psycopg2: result columns named like a DATE
+# or NUMERIC column of the schema, and computed ones tagged "name [date]". The
+# cursor converts them itself, leaving sqlite3's process-wide converters alone.
+#
+# Transactions borrow a connection from a pool shared by all threads, of at most
+# `max_connections` (plus `max_overflow` for nested transactions); threads come and go (every Streamlit rerun runs in a new
+# one) and reuse them. In WAL mode readers do not block the writer or each other; writes take the database's write lock when their
+# transaction begins (BEGIN IMMEDIATE), so a second writer waits up to
+# `busy_timeout` for it rather than failing halfway through. The schema is
+# migrations/sqlite/*.sql, applied by migrate().
+
+MIGRATIONS_DIR = migrations.SQLITE_MIGRATIONS_DIR
+
+def _decimal(value):
+    # Every NUMERIC column in the schema has two decimal places.
+    return decimal.Decimal(str(value)).quantize(decimal.Decimal("0.01"))
+
+def _date(value):
+    return datetime.date.fromisoformat(value)
+
+# declared column type -> what the cursor turns its values into
+CONVERTERS = {"DATE": _date, "NUMERIC": _decimal}
+
+# A computed result column tagged with its type: "week_start [date]"
+_COLUMN_TAG = re.compile(r"(.*?)(?: \[(\w+)\])?$", re.DOTALL)
+
+_SCHEMA_COLUMNS = """
+    SELECT c.name, c.type FROM sqlite_master AS m, pragma_table_info(m.name) AS c
+    WHERE m.type IN ('table', 'view')
+"""
+
+def column_converters(conn):
+    """Result column name -> converter, for the names the schema declares with one CONVERTERS type."""
+    types = {}
+    for name, declared in conn.execute(_SCHEMA_COLUMNS):
+        if not declared:
+            continue    # a view's computed column
+        types.setdefault(name, set()).add(re.split(r"[\s(]", declared.strip(), 1)[0].upper())
+    return {
+        name: CONVERTERS[declared]
+        for name, (declared, *others) in types.items()
+        if not others and declared in CONVERTERS
+    }
+
+# --- SQL functions (the PostgreSQL ones of the same names) ---
+def normalize_exercise_name(name):
+    return None if name is None else " ".join(name.split()).lower()
+
+def squeeze_whitespace(name):
+    return None if name is None else " ".join(name.split())
+
+def estimated_1rm(weight_kg, reps):
+    """Epley estimate of the one-rep max, rounded like PostgreSQL's numeric round()."""
+    if weight_kg is None or reps is None or reps < 1:
+        return 0
+    weight = decimal.Decimal(str(weight_kg))
+    if reps == 1:
+        return float(weight)
+    e1rm = weight * (1 + decimal.Decimal(reps) / 30)
+    return float(e1rm.quantize(decimal.Decimal("0.01"), rounding=decimal.ROUND_HALF_UP))
+
+FUNCTIONS = (
+    ("normalize_exercise_name", 1, normalize_exercise_name),
+    ("squeeze_whitespace", 1, squeeze_whitespace),
+    ("estimated_1rm", 2, estimated_1rm),
+)
+
+# --- Statement translation ---
+# PostgreSQL text -> SQLite text of the statements queries_sqlite.py replaces.
+_DIALECT = {
+    getattr(queries, name): text for name, text in vars(queries_sqlite).items()
+    if name.isupper() and not name.startswith("_")
+}
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+def _placeholder(match):
+    if match.group(1):
+        return ":" + match.group(1)
+    return "?" if match.group(0) == "%s" else "%"
+
+@functools.lru_cache(maxsize=512)
+def translate(statement):
+    """The SQLite text of a statement: its queries_sqlite.py version, if any, with SQLite placeholders.
+
+    Statements built by appending to a queries.py constant (e.g. + " LIMIT %s")
+    are translated by that prefix.
+    """
+    text = _DIALECT.get(statement)
+    if text is None:
+        text = statement
+        for original, replacement in _DIALECT.items():
+            if statement.startswith(original):
+                text = replacement + statement[len(original):]
+                break
+    return _PLACEHOLDER.sub(_placeholder, text)
+
+def _json_default(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"Cannot pass {type(value).__name__} to SQLite")
+
+def _adapt(value):
+    if isinstance(value, (list, tuple)):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+def adapt_params(params):
+    """psycopg2-style parameters (a sequence or a dict) as sqlite3 takes them."""
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return {key: _adapt(value) for key, value in params.items()}
+    return [_adapt(value) for value in params]
+
+class Cursor:
+    """DB-API cursor over a sqlite3 cursor that takes the backend's PostgreSQL statements."""
+
+    def __init__(self, cur, timed=False, converters=None):
+        self._cur = cur
+        self._timed = timed
+        self._converters = converters or {}
+        self._description = self._row_converters = None     # of the last statement
+
+    def _describe(self):
+        """Result columns with "name [type]" tags removed, and the converter of each."""
+        description, converters = [], []
+        for column in self._cur.description or ():
+            name, tag = _COLUMN_TAG.match(column[0]).groups()
+            description.append((name,) + tuple(column[1:]))
+            converters.append(CONVERTERS.get(tag.upper()) if tag else self._converters.get(name))
+        self._description, self._row_converters = description, converters
+
+    def _convert(self, row):
+        if row is None:
+            return None
+        if self._row_converters is None:
+            self._describe()
+        if not any(self._row_converters):
+            return row
+        return tuple(
+            value if convert is None or value is None else convert(value)
+            for convert, value in zip(self._row_converters, row)
+        )
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        if self._cur.description is None:
+            return None
+        if self._description is None:
+            self._describe()
+        return self._description
+
+    def execute(self, query, params=None):
+        self._description = self._row_converters = None
+        if not self._timed:
+            self._cur.execute(translate(query), adapt_params(params))
+            return
+        started = time.perf_counter()
+        try:
+            self._cur.execute(translate(query), adapt_params(params))
+        except Exception:
+            instrumentation.default_recorder.record_statement(self, query, params, time.perf_counter() - started, True)
+            raise
+        instrumentation.default_recorder.record_statement(self, query, params, time.perf_counter() - started, False)
+
+    def executemany(self, query, params_list):
+        self._description = self._row_converters = None
+        started = time.perf_counter()
+        try:
+            self._cur.executemany(translate(query), [adapt_params(params) for params in params_list])
+        except Exception:
+            if self._timed:
+                instrumentation.default_recorder.record_statement(self, query, None, time.perf_counter() - started, True)
+            raise
+        if self._timed:
+            instrumentation.default_recorder.record_statement(self, query, None, time.perf_counter() - started, False)
+
+    def explain_plan(self, query, params):
+        """The query plan of a statement, for the slow-query log."""
+        try:
+            rows = self._cur.connection.execute(
+                "EXPLAIN QUERY PLAN " + translate(query), adapt_params(params)
+            ).fetchall()
+        except sqlite3.Error as e:
+            return f"(EXPLAIN failed: {e})"
+        return "\n".join(detail for _, _, _, detail in rows)
+
+    def fetchone(self):
+        return self._convert(self._cur.fetchone())
+
+    def fetchmany(self, size=None):
+        return [self._convert(row) for row in self._cur.fetchmany(size or self._cur.arraysize)]
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cur.fetchall()]
+
+    def __iter__(self):
+        return (self._convert(row) for row in self._cur)
+
+    def close(self):
+        self._cur.close()
+
+class SQLiteStorage:
+    """A bounded pool of connections to one SQLite database file, shared by all threads."""
+
+    def __init__(self, path, busy_timeout=5.0, max_connections=8, max_overflow=4):
+        if max_connections < 1 or max_overflow < 0:
+            raise ValueError("expected max_connections >= 1 and max_overflow >= 0")
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.max_connections = max_connections
+        self.max_overflow = max_overflow
+        self._converters = None     # column_converters() of the current schema
+        self._local = threading.local()     # connections the current thread holds
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._idle = []
+        self._size = 0      # open connections + connections being opened
+        self._overflow = 0  # of those, borrowed by nested transactions beyond max_connections
+        self._closed = False
+        self._stats = {
+            "connections_created": 0, "transactions": 0, "read_transactions": 0, "rollbacks": 0,
+            "borrow_timeouts": 0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        # In WAL mode a commit survives a crash of the process; only a power cut
+        # can lose the last transactions.
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        for name, args, func in FUNCTIONS:
+            conn.create_function(name, args, func, deterministic=True)
+        return conn
+
+    @contextmanager
+    def _borrow(self):
+        # A thread may open a transaction while its own is still open (e.g. a
+        # read inside a write), so it borrows a second connection for it. That
+        # one may take one of max_overflow connections beyond max_connections:
+        # waiting for a regular one could deadlock with threads holding the
+        # others while they wait for this thread's write.
+        nested = getattr(self._local, "held", 0) > 0
+        deadline = time.monotonic() + self.busy_timeout
+        conn = None
+        overflow = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("The SQLite storage is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_connections:
+                    self._size += 1
+                    break
+                if nested and self._overflow < self.max_overflow:
+                    self._size += 1
+                    self._overflow += 1
+                    overflow = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["borrow_timeouts"] += 1
+                    raise sqlite3.OperationalError(
+                        f"no SQLite connection free within {self.busy_timeout:.1f}s ({self._size} in use)"
+                    )
+                self._cond.wait(remaining)
+        if conn is None:
+            try:
+                conn = self._connect()
+            except BaseException:
+                with self._cond:
+                    self._size -= 1
+                    self._overflow -= overflow
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["connections_created"] += 1
+        self._local.held = getattr(self._local, "held", 0) + 1
+        try:
+            yield conn
+        finally:
+            self._local.held -= 1
+            # Never hand on a connection still inside a transaction (a failed COMMIT).
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            with self._cond:
+                discard = self._closed or overflow
+                if discard:
+                    self._size -= 1
+                    self._overflow -= overflow
+                else:
+                    self._idle.append(conn)
+                self._cond.notify()
+            if discard:
+                conn.close()
+
+    @contextmanager
+    def transaction(self, read_only=False, timed=False):
+        """Yields a Cursor inside one transaction: committed on exit, rolled back if the block raises.
+
+        Read-only transactions read one snapshot and never wait for writers.
+        """
+        with self._borrow() as conn:
+            conn.execute("BEGIN" if read_only else "BEGIN IMMEDIATE")
+            with self._lock:
+                self._stats["read_transactions" if read_only else "transactions"] += 1
+            converters = self._converters
+            if converters is None:
+                converters = self._converters = column_converters(conn)
+            try:
+                yield Cursor(conn.cursor(), timed, converters)
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                with self._lock:
+                    self._stats["rollbacks"] += 1
+                raise
+            conn.execute("COMMIT")
+
+    def migrate(self):
+        """Applies pending migrations/sqlite/*.sql files in one transaction; returns [(version, name), ...]."""
+        with self._borrow() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, "
+                    "name VARCHAR(255) NOT NULL, applied_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+                )
+                done = {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+                applied = []
+                for version, name, sql_text in migrations.load_migrations(MIGRATIONS_DIR):
+                    if version in done:
+                        continue
+                    for statement in split_statements(sql_text):
+                        conn.execute(statement)
+                    conn.execute(
+                        "INSERT INTO schema_version (version, name) VALUES (?, ?) ON CONFLICT (version) DO NOTHING",
+                        (version, name)
+                    )
+                    applied.append((version, name))
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        self._converters = None     # the schema may have changed
+        return applied
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats, path=self.path, connections=self._size, idle=len(self._idle),
+                in_use=self._size - len(self._idle), max_connections=self.max_connections,
+                overflow=self._overflow,
+            )
+
+    def close(self):
+        """Closes every connection, those in use once they come back; the storage cannot be used afterwards."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close()
+
+def split_statements(sql_text):
+    """Splits a script into statements (sqlite3 runs one at a time), keeping trigger bodies whole."""
+    statements, current = [], ""
+    for line in sql_text.splitlines(keepends=True):
+        if not current and (not line.strip() or line.lstrip().startswith("--")):
+            continue
+        current += line
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    if current.strip():
+        raise ValueError(f"Incomplete SQL statement at the end of the script: {current.strip()[:80]!r}")
+    return statements
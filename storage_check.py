@@ -0,0 +1,361 @@
+# storage_check.py
+
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+import analytics
+import backend
+import benchmark
+import datagen
+import query_cache
+import rollups
+
+# Checks that the storage engines (backend.STORAGE_CONFIG) behave the same, and
+# compares their speed. `check` runs one conformance suite against a fresh,
+# empty database of each engine: the same backend calls with the same expected
+# results, so a query that only one engine gets right shows up here. `bench`
+# loads the same synthetic dataset into each engine and times startup and the
+# backend functions of benchmark.py side by side.
+#
+#   python storage_check.py check
+#   python storage_check.py check --engines sqlite
+#   python storage_check.py bench --users 500 --calls 200 --output storage.json
+#
+# PostgreSQL runs in its own schemas (storage_check, storage_bench) and SQLite
+# in a temporary file, so neither touches the application's data.
+
+ENGINES = backend.STORAGE_ENGINES
+CHECK_SCHEMA = "storage_check"
+BENCH_SCHEMA = "storage_bench"
+
+def use_fresh_database(engine, name, directory):
+    """Points the backend at an empty, migrated database of `engine`."""
+    if engine == "sqlite":
+        backend.use_storage("sqlite", sqlite_path=os.path.join(directory, f"{name}.db"))
+        backend.initialize_database()
+    else:
+        backend.use_storage("postgres")
+        datagen.prepare_schema(name, drop=True)
+
+def reopen(engine, name, directory):
+    """Closes every connection and points the backend at the existing database again."""
+    if engine == "sqlite":
+        backend.use_storage("sqlite", sqlite_path=os.path.join(directory, f"{name}.db"))
+    else:
+        backend.use_storage("postgres")
+        backend.use_schema(name)
+
+# --- Conformance ---
+def _expect(problems, description, actual, expected):
+    if actual != expected:
+        problems.append(f"{description}: got {actual!r}, expected {expected!r}")
+
+def _raises_database_error(func, *args):
+    try:
+        func(*args)
+    except backend.DATABASE_ERRORS:
+        return True
+    return False
+
+def conformance_problems():
+    """Runs the conformance checks against the current, empty database; returns a list of problems.
+
+    Checks run in order and later ones see earlier writes.
+    """
+    problems = []
+    expect = lambda description, actual, expected: _expect(problems, description, actual, expected)
+    today = datetime.date.today()
+    day = lambda n: today - datetime.timedelta(days=today.weekday()) + datetime.timedelta(days=n)
+
+    backend.seed_data()
+    expect("profile", backend.get_user_profile(1), ("Alice", "alice@email.com", Decimal("60.50")))
+    expect("missing profile", backend.get_user_profile(99), None)
+    expect("all users", backend.get_all_users(1), [(2, "Bob"), (3, "Charlie"), (4, "Diana")])
+    expect("friends", backend.get_friends(1), [(2, "Bob"), (4, "Diana")])
+    expect("leaderboard", backend.get_leaderboard(), [(1, "Alice", 115), (2, "Bob", 75), (4, "Diana", 45)])
+    expect("friends leaderboard", backend.get_friends_leaderboard(1), {
+        "rank": 1, "members": 3, "around": [],
+        "top": [(1, 1, "Alice", 115), (2, 2, "Bob", 75), (3, 4, "Diana", 45)],
+    })
+    expect("statistics", backend.get_workout_statistics(1),
+           {"total_workouts": 2, "total_duration": 115, "avg_duration": Decimal("57.50")})
+    expect("statistics without workouts", backend.get_workout_statistics(3),
+           {"total_workouts": 0, "total_duration": 0, "avg_duration": Decimal("0.00")})
+    expect("personal records", backend.get_personal_records(1), [
+        ("Bench Press", Decimal("52.50"), Decimal("1890.00"), Decimal("73.50")),
+        ("Deadlift", Decimal("100.00"), Decimal("1800.00"), Decimal("120.00")),
+        ("Squat", Decimal("80.00"), Decimal("2560.00"), Decimal("101.33")),
+    ])
+
+    # History, newest first, one workout per page
+    page, cursor = backend.get_workout_history_page(1, 1)
+    expect("history page 1", (page, cursor), (
+        [(4, day(3), 55, [("Bench Press", 3, 12, Decimal("52.50")), ("Deadlift", 3, 6, Decimal("100.00"))])],
+        (day(3), 4),
+    ))
+    expect("history page 2", backend.get_workout_history_page(1, 1, cursor), (
+        [(1, day(1), 60, [("Bench Press", 3, 10, Decimal("50.00")), ("Squat", 4, 8, Decimal("80.00"))])],
+        None,
+    ))
+    expect("duration series", backend.get_duration_series(1), [(day(0), 115)])
+    expect("user workouts", backend.get_user_workouts(2), [(2, day(0), 75)])
+
+    # Exercise names resolve through the catalog and its aliases
+    expect("catalog size", len(backend.get_exercise_catalog()), 19)
+    expect("alias", backend.get_exercise_aliases().get("bench"), "Bench Press")
+    backend.log_workout(3, day(2), 30, [
+        {"name": "  leg   PRESS ", "sets": 3, "reps": 10, "weight": 100.0},
+        {"name": "Farmer Walk", "sets": 2, "reps": 1, "weight": None},
+    ])
+    expect("logged workout", backend.get_workout_details(5),
+           [("Leg Press", 3, 10, Decimal("100.00")), ("Farmer Walk", 2, 1, None)])
+    expect("catalog after a new name", len(backend.get_exercise_catalog()), 20)
+    expect("records of a new workout", backend.get_personal_records(3), [
+        ("Farmer Walk", Decimal("0.00"), Decimal("0.00"), Decimal("0.00")),
+        ("Leg Press", Decimal("100.00"), Decimal("3000.00"), Decimal("133.33")),
+    ])
+
+    # An idempotency key is written once
+    workout = [{"name": "bench", "sets": 3, "reps": 5, "weight": 70}]
+    expect("first log with a key", backend.log_workout(2, day(4), 20, workout, idempotency_key="storage-check"),
+           backend.WORKOUT_WRITTEN)
+    expect("second log with a key", backend.log_workout(2, day(4), 20, workout, idempotency_key="storage-check"),
+           backend.WORKOUT_DUPLICATE)
+    expect("idempotent log", backend.get_workout_statistics(2),
+           {"total_workouts": 2, "total_duration": 95, "avg_duration": Decimal("47.50")})
+    expect("batch with a written key", backend.write_workout_batch([
+        backend.workout_entry(2, day(4), 20, workout, "storage-check"),
+        backend.workout_entry(2, day(5), 25, workout, "storage-check-2"),
+    ]), 1)
+    expect("keys kept for a day", backend.prune_idempotency_keys(1), 0)
+
+    # Friends and suggestions
+    backend.add_friend(3, 1)
+    expect("added friend", backend.get_friends(3), [(1, "Alice")])
+    expect("suggestions", backend.get_friend_suggestions(3), [(2, "Bob", 1), (4, "Diana", 1)])
+    backend.remove_friend(3, 1)
+    expect("removed friend", backend.get_friends(3), [])
+    expect("friend of a missing user", _raises_database_error(backend.add_friend, 1, 99), True)
+
+    # Search pages through prefix and substring matches, case-insensitively
+    with backend.transaction() as cur:
+        cur.executemany("INSERT INTO users (name, email, weight_kg) VALUES (%s, %s, %s)", [
+            (name, f"{name.lower()}@email.com", 70) for name in ("Dana", "Dane", "Dani", "dano", "Danu")
+        ])
+    results, cursor = backend.search_users(3, "DAN", 2)
+    pages = [results]
+    while cursor is not None:
+        results, cursor = backend.search_users(3, "DAN", 2, cursor)
+        pages.append(results)
+    expect("search pages", pages,
+           [[(5, "Dana"), (6, "Dane")], [(7, "Dani"), (8, "dano")], [(9, "Danu")]])
+    expect("search prefix", backend.search_users(1, "b"), ([], None))
+    expect("search prefix of a non-friend", backend.search_users(3, "b"), ([(2, "Bob")], None))
+    expect("search substring", backend.search_users(3, "ian"), ([(4, "Diana")], None))
+    expect("search wildcard", backend.search_users(3, "%"), ([], None))
+    expect("search underscore", backend.search_users(3, "d_n"), ([], None))
+
+    # Goals
+    backend.set_goal(1, "Workout 3 times a week", 3)
+    expect("active goal", backend.get_active_goal(1), ("Workout 3 times a week", 3))
+    progress = backend.get_goal_progress(1)
+    expect("goal progress", {key: progress[key] for key in ("workouts", "minutes", "remaining", "percent", "met")},
+           {"workouts": 2, "minutes": 115, "remaining": 1, "percent": 67, "met": False})
+
+    # Writes reach cached reads
+    backend.update_user_profile(1, "Alicia", "alice@email.com", 61.25)
+    expect("updated profile", backend.get_user_profile(1), ("Alicia", "alice@email.com", Decimal("61.25")))
+    expect("leaderboard after update", backend.get_leaderboard()[:2], [(2, "Bob", 120), (1, "Alicia", 115)])
+    expect("duplicate email", _raises_database_error(
+        backend.update_user_profile, 2, "Bob", "alice@email.com", 85), True)
+    expect("profile after a failed update", backend.get_user_profile(2), ("Bob", "bob@email.com", Decimal("85.00")))
+
+    # A transaction that raises leaves nothing behind
+    try:
+        with backend.transaction() as cur:
+            cur.execute("INSERT INTO users (name, email, weight_kg) VALUES (%s, %s, %s)", ("Eve", "eve@email.com", 60))
+            raise RuntimeError("roll back")
+    except RuntimeError:
+        pass
+    expect("rolled back insert", len(backend.get_all_users(0)), 9)
+
+    query_cache.clear()
+    calls = ((backend.get_user_profile, 1), (backend.get_leaderboard,), (backend.get_friends, 1),
+             (backend.get_workout_statistics, 1), (backend.get_personal_records, 2))
+    expect("prefetch", backend.prefetch(*calls), [func.uncached(*args) for func, *args in calls])
+
+    frame = analytics.training_series(1)
+    expect("training series", (int(frame["workouts"].sum()), int(frame["minutes"].sum())), (2, 115))
+
+    # Deleting a user cascades to workouts, exercises and the rollups
+    with backend.transaction() as cur:
+        cur.execute("DELETE FROM users WHERE user_id = %s", (3,))
+    query_cache.clear()
+    expect("deleted user's records", backend.get_personal_records(3), [])
+    expect("weekly activity rollup", rollups.check_weekly_activity(), [])
+    expect("personal records rollup", rollups.check_personal_records(), [])
+    return problems
+
+def check(engines, directory):
+    """Runs the conformance suite on each engine; returns {engine: problems}."""
+    results = {}
+    for engine in engines:
+        use_fresh_database(engine, CHECK_SCHEMA, directory)
+        try:
+            results[engine] = conformance_problems()
+        except Exception as e:
+            results[engine] = [f"raised {type(e).__name__}: {e}"]
+    return results
+
+# --- Benchmark ---
+def load_dataset(users, workouts_per_user, seed, years=1):
+    """Loads a synthetic dataset through backend functions and portable SQL, the same on every engine."""
+    rng = random.Random(seed)
+    names = list(datagen.EXERCISES)
+    with backend.transaction() as cur:
+        cur.executemany("INSERT INTO users (name, email, weight_kg) VALUES (%s, %s, %s)", [
+            (f"{rng.choice(datagen.FIRST_NAMES)} {rng.choice(datagen.LAST_NAMES)}", f"user{i}@example.com",
+             round(rng.uniform(50, 110), 1))
+            for i in range(users)
+        ])
+        cur.execute("SELECT user_id FROM users ORDER BY user_id")
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.executemany(
+            "INSERT INTO friends (user_id, friend_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+            [(user_id, rng.choice(user_ids)) for user_id in user_ids for _ in range(5)]
+        )
+    today = datetime.date.today()
+    entries = [
+        backend.workout_entry(user_id, today - datetime.timedelta(days=rng.randrange(int(365 * years))),
+                              rng.randint(20, 90), [
+                                  {"name": name, "sets": 3, "reps": rng.randint(3, 12),
+                                   "weight": round(rng.uniform(20, 120), 1)}
+                                  for name in rng.sample(names, 3)
+                              ])
+        for user_id in user_ids for _ in range(workouts_per_user)
+    ]
+    for i in range(0, len(entries), 500):
+        backend.write_workout_batch(entries[i:i + 500])
+    for user_id in user_ids[::2]:
+        backend.set_goal(user_id, "Workout 3 times a week", 3)
+
+def load_samples(rng, n=500):
+    """Like benchmark.load_samples(), in SQL both engines run."""
+    with backend.transaction() as cur:
+        cur.execute("SELECT user_id, name, email, weight_kg FROM users ORDER BY user_id")
+        users = cur.fetchall()
+        cur.execute("SELECT workout_id, user_id, workout_date FROM workouts ORDER BY workout_id")
+        workouts = cur.fetchall()
+    return {"users": [rng.choice(users) for _ in range(n)], "workouts": [rng.choice(workouts) for _ in range(n)]}
+
+def time_startup(engine, directory, repeats):
+    """Median ms from closed connections to the first answered read, schema check included."""
+    timings = []
+    for _ in range(repeats):
+        reopen(engine, BENCH_SCHEMA, directory)
+        started = time.perf_counter()
+        backend.initialize_database()
+        backend.get_user_profile(1)
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+def bench(engines, directory, users, workouts_per_user, calls, concurrency, seed, operations):
+    """Times each engine on the same dataset; returns {engine: {"create_ms", "load_seconds", "startup_ms", "results"}}."""
+    report = {}
+    cache_enabled = query_cache.default_cache.enabled
+    query_cache.default_cache.enabled = False
+    try:
+        for engine in engines:
+            started = time.perf_counter()
+            use_fresh_database(engine, BENCH_SCHEMA, directory)
+            create_ms = round((time.perf_counter() - started) * 1000, 3)
+            print(f"Loading {users} users into {engine} ...")
+            started = time.perf_counter()
+            load_dataset(users, workouts_per_user, seed)
+            load_seconds = round(time.perf_counter() - started, 3)
+            entry = report[engine] = {
+                "create_ms": create_ms,
+                "load_seconds": load_seconds,
+                "startup_ms": time_startup(engine, directory, 5),
+                "results": {},
+            }
+            samples = load_samples(random.Random(f"{seed}:samples"))
+            for name, func, make_args, _ in operations:
+                benchmark.run_operation(func, make_args, samples, 10, 1, f"{seed}:warmup:{name}")
+                entry["results"][name] = benchmark.run_operation(
+                    func, make_args, samples, calls, concurrency, f"{seed}:{name}"
+                )
+    finally:
+        query_cache.default_cache.enabled = cache_enabled
+    return report
+
+def print_report(report):
+    engines = list(report)
+    print(f"{'':<34}" + "".join(f"{engine:>24}" for engine in engines))
+    for label, key in (("new database (ms)", "create_ms"), ("dataset load (s)", "load_seconds"),
+                       ("startup to first read (ms)", "startup_ms")):
+        print(f"{label:<34}" + "".join(f"{report[engine][key]:>24}" for engine in engines))
+    print(f"{'p50 / p95 ms':<34}" + "".join(f"{'':>24}" for _ in engines))
+    for name in report[engines[0]]["results"]:
+        cells = []
+        for engine in engines:
+            result = report[engine]["results"][name]
+            errors = f" ({result['errors']} errors)" if result["errors"] else ""
+            cells.append(f"{result['p50_ms']} / {result['p95_ms']}{errors}")
+        print(f"{name:<34}" + "".join(f"{cell:>24}" for cell in cells))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Check and compare the storage engines.")
+    parser.add_argument("command", choices=("check", "bench"))
+    parser.add_argument("--engines", default=",".join(ENGINES), help="comma-separated engines to run")
+    parser.add_argument("--users", type=int, default=200, help="bench: users in the dataset")
+    parser.add_argument("--workouts-per-user", type=int, default=20, help="bench")
+    parser.add_argument("--calls", type=int, default=100, help="bench: timed calls per function")
+    parser.add_argument("--concurrency", type=int, default=1, help="bench: threads making the calls")
+    parser.add_argument("--only", help="bench: comma-separated substrings; time only matching functions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="bench: also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    engines = args.engines.split(",")
+    unknown = [engine for engine in engines if engine not in ENGINES]
+    if unknown:
+        parser.error(f"unknown engines {unknown}, expected some of {list(ENGINES)}")
+    saved = dict(backend.STORAGE_CONFIG)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            if args.command == "check":
+                failed = 0
+                for engine, problems in check(engines, directory).items():
+                    for problem in problems:
+                        print(f"{engine}: {problem}")
+                    print(f"{engine}: {'conforms' if not problems else f'{len(problems)} problems'}")
+                    failed += bool(problems)
+                return 1 if failed else 0
+            operations = [
+                op for op in benchmark.OPERATIONS
+                if not args.only or any(part in op[0] for part in args.only.split(","))
+            ]
+            report = bench(engines, directory, args.users, args.workouts_per_user, args.calls,
+                           args.concurrency, args.seed, operations)
+        finally:
+            backend.use_schema(None)
+            backend.use_storage(saved.pop("engine"), **saved)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Wrote {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
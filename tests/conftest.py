@@ -0,0 +1,54 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+from psycopg2.extensions import parse_dsn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend
+
+# Most tests run on the embedded SQLite engine in a temporary file. Those that
+# need PostgreSQL (the pool, export and import) run against the database in
+# FITNESS_TEST_DSN, a libpq connection string, and are skipped without it:
+#
+#   FITNESS_TEST_DSN="dbname=fitness_test user=postgres host=localhost" python -m pytest tests
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    """The backend on an empty, migrated SQLite database with the sample users and workouts."""
+    saved = dict(backend.STORAGE_CONFIG)
+    backend.use_storage("sqlite", sqlite_path=str(tmp_path / "fitness.db"))
+    backend.initialize_database()
+    backend.seed_data()
+    yield backend
+    backend.use_storage(saved.pop("engine"), **saved)
+
+@pytest.fixture
+def postgres_config():
+    """Connection parameters of the test PostgreSQL database."""
+    dsn = os.environ.get("FITNESS_TEST_DSN")
+    if not dsn:
+        pytest.skip("FITNESS_TEST_DSN is not set")
+    return parse_dsn(dsn)
+
+@pytest.fixture
+def postgres_backend(postgres_config):
+    """The backend on a fresh, migrated `pytest` schema of the test database."""
+    import datagen
+
+    saved_config, saved_storage = dict(backend.DB_CONFIG), dict(backend.STORAGE_CONFIG)
+    backend.DB_CONFIG.clear()
+    backend.DB_CONFIG.update(postgres_config)
+    backend.use_storage("postgres")
+    datagen.prepare_schema("pytest", drop=True)
+    yield backend
+    backend.use_schema(None)
+    with backend.transaction() as cur:
+        cur.execute("DROP SCHEMA IF EXISTS pytest CASCADE")
+    backend.close_pool()
+    backend.DB_CONFIG.clear()
+    backend.DB_CONFIG.update(saved_config)
+    backend.use_storage(saved_storage.pop("engine"), **saved_storage)
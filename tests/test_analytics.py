@@ -0,0 +1,92 @@
+# tests/test_analytics.py
+
+import datetime
+
+import pandas as pd
+import pytest
+
+import analytics
+
+MONDAY = datetime.date(2025, 6, 2)
+
+@pytest.fixture
+def history(sqlite_backend):
+    """User 3 with one squat workout in each of four consecutive weeks, and an empty analytics cache."""
+    be = sqlite_backend
+    for week in range(4):
+        date = MONDAY + datetime.timedelta(weeks=week)
+        be.log_workout(3, date, 30 + week, [{"name": "Squat", "sets": 3, "reps": 5, "weight": 80 + 5 * week}])
+    analytics.default_cache.clear()
+    yield be
+    analytics.default_cache.clear()
+
+def counting(fetch, calls):
+    def wrapper(user_id, granularity, periods):
+        calls.append(periods)
+        return fetch(user_id, granularity, periods)
+    return wrapper
+
+def recomputed(user_id, granularity):
+    """Totals and top sets loaded from scratch."""
+    return analytics.PeriodCache().get(user_id, granularity, analytics._fetch_periods)
+
+def test_write_recomputes_only_its_period(history):
+    be = history
+    cache, calls = analytics.PeriodCache(), []
+    fetch = counting(analytics._fetch_periods, calls)
+    cache.get(3, "week", fetch)
+    cache.get(3, "week", fetch)
+    assert calls == [None]
+    assert cache.stats["full_loads"] == 1 and cache.stats["hits"] == 1
+
+    date = MONDAY + datetime.timedelta(weeks=1, days=2)
+    be.log_workout(3, date, 50, [{"name": "Squat", "sets": 1, "reps": 1, "weight": 120}])
+    cache.mark_dirty(3, [date])
+    totals, top_sets = cache.get(3, "week", fetch)
+
+    assert calls == [None, [MONDAY + datetime.timedelta(weeks=1)]]
+    assert cache.stats["partial_loads"] == 1 and cache.stats["periods_recomputed"] == 1
+    expected_totals, expected_top_sets = recomputed(3, "week")
+    pd.testing.assert_frame_equal(totals, expected_totals)
+    pd.testing.assert_frame_equal(top_sets.reset_index(drop=True), expected_top_sets.reset_index(drop=True))
+    assert totals["workouts"].tolist() == [1, 2, 1, 1]
+
+def test_other_users_and_granularities_stay_cached(history):
+    cache, calls = analytics.PeriodCache(), []
+    fetch = counting(analytics._fetch_periods, calls)
+    cache.get(3, "week", fetch)
+    cache.get(3, "month", fetch)
+    cache.mark_dirty(1, [MONDAY])
+    cache.get(3, "week", fetch)
+    assert calls == [None, None]
+
+    cache.mark_dirty(3, [MONDAY])
+    cache.get(3, "month", fetch)
+    assert calls == [None, None, [datetime.date(2025, 6, 1)]]
+
+def test_unknown_dates_and_failures_force_full_reload(history):
+    cache, calls = analytics.PeriodCache(), []
+    fetch = counting(analytics._fetch_periods, calls)
+    cache.get(3, "week", fetch)
+    cache.mark_dirty(3, None)
+    cache.get(3, "week", fetch)
+    assert calls == [None, None]
+
+    def failing(user_id, granularity, periods):
+        raise RuntimeError("database went away")
+
+    cache.mark_dirty(3, [MONDAY])
+    with pytest.raises(RuntimeError):
+        cache.get(3, "week", failing)
+    cache.get(3, "week", fetch)
+    assert calls == [None, None, None]
+
+def test_backend_writes_mark_the_default_cache(history):
+    be = history
+    before = analytics.training_series(3)
+    stats = dict(analytics.cache_stats())
+    be.log_workout(3, MONDAY + datetime.timedelta(weeks=3, days=1), 20, [])
+    after = analytics.training_series(3)
+    assert analytics.cache_stats()["partial_loads"] == stats["partial_loads"] + 1
+    assert after["workouts"].sum() == before["workouts"].sum() + 1
+    assert after["minutes"].iloc[-1] == before["minutes"].iloc[-1] + 20
@@ -0,0 +1,67 @@
+# tests/test_db_pool.py
+
+import threading
+
+import psycopg2
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeout
+
+@pytest.fixture
+def pool(postgres_config):
+    pool = ConnectionPool(postgres_config, minconn=0, maxconn=1, timeout=0.2, check_after=0)
+    yield pool
+    pool.closeall()
+
+def test_borrow_times_out_when_exhausted(pool):
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats["borrow_timeouts"] == 1
+    assert stats["in_use"] == 1 and stats["size"] == 1
+    pool.putconn(conn)
+
+    # The returned connection is reused, not replaced.
+    assert pool.getconn() is conn
+    assert pool.stats()["connections_created"] == 1
+    pool.putconn(conn)
+
+def test_waiting_borrower_gets_returned_connection(pool):
+    conn = pool.getconn()
+    borrowed = []
+    waiter = threading.Thread(target=lambda: borrowed.append(pool.getconn(timeout=5.0)))
+    waiter.start()
+    pool.putconn(conn)
+    waiter.join(5.0)
+    assert borrowed == [conn]
+    pool.putconn(conn)
+
+def test_timeout_argument_overrides_default(pool):
+    with pool.connection():
+        with pytest.raises(PoolTimeout):
+            pool.getconn(timeout=0)
+
+def test_broken_connection_frees_its_slot(pool):
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            conn.close()
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+    assert pool.stats()["size"] == 0
+    with pool.connection() as fresh:
+        assert fresh is not conn and not fresh.closed
+
+def test_transaction_rolls_back_and_returns_connection(pool):
+    with pytest.raises(ZeroDivisionError):
+        with pool.transaction() as cur:
+            cur.execute("CREATE TEMPORARY TABLE pool_test (x int)")
+            1 / 0
+    with pool.transaction() as cur:
+        cur.execute("SELECT to_regclass('pool_test')")
+        assert cur.fetchone() == (None,)
+    assert pool.stats()["in_use"] == 0
+
+def test_closed_pool_refuses_borrows(pool):
+    pool.closeall()
+    with pytest.raises(psycopg2.pool.PoolError):
+        pool.getconn()
@@ -0,0 +1,53 @@
+# tests/test_export_import.py
+
+import csv
+import json
+
+import pytest
+
+import export
+import importer
+
+def read_export(path, fmt):
+    """Exported rows as dicts, with workout_ref replaced by the workout's position in the file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [
+                dict(workout, **exercise)
+                for workout in map(json.loads, f)
+                for exercise in workout.pop("exercises") or [{}]
+            ]
+    refs = {}
+    for row in rows:
+        row["workout_ref"] = refs.setdefault(row["workout_ref"], len(refs))
+    return rows
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_export_import_round_trip(postgres_backend, tmp_path, fmt):
+    be = postgres_backend
+    be.seed_data()
+    be.log_workout(2, "2025-09-03", 30, [])     # a workout without exercises
+    first, second = tmp_path / f"first.{fmt}", tmp_path / f"second.{fmt}"
+
+    exported = export.export_history(str(first))
+    with be.transaction() as cur:
+        cur.execute("TRUNCATE workouts, exercises CASCADE")
+    imported = importer.import_workout_history(str(first), chunk_size=3)
+    export.export_history(str(second))
+
+    assert (imported["workouts"], imported["exercises"]) == (exported["workouts"], exported["exercises"])
+    assert read_export(second, fmt) == read_export(first, fmt)
+
+def test_export_one_user_between_dates(postgres_backend, tmp_path):
+    be = postgres_backend
+    be.seed_data()
+    squat = [{"name": "Squat", "sets": 3, "reps": 5, "weight": 90}]
+    for date in ("2025-08-19", "2025-08-21", "2025-08-25"):
+        be.log_workout(3, date, 40, squat)
+    path = tmp_path / "charlie.csv"
+    report = export.export_history(str(path), user_id=3, start_date="2025-08-20", end_date="2025-08-24")
+    rows = read_export(path, "csv")
+    assert (report["workouts"], report["exercises"]) == (1, 1)
+    assert [(row["user_id"], row["workout_date"], row["exercise_name"]) for row in rows] == [("3", "2025-08-21", "Squat")]
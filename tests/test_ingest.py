@@ -0,0 +1,94 @@
+# tests/test_ingest.py
+
+import json
+import time
+
+import ingest
+
+WORKOUT = {"user_id": 1, "workout_date": "2025-09-01", "duration": 40,
+           "exercises": [{"name": "Squat", "sets": 3, "reps": 5, "weight": 100.0}]}
+
+def entry(key, **changes):
+    return dict(WORKOUT, key=key, **changes)
+
+def count_workouts(be, user_id=1):
+    with be.transaction() as cur:
+        cur.execute("SELECT count(*) FROM workouts WHERE user_id = %s", (user_id,))
+        return cur.fetchone()[0]
+
+def test_batch_skips_claimed_keys(sqlite_backend):
+    be = sqlite_backend
+    before = count_workouts(be)
+    assert be.write_workout_batch([entry("a"), entry("b")]) == 0
+    assert be.write_workout_batch([entry("b"), entry("c")]) == 1
+    assert count_workouts(be) == before + 3
+
+def test_log_workout_with_key_is_written_once(sqlite_backend):
+    be = sqlite_backend
+    before = count_workouts(be)
+    exercises = [{"name": "Bench Press", "sets": 3, "reps": 8, "weight": 60}]
+    assert be.log_workout(1, "2025-09-02", 45, exercises, idempotency_key="retry-me") == be.WORKOUT_WRITTEN
+    assert be.log_workout(1, "2025-09-02", 45, exercises, idempotency_key="retry-me") == be.WORKOUT_DUPLICATE
+    assert count_workouts(be) == before + 1
+
+def test_queue_recovers_journal_after_crash(sqlite_backend, tmp_path):
+    be = sqlite_backend
+    before = count_workouts(be)
+    # The process died after writing "written" but before recording it as
+    # done, with "queued" never written and an append cut short.
+    be.write_workout_batch([entry("written")])
+    journal = tmp_path / "workouts.journal"
+    journal.write_text(
+        json.dumps({"add": entry("written", queued_at=time.time())}) + "\n"
+        + json.dumps({"add": entry("queued", duration=50, queued_at=time.time())}) + "\n"
+        + '{"add": {"key": "torn", "user_',
+        encoding="utf-8",
+    )
+
+    queue = ingest.IngestQueue(str(journal), write=be.write_workout_batch, fsync=False).start()
+    try:
+        assert queue.wait(5.0)
+        stats = queue.stats()
+    finally:
+        queue.stop()
+
+    assert stats["recovered"] == 2 and stats["corrupt_records"] == 1
+    assert stats["written"] == 1 and stats["already_written"] == 1
+    assert count_workouts(be) == before + 2
+    assert read_journal_keys(journal) == []
+
+def test_queue_journals_entries_until_written(sqlite_backend, tmp_path):
+    be = sqlite_backend
+    journal = tmp_path / "workouts.journal"
+    queue = ingest.IngestQueue(str(journal), write=be.write_workout_batch, fsync=False).start()
+    try:
+        assert queue.submit(entry("k1"))
+        assert not queue.submit(entry("k1"))    # already queued
+        assert queue.wait(5.0)
+        assert queue.submit(entry("k1"))        # queued again, but its key is claimed
+        assert queue.wait(5.0)
+        stats = queue.stats()
+    finally:
+        queue.stop()
+    assert stats["duplicates"] == 1
+    assert stats["written"] == 1 and stats["already_written"] == 1
+    assert read_journal_keys(journal) == []
+
+def test_refused_entries_are_set_aside(sqlite_backend, tmp_path):
+    be = sqlite_backend
+    journal = tmp_path / "workouts.journal"
+    queue = ingest.IngestQueue(str(journal), write=be.write_workout_batch, fsync=False).start()
+    try:
+        queue.submit(entry("good"))
+        queue.submit(entry("unknown-user", user_id=999))
+        assert queue.wait(5.0)
+        stats = queue.stats()
+    finally:
+        queue.stop()
+    assert stats["written"] == 1 and stats["rejected"] == 1
+    rejected = [json.loads(line) for line in open(str(journal) + ".rejected", encoding="utf-8")]
+    assert [record["entry"]["key"] for record in rejected] == ["unknown-user"]
+
+def read_journal_keys(journal):
+    entries, _ = ingest.read_journal(str(journal))
+    return list(entries)